@@ -0,0 +1,59 @@
+// Copyright 2021 Canonical Ltd.
+// See LICENSE file for licensing details.
+
+// Round-robin TCP load balancer in front of the mongo-express workers.
+//
+// Connections, not sessions, are spread: mongo-express keeps the sessions in the memory of
+// each worker, so a form may be posted to another worker than the one that rendered it.
+// The proxy routes each session to one worker instead.
+//
+// Environment:
+//   BALANCER_PORT: port to listen on.
+//   BALANCER_BACKENDS: comma-separated list of the local worker ports.
+"use strict";
+
+const net = require("net");
+
+const port = parseInt(process.env.BALANCER_PORT, 10);
+const backends = process.env.BALANCER_BACKENDS.split(",").map((value) => parseInt(value, 10));
+let next = 0;
+
+function forward(client, connection, attempt) {
+  if (attempt >= backends.length) {
+    client.destroy();
+    return;
+  }
+  const backend = backends[next];
+  next = (next + 1) % backends.length;
+  const upstream = net.connect(backend, "127.0.0.1");
+  connection.upstream = upstream;
+  let connected = false;
+  upstream.once("connect", () => {
+    connected = true;
+    client.pipe(upstream);
+    upstream.pipe(client);
+    client.resume();
+  });
+  upstream.on("error", () => {
+    if (connected) {
+      client.destroy();
+    } else if (!client.destroyed) {
+      // The worker is down (e.g. being restarted): try the next one.
+      forward(client, connection, attempt + 1);
+    }
+  });
+}
+
+function balance(client) {
+  // Registered once per connection, whatever the worker it ends up on.
+  const connection = { upstream: null };
+  const close = () => connection.upstream && connection.upstream.destroy();
+  client.on("error", close);
+  client.on("close", close);
+  forward(client, connection, 0);
+}
+
+const server = net.createServer({ pauseOnConnect: true }, balance);
+server.listen(port, () => console.log(`balancing :${port} across ${backends.join(", ")}`));
+
+process.on("SIGTERM", () => server.close(() => process.exit(0)));
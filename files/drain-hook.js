@@ -0,0 +1,107 @@
+// Copyright 2021 Canonical Ltd.
+// See LICENSE file for licensing details.
+
+// Graceful drain of a mongo-express worker, preloaded with `node --require`.
+//
+// On SIGUSR2, the worker stops accepting connections, closes its idle keep-alive
+// connections, and those of the requests in flight once they are answered. Its state file
+// records how many requests are still in flight, so the charm restarts it once they are
+// done instead of cutting them.
+//
+// Environment:
+//   DRAIN_DIR: directory the drain state is written to.
+//   VCAP_APP_PORT: port of the worker, naming its state file.
+"use strict";
+
+const fs = require("fs");
+const http = require("http");
+const path = require("path");
+
+const directory = process.env.DRAIN_DIR;
+const file = path.join(directory, `worker-${process.env.VCAP_APP_PORT || process.pid}.json`);
+const servers = new Set();
+// Requests in flight per connection; idle keep-alive connections are at 0.
+const connections = new Map();
+const responses = new Set();
+let inflight = 0;
+let draining = false;
+
+function write() {
+  const data = JSON.stringify({ pid: process.pid, draining, inflight });
+  try {
+    fs.mkdirSync(directory, { recursive: true });
+    fs.writeFileSync(`${file}.tmp`, data);
+    fs.renameSync(`${file}.tmp`, file);
+  } catch (error) {
+    console.error(`cannot write the drain state: ${error.message}`);
+  }
+}
+
+function track(socket) {
+  connections.set(socket, 0);
+  socket.once("close", () => connections.delete(socket));
+}
+
+function serve(socket, response) {
+  inflight += 1;
+  responses.add(response);
+  connections.set(socket, (connections.get(socket) || 0) + 1);
+  if (draining) {
+    response.setHeader("Connection", "close");
+  }
+  let done = false;
+  const finish = () => {
+    if (done) {
+      return;
+    }
+    done = true;
+    inflight -= 1;
+    responses.delete(response);
+    const pending = (connections.get(socket) || 1) - 1;
+    connections.set(socket, pending);
+    if (draining) {
+      if (!pending) {
+        socket.end();
+      }
+      write();
+    }
+  };
+  response.once("finish", finish);
+  response.once("close", finish);
+}
+
+const emit = http.Server.prototype.emit;
+http.Server.prototype.emit = function (event, first, second) {
+  if (event === "listening") {
+    servers.add(this);
+  } else if (event === "connection") {
+    track(first);
+  } else if (event === "request") {
+    serve(first.socket, second);
+  }
+  return emit.apply(this, arguments);
+};
+
+process.on("SIGUSR2", () => {
+  if (!draining) {
+    draining = true;
+    console.log(`draining ${inflight} requests`);
+    for (const server of servers) {
+      server.close();
+    }
+    for (const response of responses) {
+      if (!response.headersSent) {
+        response.setHeader("Connection", "close");
+      }
+    }
+    for (const [socket, pending] of connections) {
+      if (!pending) {
+        socket.end();
+      }
+    }
+  }
+  write();
+});
+
+// Tell the charm this worker can be drained.
+write();
@@ -0,0 +1,140 @@
+// Copyright 2021 Canonical Ltd.
+// See LICENSE file for licensing details.
+
+// Prometheus exporter of the mongo-express unit.
+//
+// Serves, on /metrics, the request metrics written by the workers (metrics-hook.js),
+// summed across the workers, the counters of the log forwarder (log-forwarder.js), and the
+// charm metrics written to charm.prom by the charm.
+//
+// Environment:
+//   METRICS_PORT: port to listen on.
+//   METRICS_DIR: directory the worker and charm metrics are written to.
+//   LOG_STATS_PATH: file the log forwarder writes its counters to, if it runs.
+"use strict";
+
+const fs = require("fs");
+const http = require("http");
+const path = require("path");
+
+const port = parseInt(process.env.METRICS_PORT, 10);
+const directory = process.env.METRICS_DIR;
+const logStatsPath = process.env.LOG_STATS_PATH;
+// Workers that have not written their metrics for this long are gone.
+const STALE_MS = 30000;
+
+function readWorkers() {
+  let names = [];
+  try {
+    names = fs.readdirSync(directory);
+  } catch (error) {
+    return [];
+  }
+  const now = Date.now();
+  const workers = [];
+  for (const name of names.filter((name) => /^worker-.*\.json$/.test(name))) {
+    try {
+      const file = path.join(directory, name);
+      if (now - fs.statSync(file).mtimeMs <= STALE_MS) {
+        workers.push(JSON.parse(fs.readFileSync(file, "utf8")));
+      }
+    } catch (error) {
+      // Removed or being replaced: skipped until the next scrape.
+    }
+  }
+  return workers;
+}
+
+function header(name, type, help) {
+  return [`# HELP ${name} ${help}`, `# TYPE ${name} ${type}`];
+}
+
+function render(workers) {
+  const lines = header("mongo_express_workers_up", "gauge", "Workers reporting metrics.");
+  lines.push(`mongo_express_workers_up ${workers.length}`);
+  const requests = {};
+  for (const worker of workers) {
+    for (const [code, count] of Object.entries(worker.requests)) {
+      requests[code] = (requests[code] || 0) + count;
+    }
+  }
+  const name = "mongo_express_http_requests_total";
+  lines.push(...header(name, "counter", "Requests served, by status class."));
+  for (const code of Object.keys(requests).sort()) {
+    lines.push(`${name}{code="${code}"} ${requests[code]}`);
+  }
+  if (workers.length) {
+    const histogram = "mongo_express_http_request_duration_seconds";
+    lines.push(...header(histogram, "histogram", "Latency of the requests served."));
+    let cumulative = 0;
+    workers[0].bounds.forEach((bound, index) => {
+      cumulative += workers.reduce((total, worker) => total + worker.buckets[index], 0);
+      lines.push(`${histogram}_bucket{le="${bound}"} ${cumulative}`);
+    });
+    const count = workers.reduce((total, worker) => total + worker.count, 0);
+    const sum = workers.reduce((total, worker) => total + worker.sum, 0);
+    lines.push(`${histogram}_bucket{le="+Inf"} ${count}`);
+    lines.push(`${histogram}_sum ${sum}`);
+    lines.push(`${histogram}_count ${count}`);
+  }
+  const rss = "mongo_express_resident_memory_bytes";
+  lines.push(...header(rss, "gauge", "Resident memory of the workers."));
+  lines.push(`${rss} ${workers.reduce((total, worker) => total + worker.rss, 0)}`);
+  return lines.join("\n") + "\n";
+}
+
+function readLogStats() {
+  if (!logStatsPath) {
+    return null;
+  }
+  try {
+    return JSON.parse(fs.readFileSync(logStatsPath, "utf8"));
+  } catch (error) {
+    // Not written yet, or being replaced: skipped until the next scrape.
+    return null;
+  }
+}
+
+function renderLogStats(stats) {
+  if (!stats) {
+    return "";
+  }
+  const lines = [];
+  const name = "mongo_express_log_lines_total";
+  lines.push(...header(name, "counter", "Log lines read, sent to Loki and dropped."));
+  for (const state of ["read", "sent", "dropped"]) {
+    lines.push(`${name}{state="${state}"} ${stats[state] || 0}`);
+  }
+  const counters = [
+    ["mongo_express_log_batches_total", "counter", "Batches sent to Loki.", stats.batches],
+    ["mongo_express_log_push_failures_total", "counter", "Failed pushes to Loki.", stats.failures],
+    ["mongo_express_log_lines_buffered", "gauge", "Log lines waiting to be sent.", stats.buffered],
+  ];
+  for (const [metric, type, help, value] of counters) {
+    lines.push(...header(metric, type, help));
+    lines.push(`${metric} ${value || 0}`);
+  }
+  return lines.join("\n") + "\n";
+}
+
+function readCharmMetrics() {
+  try {
+    return fs.readFileSync(path.join(directory, "charm.prom"), "utf8");
+  } catch (error) {
+    return "";
+  }
+}
+
+const server = http.createServer((request, response) => {
+  if (request.url !== "/metrics") {
+    response.writeHead(404);
+    response.end();
+    return;
+  }
+  const body = render(readWorkers()) + renderLogStats(readLogStats()) + readCharmMetrics();
+  response.writeHead(200, { "Content-Type": "text/plain; version=0.0.4" });
+  response.end(body);
+});
+server.listen(port, () => console.log(`serving metrics on :${port}`));
+
+process.on("SIGTERM", () => server.close(() => process.exit(0)));
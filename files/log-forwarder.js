@@ -0,0 +1,230 @@
+// Copyright 2021 Canonical Ltd.
+// See LICENSE file for licensing details.
+
+// Forwarder of the mongo-express service logs to Loki.
+//
+// Follows the logs of the services through the Pebble API, and pushes them to the Loki
+// push API in gzip-compressed batches of up to LOG_BATCH_SIZE lines, at least every
+// LOG_FLUSH_INTERVAL_MS while lines are buffered. One batch is in flight at a time: lines
+// read meanwhile are buffered, up to LOG_BUFFER_SIZE, the oldest being dropped beyond.
+// Failed batches are retried with an exponential backoff. Pebble keeps the service output
+// in its own ring buffer, so mongo-express never waits on the forwarder.
+//
+// Environment:
+//   LOG_LOKI_URLS: JSON list of the Loki push API URLs; every batch goes to all of them.
+//   LOG_SERVICES: comma-separated services to follow.
+//   LOG_LABELS: JSON object of the labels of every stream, besides the service.
+//   LOG_BATCH_SIZE: maximum lines per batch.
+//   LOG_FLUSH_INTERVAL_MS: maximum time a line waits for a batch.
+//   LOG_BUFFER_SIZE: maximum lines buffered.
+//   LOG_STATS_PATH: file the counters are written to, after every batch.
+//   LOG_PEBBLE_SOCKET: Pebble API socket, /charm/container/pebble.socket by default.
+"use strict";
+
+const fs = require("fs");
+const http = require("http");
+const https = require("https");
+const path = require("path");
+const zlib = require("zlib");
+
+const urls = JSON.parse(process.env.LOG_LOKI_URLS);
+const services = process.env.LOG_SERVICES;
+const labels = JSON.parse(process.env.LOG_LABELS || "{}");
+const batchSize = parseInt(process.env.LOG_BATCH_SIZE || "500", 10);
+const flushInterval = parseInt(process.env.LOG_FLUSH_INTERVAL_MS || "1000", 10);
+const bufferSize = Math.max(parseInt(process.env.LOG_BUFFER_SIZE || "10000", 10), batchSize);
+const statsPath = process.env.LOG_STATS_PATH;
+const pebbleSocket = process.env.LOG_PEBBLE_SOCKET || "/charm/container/pebble.socket";
+const REQUEST_TIMEOUT_MS = 10000;
+const MAX_BACKOFF_MS = 30000;
+const RECONNECT_MS = 1000;
+
+const stats = { read: 0, sent: 0, dropped: 0, batches: 0, failures: 0, buffered: 0 };
+let buffer = [];
+let inflight = false;
+let backoff = 0;
+let timer = null;
+// Time of the last line read, in nanoseconds: following again replays the lines Pebble
+// still buffers, those up to resumeAfter being skipped.
+let lastTime = null;
+let resumeAfter = null;
+let reconnecting = false;
+
+function writeStats() {
+  if (!statsPath) {
+    return;
+  }
+  stats.buffered = buffer.length;
+  try {
+    fs.mkdirSync(path.dirname(statsPath), { recursive: true });
+    fs.writeFileSync(`${statsPath}.tmp`, JSON.stringify(stats));
+    fs.renameSync(`${statsPath}.tmp`, statsPath);
+  } catch (error) {
+    console.error(`cannot write the stats: ${error.message}`);
+  }
+}
+
+// Return the nanoseconds since the epoch of an RFC 3339 time, as a string.
+function nanoseconds(time) {
+  const fraction = (/\.(\d+)/.exec(time) || ["", ""])[1];
+  const seconds = Math.floor(Date.parse(time) / 1000);
+  return `${seconds}${fraction.padEnd(9, "0").slice(0, 9)}`;
+}
+
+function enqueue(entries) {
+  for (const entry of entries) {
+    buffer.push(entry);
+  }
+  if (buffer.length > bufferSize) {
+    stats.dropped += buffer.length - bufferSize;
+    buffer = buffer.slice(buffer.length - bufferSize);
+  }
+}
+
+function schedule() {
+  if (inflight || !buffer.length) {
+    return;
+  }
+  if (buffer.length >= batchSize && !backoff) {
+    flush();
+  } else if (!timer) {
+    timer = setTimeout(flush, Math.max(flushInterval, backoff));
+  }
+}
+
+function payload(batch) {
+  const streams = {};
+  for (const entry of batch) {
+    (streams[entry.service] = streams[entry.service] || []).push([entry.time, entry.line]);
+  }
+  return {
+    streams: Object.entries(streams).map(([service, values]) => ({
+      stream: { ...labels, service },
+      values,
+    })),
+  };
+}
+
+function push(url, body) {
+  return new Promise((resolve, reject) => {
+    const request = (url.startsWith("https:") ? https : http).request(
+      url,
+      {
+        method: "POST",
+        timeout: REQUEST_TIMEOUT_MS,
+        headers: {
+          "Content-Type": "application/json",
+          "Content-Encoding": "gzip",
+          "Content-Length": body.length,
+        },
+      },
+      (response) => {
+        response.resume();
+        response.on("end", () => {
+          if (response.statusCode >= 300) {
+            reject(new Error(`${url}: ${response.statusCode}`));
+          } else {
+            resolve();
+          }
+        });
+      }
+    );
+    request.on("timeout", () => request.destroy(new Error(`${url}: timed out`)));
+    request.on("error", reject);
+    request.end(body);
+  });
+}
+
+async function flush() {
+  clearTimeout(timer);
+  timer = null;
+  if (inflight || !buffer.length) {
+    return;
+  }
+  inflight = true;
+  const batch = buffer.splice(0, batchSize);
+  try {
+    // Compressed off the main thread.
+    const body = await new Promise((resolve, reject) =>
+      zlib.gzip(JSON.stringify(payload(batch)), (error, result) =>
+        error ? reject(error) : resolve(result)
+      )
+    );
+    await Promise.all(urls.map((url) => push(url, body)));
+    stats.sent += batch.length;
+    stats.batches += 1;
+    backoff = 0;
+  } catch (error) {
+    console.error(`cannot push ${batch.length} lines: ${error.message}`);
+    stats.failures += 1;
+    backoff = Math.min(backoff ? backoff * 2 : flushInterval, MAX_BACKOFF_MS);
+    // Retried first; Loki ignores the lines some of the URLs already received.
+    buffer = batch.concat(buffer);
+    enqueue([]);
+  }
+  inflight = false;
+  writeStats();
+  schedule();
+}
+
+function read(line) {
+  let log;
+  try {
+    log = JSON.parse(line);
+  } catch (error) {
+    return null;
+  }
+  const time = nanoseconds(log.time);
+  if (resumeAfter !== null && BigInt(time) <= resumeAfter) {
+    return null;
+  }
+  lastTime = BigInt(time);
+  return { service: log.service, time, line: String(log.message).replace(/\n$/, "") };
+}
+
+function follow() {
+  resumeAfter = lastTime;
+  const query = `follow=true&n=-1&services=${encodeURIComponent(services)}`;
+  const request = http.request(
+    { socketPath: pebbleSocket, path: `/v1/logs?${query}`, method: "GET" },
+    (response) => {
+      let pending = "";
+      response.setEncoding("utf8");
+      response.on("data", (chunk) => {
+        const lines = (pending + chunk).split("\n");
+        pending = lines.pop();
+        const entries = lines.map(read).filter((entry) => entry !== null);
+        stats.read += entries.length;
+        enqueue(entries);
+        schedule();
+      });
+      response.on("end", reconnect);
+      response.on("error", reconnect);
+    }
+  );
+  request.on("error", (error) => {
+    console.error(`cannot follow the logs: ${error.message}`);
+    reconnect();
+  });
+  request.end();
+}
+
+function reconnect() {
+  if (!reconnecting) {
+    reconnecting = true;
+    setTimeout(() => {
+      reconnecting = false;
+      follow();
+    }, RECONNECT_MS);
+  }
+}
+
+writeStats();
+follow();
+
+process.on("SIGTERM", async () => {
+  // Push what is left, once.
+  backoff = 0;
+  await flush();
+  process.exit(0);
+});
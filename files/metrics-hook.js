@@ -0,0 +1,61 @@
+// Copyright 2021 Canonical Ltd.
+// See LICENSE file for licensing details.
+
+// Request metrics of a mongo-express worker, preloaded with `node --require`.
+//
+// Counts the requests served by the process, per status class, and their latencies, and
+// writes them every few seconds to a JSON file read by exporter.js.
+//
+// Environment:
+//   METRICS_DIR: directory the worker metrics are written to.
+//   VCAP_APP_PORT: port of the worker, naming its metrics file.
+//   METRICS_INTERVAL_MS: milliseconds between two writes, 5000 by default.
+"use strict";
+
+const fs = require("fs");
+const http = require("http");
+const path = require("path");
+
+const INTERVAL_MS = parseInt(process.env.METRICS_INTERVAL_MS || "5000", 10);
+// Upper bounds, in seconds, of the request latency histogram buckets.
+const BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10];
+
+const directory = process.env.METRICS_DIR;
+const file = path.join(directory, `worker-${process.env.VCAP_APP_PORT || process.pid}.json`);
+const stats = { requests: {}, buckets: BUCKETS.map(() => 0), sum: 0, count: 0 };
+
+function record(status, seconds) {
+  const code = `${Math.floor(status / 100)}xx`;
+  stats.requests[code] = (stats.requests[code] || 0) + 1;
+  const bucket = BUCKETS.findIndex((bound) => seconds <= bound);
+  if (bucket >= 0) {
+    stats.buckets[bucket] += 1;
+  }
+  stats.sum += seconds;
+  stats.count += 1;
+}
+
+const emit = http.Server.prototype.emit;
+http.Server.prototype.emit = function (event, request, response) {
+  if (event === "request") {
+    const start = process.hrtime.bigint();
+    response.once("finish", () => {
+      record(response.statusCode, Number(process.hrtime.bigint() - start) / 1e9);
+    });
+  }
+  return emit.apply(this, arguments);
+};
+
+function flush() {
+  const data = JSON.stringify({ ...stats, bounds: BUCKETS, rss: process.memoryUsage().rss });
+  try {
+    fs.mkdirSync(directory, { recursive: true });
+    fs.writeFileSync(`${file}.tmp`, data);
+    fs.renameSync(`${file}.tmp`, file);
+  } catch (error) {
+    console.error(`cannot write the request metrics: ${error.message}`);
+  }
+}
+
+setInterval(flush, INTERVAL_MS).unref();
+flush();
@@ -0,0 +1,63 @@
+// Copyright 2021 Canonical Ltd.
+// See LICENSE file for licensing details.
+
+// Preloaded while mongo-express is profiled. Profiles the process through the inspector
+// for PROFILE_DURATION_MS from its start, then writes the profiles to PROFILE_DIR, as
+// <PROFILE_NAME>.<pid>.cpuprofile and .heapprofile, and goes on serving: unlike
+// --cpu-prof, nothing waits for the process to exit.
+//
+// Environment:
+//   PROFILE_DIR: directory the profiles are written to.
+//   PROFILE_DURATION_MS: time profiled.
+//   PROFILE_NAME: name of the service, prefixing the profiles.
+//   PROFILE_CPU, PROFILE_HEAP: "true" to write a CPU profile, a sampling heap profile.
+"use strict";
+
+const fs = require("fs");
+const inspector = require("inspector");
+const path = require("path");
+
+const directory = process.env.PROFILE_DIR;
+const duration = parseInt(process.env.PROFILE_DURATION_MS || "30000", 10);
+const prefix = `${process.env.PROFILE_NAME || "mongo-express"}.${process.pid}`;
+const cpu = process.env.PROFILE_CPU === "true";
+const heap = process.env.PROFILE_HEAP === "true";
+
+const session = new inspector.Session();
+
+function post(method, params) {
+  return new Promise((resolve, reject) =>
+    session.post(method, params || {}, (error, result) => (error ? reject(error) : resolve(result)))
+  );
+}
+
+// Written under a temporary name first, so that only complete profiles are collected.
+function write(name, profile) {
+  const file = path.join(directory, name);
+  fs.writeFileSync(`${file}.tmp`, JSON.stringify(profile));
+  fs.renameSync(`${file}.tmp`, file);
+}
+
+async function run() {
+  session.connect();
+  if (cpu) {
+    await post("Profiler.enable");
+    await post("Profiler.start");
+  }
+  if (heap) {
+    await post("HeapProfiler.enable");
+    await post("HeapProfiler.startSampling");
+  }
+  // Does not keep an exiting process alive.
+  await new Promise((resolve) => setTimeout(resolve, duration).unref());
+  fs.mkdirSync(directory, { recursive: true });
+  if (cpu) {
+    write(`${prefix}.cpuprofile`, (await post("Profiler.stop")).profile);
+  }
+  if (heap) {
+    write(`${prefix}.heapprofile`, (await post("HeapProfiler.stopSampling")).profile);
+  }
+  session.disconnect();
+}
+
+run().catch((error) => console.error(`cannot profile: ${error.message}`));
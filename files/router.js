@@ -0,0 +1,201 @@
+// Copyright 2021 Canonical Ltd.
+// See LICENSE file for licensing details.
+
+// HTTP router in front of the mongo-express backends, one per MongoDB cluster.
+//
+// Requests to /<name>/... are forwarded to the backend <name>, whose Pebble service is
+// started on the first request and stopped once it has been idle for a while.
+//
+// Environment:
+//   ROUTER_PORT: port to listen on.
+//   ROUTER_BACKENDS: JSON object of the backends, {"<name>": {"service": ..., "port": ...}}.
+//   ROUTER_IDLE_TIMEOUT: seconds without requests before a backend is stopped, 0 for never.
+//   ROUTER_AUTHORIZATION: Authorization header required to list the backends on /.
+//   ROUTER_PEBBLE_SOCKET: Pebble API socket, /charm/container/pebble.socket by default.
+"use strict";
+
+const http = require("http");
+const net = require("net");
+
+const port = parseInt(process.env.ROUTER_PORT, 10);
+const backends = JSON.parse(process.env.ROUTER_BACKENDS);
+const idleTimeout = parseInt(process.env.ROUTER_IDLE_TIMEOUT || "0", 10) * 1000;
+const authorization = process.env.ROUTER_AUTHORIZATION;
+const pebbleSocket = process.env.ROUTER_PEBBLE_SOCKET || "/charm/container/pebble.socket";
+const START_TIMEOUT_MS = 120000;
+const RETRY_INTERVAL_MS = 250;
+
+const states = {};
+for (const name of Object.keys(backends)) {
+  states[name] = { up: false, starting: null, stopping: null, active: 0, lastUsed: 0 };
+}
+
+function pebbleRequest(method, path, body) {
+  return new Promise((resolve, reject) => {
+    const request = http.request(
+      { socketPath: pebbleSocket, path, method, headers: { "Content-Type": "application/json" } },
+      (response) => {
+        const chunks = [];
+        response.on("data", (chunk) => chunks.push(chunk));
+        response.on("end", () => {
+          if (response.statusCode >= 400) {
+            reject(new Error(`pebble ${method} ${path}: ${response.statusCode}`));
+          } else {
+            resolve(JSON.parse(Buffer.concat(chunks).toString() || "{}"));
+          }
+        });
+      }
+    );
+    request.on("error", reject);
+    request.end(body === undefined ? undefined : JSON.stringify(body));
+  });
+}
+
+// Start or stop a service, and wait for Pebble to be done.
+async function pebble(action, service) {
+  const { change } = await pebbleRequest("POST", "/v1/services", { action, services: [service] });
+  if (change) {
+    await pebbleRequest("GET", `/v1/changes/${change}/wait?timeout=${START_TIMEOUT_MS / 1000}s`);
+  }
+}
+
+function isListening(backendPort) {
+  return new Promise((resolve) => {
+    const socket = net.connect(backendPort, "127.0.0.1");
+    socket.once("connect", () => {
+      socket.destroy();
+      resolve(true);
+    });
+    socket.once("error", () => resolve(false));
+  });
+}
+
+async function waitForPort(backendPort) {
+  const deadline = Date.now() + START_TIMEOUT_MS;
+  while (!(await isListening(backendPort))) {
+    if (Date.now() >= deadline) {
+      throw new Error(`port ${backendPort} is not listening`);
+    }
+    await new Promise((resolve) => setTimeout(resolve, RETRY_INTERVAL_MS));
+  }
+}
+
+async function start(name) {
+  const backend = backends[name];
+  await states[name].stopping;
+  if (!(await isListening(backend.port))) {
+    console.log(`starting ${backend.service}`);
+    await pebble("start", backend.service);
+    await waitForPort(backend.port);
+  }
+  states[name].up = true;
+}
+
+function ensureStarted(name) {
+  const state = states[name];
+  if (state.up) {
+    return Promise.resolve();
+  }
+  if (!state.starting) {
+    state.starting = start(name).finally(() => {
+      state.starting = null;
+    });
+  }
+  return state.starting;
+}
+
+function forward(name, request, response, retry) {
+  const state = states[name];
+  const upstream = http.request({
+    host: "127.0.0.1",
+    port: backends[name].port,
+    method: request.method,
+    path: request.url,
+    headers: request.headers,
+  });
+  upstream.on("response", (upstreamResponse) => {
+    response.writeHead(upstreamResponse.statusCode, upstreamResponse.headers);
+    upstreamResponse.pipe(response);
+  });
+  upstream.on("error", (error) => {
+    if (retry && error.code === "ECONNREFUSED") {
+      // The backend stopped behind our back: start it again, once.
+      state.up = false;
+      route(name, request, response, false);
+    } else if (!response.headersSent) {
+      response.writeHead(502);
+      response.end();
+    } else {
+      response.destroy();
+    }
+  });
+  request.pipe(upstream);
+}
+
+function route(name, request, response, retry) {
+  const state = states[name];
+  state.active += 1;
+  response.once("close", () => {
+    state.active -= 1;
+    state.lastUsed = Date.now();
+  });
+  ensureStarted(name).then(
+    () => forward(name, request, response, retry),
+    (error) => {
+      console.error(`cannot start ${name}: ${error.message}`);
+      response.writeHead(503);
+      response.end();
+    }
+  );
+}
+
+function index(request, response) {
+  if (authorization && request.headers.authorization !== authorization) {
+    response.writeHead(401, { "WWW-Authenticate": 'Basic realm="Authorization Required"' });
+    response.end();
+    return;
+  }
+  const links = Object.keys(backends)
+    .map((name) => `<li><a href="/${name}/">${name}</a></li>`)
+    .join("");
+  response.writeHead(200, { "Content-Type": "text/html" });
+  response.end(`<!DOCTYPE html><title>mongo-express</title><ul>${links}</ul>`);
+}
+
+const server = http.createServer((request, response) => {
+  const [path] = request.url.split("?", 1);
+  const name = path.split("/")[1];
+  if (!name) {
+    index(request, response);
+  } else if (!(name in backends)) {
+    response.writeHead(404);
+    response.end();
+  } else if (path === `/${name}`) {
+    response.writeHead(301, { Location: `/${name}/` });
+    response.end();
+  } else {
+    route(name, request, response, true);
+  }
+});
+
+function stopIdleBackends() {
+  const now = Date.now();
+  for (const [name, state] of Object.entries(states)) {
+    if (state.up && !state.active && now - state.lastUsed >= idleTimeout) {
+      state.up = false;
+      console.log(`stopping idle ${backends[name].service}`);
+      state.stopping = pebble("stop", backends[name].service)
+        .catch((error) => console.error(error.message))
+        .finally(() => {
+          state.stopping = null;
+        });
+    }
+  }
+}
+
+if (idleTimeout) {
+  setInterval(stopIdleBackends, Math.min(idleTimeout / 4, 30000)).unref();
+}
+server.listen(port, () => console.log(`routing :${port} to ${Object.keys(backends).join(", ")}`));
+
+process.on("SIGTERM", () => server.close(() => process.exit(0)));
@@ -0,0 +1,53 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mongo Express application config module.
+
+Render the config.js of mongo-express, setting the options that drive the load on MongoDB.
+"""
+
+import json
+
+# mongo-express loads config.js, deep-merged over config.default.js, from its directory.
+CONFIG_PATH = "/node_modules/mongo-express/config.js"
+
+
+def render_config(
+    documents_per_page: int = 10,
+    max_prop_size: int = 100 << 10,
+    max_row_size: int = 1 << 20,
+    export: bool = True,
+) -> str:
+    """Render config.js.
+
+    The connection, site and authentication settings are left to config.default.js, which
+    reads them from the environment of each mongo-express process.
+
+    Args:
+        documents_per_page: documents listed per page of a collection.
+        max_prop_size: size in bytes above which a property of a listed document is
+            truncated.
+        max_row_size: size in bytes above which a listed document is truncated.
+        export: allow exporting collections, which reads them in full.
+    """
+    options = {
+        "documentsPerPage": documents_per_page,
+        "maxPropSize": max_prop_size,
+        "maxRowSize": max_row_size,
+        "noExport": not export,
+    }
+    lines = "".join(
+        f"    {name}: {json.dumps(value)},\n" for name, value in sorted(options.items())
+    )
+    return f"""// Generated by the mongo-express charm, do not edit.
+"use strict";
+
+const defaults = require("./config.default");
+
+module.exports = {{
+  ...defaults,
+  options: {{
+    ...defaults.options,
+{lines}  }},
+}};
+"""
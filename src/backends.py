@@ -0,0 +1,100 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mongo Express backends module.
+
+Parse the named MongoDB backends of the multi-backend mode, where one mongo-express
+process per backend is served under its own base path by a router, and started on demand.
+"""
+
+import re
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from mongodb import DEFAULT_PORT
+
+BACKEND_BASE_PORT = 8200
+MAX_BACKENDS = 32
+SERVICE_PREFIX = "mongo-express-backend-"
+ROUTER_PATH = "/srv/mongo-express-charm/router.js"
+# A named backend, e.g. "prod=mongodb://mongodb-0,mongodb-1/?replicaSet=rs0".
+NAMED_BACKEND = re.compile(r"^([a-z0-9](?:[a-z0-9-]*[a-z0-9])?)=(\S+)$")
+
+
+class Backend(NamedTuple):
+    """MongoDB backend served by its own mongo-express process."""
+
+    name: str
+    url: str
+    port: int
+
+    @property
+    def service(self) -> str:
+        """Return the name of the Pebble service of the backend."""
+        return f"{SERVICE_PREFIX}{self.name}"
+
+    @property
+    def base_url(self) -> str:
+        """Return the base path the backend is served under."""
+        return f"/{self.name}/"
+
+    @property
+    def environment(self) -> Dict[str, str]:
+        """Return the mongo-express environment selecting the backend."""
+        if "://" in self.url:
+            return {"ME_CONFIG_MONGODB_URL": self.url}
+        return {"ME_CONFIG_MONGODB_SERVER": self.url}
+
+
+def parse(value: Optional[str], ports: Optional[Mapping[str, int]] = None) -> List[Backend]:
+    """Return the backends of a whitespace-separated list of name=url pairs.
+
+    A value without any name=url pair is a single MongoDB server or URL, and has no
+    backends.
+
+    Args:
+        value: the list of backends.
+        ports: ports already assigned to backends, by name. These backends keep their port,
+            and the others take the lowest free ones, so that adding or removing a backend
+            never moves another one to a port a running process may still listen on.
+
+    Raises:
+        ValueError: if the list is invalid.
+    """
+    tokens = (value or "").split()
+    if not any(NAMED_BACKEND.match(token) for token in tokens):
+        return []
+    if len(tokens) > MAX_BACKENDS:
+        raise ValueError(f"at most {MAX_BACKENDS} backends are supported.")
+    urls = {}
+    for token in tokens:
+        match = NAMED_BACKEND.match(token)
+        if not match:
+            raise ValueError(f"{token} is not a name=url backend.")
+        name, url = match.groups()
+        if name in urls:
+            raise ValueError(f"duplicate backend {name}.")
+        urls[name] = url
+    available = range(BACKEND_BASE_PORT, BACKEND_BASE_PORT + MAX_BACKENDS)
+    assigned = {}
+    for name, port in (ports or {}).items():
+        if name in urls and port in available and port not in assigned.values():
+            assigned[name] = port
+    free = iter(port for port in available if port not in assigned.values())
+    return [Backend(name, url, assigned.get(name) or next(free)) for name, url in urls.items()]
+
+
+def validate(value: Optional[str]) -> Optional[str]:
+    """Return why value is not a valid backend list, or None if it is valid."""
+    try:
+        parse(value)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def address(url: str) -> Tuple[str, int]:
+    """Return the host and port of the first server of a MongoDB URL or host[:port]."""
+    server = url.partition("://")[2] or url
+    server = re.split(r"[,/?]", server.rpartition("@")[2], maxsplit=1)[0]
+    host, _, port = server.partition(":")
+    return host, int(port or DEFAULT_PORT)
@@ -4,20 +4,82 @@
 
 """Mongo Express charm module."""
 
+import base64
+import hashlib
+import json
 import logging
+import math
+import os
 import secrets
+import shutil
+import time
+from typing import TYPE_CHECKING, Collection, Optional
 
 from ops.charm import ActionEvent, CharmBase, ConfigChangedEvent, WorkloadEvent
-from ops.framework import StoredState
+from ops.framework import EventBase, StoredState
 from ops.main import main
-from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus
+from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus, WaitingStatus
+from ops.pebble import APIError, ChangeError, ConnectionError, PathError
 
 from cluster import MongoExpressCluster, MongoExpressClusterEvents
-from utils import EDITOR_THEMES, PORT
+from ingress import IngressRequires
+from instrumentation import Instrumentation, instrumented
+from loki import (
+    LOG_FORWARDER_PATH,
+    LOG_FORWARDER_SERVICE,
+    LOG_STATS_PATH,
+    LokiPushApiRequires,
+)
+from metrics import (
+    CHARM_METRICS_PATH,
+    EXPORTER_PATH,
+    EXPORTER_SERVICE,
+    METRICS_DIR,
+    METRICS_HOOK_PATH,
+    METRICS_PORT,
+    Metric,
+    MetricsEndpointProvider,
+    render_metrics,
+)
+from mongodb import MongoDBRequires
+from snapshot import DispatchSnapshot
+from utils import (
+    BALANCER_PATH,
+    DRAIN_DIR,
+    DRAIN_HOOK_PATH,
+    HEALTH_CHECK_TIMEOUT,
+    MAX_PROFILE_DURATION,
+    MAX_WORKERS,
+    MAX_WORKLOAD_PROFILES,
+    PORT,
+    PROFILE_COLLECT_TIMEOUT,
+    PROFILE_COPY_DIR,
+    PROFILE_HOOK_PATH,
+    READY_CHECK_PERIOD,
+    READY_PATH,
+    WARMUP_PATHS,
+    WORKER_BASE_PORT,
+    WORKLOAD_PROFILE_DIR,
+    http_get,
+    is_http_ready,
+    is_tcp_open,
+    parse_size,
+    timed,
+    wait_for,
+)
+
+# appconfig, backends, health, k8s, proxy, reconcile, runtime and schema are only needed by the
+# hooks that reconcile or probe the workload: they are imported by the methods using them, to
+# keep the other hooks cheap.
+if TYPE_CHECKING:
+    import reconcile
+    import runtime
 
 logger = logging.getLogger(__name__)
 
-REQUIRED_CONFIG = ("editor-theme", "web-username", "read-only", "enable-gridfs")
+BALANCER_SERVICE = "mongo-express-balancer"
+NOT_READY_MESSAGE = "waiting for mongo-express to be ready"
+MONGO_EXPRESS_APP_PATH = "/node_modules/mongo-express/app.js"
 
 
 def generate_random_password():
@@ -48,43 +110,222 @@ class MongoExpressCharm(CharmBase):
         super().__init__(*args)
         event_observe_mapping = {
             self.on.mongo_express_pebble_ready: self._on_mongo_express_pebble_ready,
+            self.on.proxy_pebble_ready: self._on_mongo_express_pebble_ready,
             self.on.config_changed: self._on_config_changed,
+            self.on.update_status: self._on_update_status,
             self.on.cluster_ready: self._on_cluster_ready,
             self.on.web_password_changed: self._on_config_changed,
+            self.on.site_secrets_changed: self._on_config_changed,
+            self.on.restart_granted: self._on_config_changed,
             self.on.get_credentials_action: self._on_get_credentials_action,
             self.on.change_password_action: self._on_change_password_action,
+            self.on.rotate_secrets_action: self._on_rotate_secrets_action,
+            self.on.hook_stats_action: self._on_hook_stats_action,
+            self.on.benchmark_action: self._on_benchmark_action,
+            self.on.profile_workload_action: self._on_profile_workload_action,
+            self.on.mongodb_relation_changed: self._on_config_changed,
+            self.on.mongodb_relation_departed: self._on_config_changed,
+            self.on.mongodb_relation_broken: self._on_config_changed,
+            self.on.metrics_endpoint_relation_joined: self._on_config_changed,
+            self.on.metrics_endpoint_relation_broken: self._on_config_changed,
+            self.on.logging_relation_changed: self._on_config_changed,
+            self.on.logging_relation_departed: self._on_config_changed,
+            self.on.logging_relation_broken: self._on_config_changed,
+            self.framework.on.pre_commit: self._on_pre_commit,
         }
         for event, observer in event_observe_mapping.items():
             self.framework.observe(event, observer)
+        self.snapshot = DispatchSnapshot(self)
         self.cluster = MongoExpressCluster(self)
-        self._stored.set_default(mongodb_server="mongodb-k8s-0.mongodb-k8s-endpoints")
+        self.mongodb = MongoDBRequires(self)
+        self.metrics = MetricsEndpointProvider(self)
+        self.ingress = IngressRequires(self)
+        self.logging = LokiPushApiRequires(self)
+        self._stored.set_default(
+            mongodb_server="mongodb-k8s-0.mongodb-k8s-endpoints",
+            layer_fingerprint=None,
+            # Fingerprint of the checks of the layer last added.
+            checks_fingerprint=None,
+            proxy_fingerprint=None,
+            ready=False,
+            readiness_time=None,
+            warmup_time=None,
+            proxy_config_digest=None,
+            restarts=0,
+            restarts_avoided=0,
+            deferred_event=None,
+            duplicate_events=0,
+            dropped_events=0,
+            probe_samples=[],
+            # Mean and max durations of the handlers in seconds, as of the last update-status.
+            handler_durations={},
+            # Set of workers serving, alternating between 0 and 1 on blue/green restarts.
+            worker_slot=0,
+            # Digests of the files pushed to the workload, by path.
+            pushed_files={},
+            # Ports of the named backends, by name.
+            backend_ports={},
+            # Profiling run of the workers requested by the profile-workload action.
+            workload_profile=None,
+            # Whether the leader set container resources in the StatefulSet.
+            resources_managed=False,
+        )
+        self._reconcile_requested = False
+        self._cgroup_limits = None
+        # When the ready marker was removed in this dispatch, if it was.
+        self._unready_since = None
+        # Created last, so that its pre_commit observer runs after the reconcile.
+        self.instrumentation = Instrumentation(self)
 
     @property
     def container(self):
         """Property to get mongo-express container."""
-        return self.unit.get_container("mongo-express")
+        return self.instrumentation.container(self.unit.get_container("mongo-express"))
+
+    @property
+    def proxy_container(self):
+        """Property to get proxy container."""
+        return self.instrumentation.container(self.unit.get_container("proxy"))
 
     @property
     def services(self):
         """Property to get the services in the container plan."""
-        return self.container.get_plan().services
+        return self.snapshot.plan(self.container).services
 
-    def _on_mongo_express_pebble_ready(self, _: WorkloadEvent):
-        self._restart()
+    @property
+    def event_counters(self) -> dict:
+        """Property to get the number of coalesced (duplicate) and dropped events."""
+        return {
+            "duplicate": self._stored.duplicate_events + self.cluster.duplicate_events,
+            "dropped": self._stored.dropped_events,
+        }
 
+    @instrumented
+    def _on_mongo_express_pebble_ready(self, event: WorkloadEvent):
+        self._request_reconcile(event)
+
+    @instrumented
     def _on_config_changed(self, event: ConfigChangedEvent):
         if self.container.can_connect():
-            self._restart()
+            self._request_reconcile(event)
         else:
-            logger.info("pebble socket not available, deferring config-changed")
-            event.defer()
+            self._defer_reconcile(event)
             self.unit.status = MaintenanceStatus("waiting for pebble to start")
 
+    @instrumented
+    def _on_update_status(self, _):
+        self.cluster.check_restart_grants()
+        self._collect_workload_profile()
+        self._probe_health()
+        # Refreshed here only: the charm metrics are pushed when they change.
+        self._stored.handler_durations = {
+            name: [aggregate["mean-ms"] / 1000, aggregate["max-ms"] / 1000]
+            for name, aggregate in self.instrumentation.aggregates.items()
+        }
+
+    def _probe_health(self):
+        """Probe mongo-express and MongoDB, and report the unit degraded when they are slow."""
+        import health
+
+        status = self.unit.status
+        if not self._stored.ready:
+            if status == WaitingStatus(NOT_READY_MESSAGE):
+                # Missed the readiness timeout after a restart: checked again, without waiting.
+                self._gate_readiness(timeout=0)
+            return
+        degraded = isinstance(status, WaitingStatus) and status.message.startswith(health.DEGRADED)
+        if not (isinstance(status, ActiveStatus) or degraded):
+            return
+        window = health.WINDOW
+        samples = [list(sample) for sample in self._stored.probe_samples]
+        samples.append([timed(self._is_ready), timed(self._is_mongodb_reachable)])
+        self._stored.probe_samples = samples = samples[-window:]
+        summary = health.summarise(samples)
+        problem = health.check(summary, 0, self.config.get("status-error-threshold", 0))
+        slow = health.check(summary, self.config.get("status-latency-threshold-ms", 0), 0)
+        if slow and not problem and not self._other_ready_units:
+            # A slow MongoDB shared by every unit slows them all down: the last ready units
+            # keep serving rather than leaving the ingress without any.
+            logger.warning(f"mongo-express is slow ({slow}), kept ready as no other unit is")
+        else:
+            problem = problem or slow
+        if problem:
+            logger.warning(f"mongo-express is degraded: {problem}")
+            self._set_ready(False)
+            self.unit.status = WaitingStatus(f"{health.DEGRADED}: {problem}")
+            return
+        self._set_ready(True)
+        status = self._workers_status()
+        if isinstance(status, ActiveStatus):
+            slow = slow and f"{health.DEGRADED}: {slow}, no other unit ready"
+            status = ActiveStatus(", ".join(filter(None, (status.message, summary.message, slow))))
+        self.unit.status = status
+
+    def _set_ready(self, ready: bool):
+        """Add this unit to, or remove it from, the ready set and the Service endpoints.
+
+        The serving check, a ready check, passes while the ready marker exists: Kubernetes
+        only routes the Service traffic, the ingress one included, to the ready pods.
+        """
+        self.cluster.set_ready(ready)
+        if ready:
+            self._push_changed(READY_PATH, "", fresh=False)
+        elif READY_PATH in self._stored.pushed_files:
+            try:
+                self.container.remove_path(READY_PATH)
+            except (PathError, ConnectionError) as e:
+                # Gone with the container, if it stopped.
+                logger.debug(f"ready marker not removed: {e}")
+            del self._stored.pushed_files[READY_PATH]
+            self._unready_since = time.monotonic()
+
+    @property
+    def _other_ready_units(self) -> list:
+        """Return the names of the other units ready to serve requests."""
+        return [name for name in self.cluster.ready_units if name != self.unit.name]
+
+    @instrumented
+    def _on_pre_commit(self, _):
+        if self._reconcile_requested:
+            self._reconcile_requested = False
+            self._restart()
+        self.ingress.publish()
+        self._push_charm_metrics()
+        self.snapshot.flush()
+
+    def _request_reconcile(self, event: EventBase):
+        """Mark the desired state as changed; the reconcile runs once at the end of the hook."""
+        if self._stored.deferred_event == event.handle.path:
+            self._stored.deferred_event = None
+        if self._reconcile_requested:
+            self._stored.duplicate_events += 1
+            logger.debug(f"{event.handle.kind} coalesced into the pending reconcile")
+        self._reconcile_requested = True
+
+    def _defer_reconcile(self, event: EventBase):
+        """Defer the event, unless another deferred event already stands for the reconcile."""
+        if self._stored.deferred_event in (None, event.handle.path):
+            logger.info(f"pebble socket not available, deferring {event.handle.kind}")
+            self._stored.deferred_event = event.handle.path
+            event.defer()
+        else:
+            self._stored.dropped_events += 1
+            logger.info(
+                f"pebble socket not available, dropping {event.handle.kind}: "
+                f"{self._stored.deferred_event} is already deferred"
+            )
+
+    @instrumented
     def _on_cluster_ready(self, _):
-        if self.unit.is_leader() and not self.cluster.web_password:
+        if not self.unit.is_leader():
+            return
+        if not self.cluster.web_password:
             password = generate_random_password()
             self.cluster.set_web_password(password)
+        if not (self.cluster.cookie_secret and self.cluster.session_secret):
+            self.cluster.set_site_secrets(generate_random_password(), generate_random_password())
 
+    @instrumented
     def _on_get_credentials_action(self, event: ActionEvent):
         try:
             logger.debug("Executing action get-credentials...")
@@ -100,6 +341,7 @@ class MongoExpressCharm(CharmBase):
             logger.error(f"Failed executing action get-credentials. Reason: {e}")
             event.fail(f"Failed getting the credentials: {e}")
 
+    @instrumented
     def _on_change_password_action(self, event: ActionEvent):
         try:
             if not self.unit.is_leader():
@@ -113,40 +355,794 @@ class MongoExpressCharm(CharmBase):
             logger.error(f"Failed executing action change-password. Reason: {e}")
             event.fail(f"Failed changing the credentials: {e}")
 
+    @instrumented
+    def _on_rotate_secrets_action(self, event: ActionEvent):
+        try:
+            if not self.unit.is_leader():
+                raise Exception("only the leader can rotate the secrets.")
+            logger.debug("Rotating cookie and session secrets...")
+            self.cluster.set_site_secrets(generate_random_password(), generate_random_password())
+            event.set_results({"message": "cookie and session secrets rotated"})
+            logger.info("Cookie and session secrets successfully rotated.")
+        except Exception as e:
+            logger.error(f"Failed executing action rotate-secrets. Reason: {e}")
+            event.fail(f"Failed rotating the secrets: {e}")
+
+    @instrumented
+    def _on_hook_stats_action(self, event: ActionEvent):
+        aggregates = self.instrumentation.aggregates
+        if not aggregates:
+            event.set_results({"message": "no handler stats recorded yet"})
+            return
+        event.set_results({"handlers": aggregates})
+
+    @instrumented
+    def _on_benchmark_action(self, event: ActionEvent):
+        import loadtest
+
+        try:
+            if not self.cluster.web_password:
+                raise Exception("password is not defined")
+            logger.info(f"Running benchmark: {event.params}")
+            result = loadtest.run(
+                "localhost",
+                PORT,
+                event.params["paths"],
+                headers=self._auth_headers,
+                concurrency=event.params["concurrency"],
+                duration=event.params["duration"],
+            )
+            results = {
+                "requests": result.requests,
+                "errors": result.errors,
+                "error-rate": round(result.error_rate, 4),
+                "rps": round(result.rps, 1),
+            }
+            for percent in (50, 95, 99):
+                latency = result.percentile(percent)
+                if latency is not None:
+                    results[f"p{percent}-ms"] = round(latency * 1000, 1)
+            event.set_results(results)
+        except Exception as e:
+            logger.error(f"Failed executing action benchmark. Reason: {e}")
+            event.fail(f"Failed running the benchmark: {e}")
+
+    @instrumented
+    def _on_profile_workload_action(self, event: ActionEvent):
+        try:
+            if not (event.params["cpu"] or event.params["heap"]):
+                raise Exception("cpu or heap must be set.")
+            if event.params["duration"] > MAX_PROFILE_DURATION:
+                raise Exception(f"duration must not exceed {MAX_PROFILE_DURATION}s.")
+            if not self.container.can_connect():
+                raise Exception("pebble is not available.")
+            if self._stored.workload_profile:
+                raise Exception("mongo-express is already being profiled.")
+            self._check_configuration()
+            name = time.strftime("%Y%m%d-%H%M%S")
+            self._stored.workload_profile = {
+                "name": name,
+                "duration": event.params["duration"],
+                "cpu": event.params["cpu"],
+                "heap": event.params["heap"],
+                "requested": time.time(),
+            }
+            # The profiled workers are rolled out like any change, at the end of the hook.
+            self._reconcile_requested = True
+            if self.cluster.request_restart():
+                message = f"profiling for {event.params['duration']}s"
+            else:
+                message = "queued until this unit gets the restart lock"
+            event.set_results(
+                {
+                    "directory": os.path.join(PROFILE_COPY_DIR, name),
+                    "message": f"{message}; the profiles are copied to the directory on the "
+                    "first update-status once written",
+                }
+            )
+        except Exception as e:
+            logger.error(f"Failed executing action profile-workload. Reason: {e}")
+            event.fail(f"Failed profiling mongo-express: {e}")
+
+    def _collect_workload_profile(self):
+        """Copy the profiles once every profiled service wrote them, and stop profiling.
+
+        The workers are then restored without the profile hook, like on any change. A run
+        that writes no profile within PROFILE_COLLECT_TIMEOUT seconds is given up.
+        """
+        profile = self._stored.workload_profile
+        if not profile or not self.container.can_connect():
+            return
+        directory = f"{WORKLOAD_PROFILE_DIR}/{profile['name']}"
+        timed_out = time.time() - profile["requested"] > PROFILE_COLLECT_TIMEOUT
+        if not (self._profiles_written(directory) or timed_out):
+            return
+        try:
+            profiles = self._collect_profiles(
+                directory, os.path.join(PROFILE_COPY_DIR, profile["name"])
+            )
+        except APIError:
+            profiles = []
+        if profiles:
+            logger.info(f"mongo-express profiles copied: {[name for name, _ in profiles]}")
+        else:
+            logger.warning("mongo-express profiling given up, no profile written")
+        self._stored.workload_profile = None
+        self._reconcile_requested = True
+
+    def _profiles_written(self, directory: str) -> bool:
+        """Return True once every running profiled service wrote its profiles to directory."""
+        try:
+            files = self.container.list_files(directory, pattern="*profile")
+        except APIError:
+            return False
+        written = {info.name.split(".")[0] for info in files}
+        services = self.container.get_services(*self._profiled_services)
+        running = {name for name, info in services.items() if info.is_running()}
+        return bool(running) and running <= written
+
+    @property
+    def _profiled_services(self) -> list:
+        # The mongo-express processes: the backends behind the router, or the workers.
+        return [backend.service for backend in self._backends] or self._worker_services
+
+    def _collect_profiles(self, directory: str, destination: str) -> list:
+        """Move the profiles from the workload directory to destination, in the charm container.
+
+        Returns:
+            The names and sizes (bytes) of the profiles.
+        """
+        os.makedirs(destination, exist_ok=True)
+        profiles = []
+        for info in self.container.list_files(directory, pattern="*profile"):
+            source = self.container.pull(info.path, encoding=None)
+            with open(os.path.join(destination, info.name), "wb") as target:
+                shutil.copyfileobj(source, target)
+            profiles.append((info.name, info.size))
+        self.container.remove_path(directory, recursive=True)
+        # The names are timestamps: the oldest sort first.
+        names = sorted(os.listdir(os.path.dirname(destination)))
+        for name in names[:-MAX_WORKLOAD_PROFILES]:
+            shutil.rmtree(os.path.join(os.path.dirname(destination), name), ignore_errors=True)
+        return profiles
+
     def _restart(self):
+        import k8s
+
         try:
             self._check_configuration()
             layer = self._get_pebble_layer()
-            self._set_pebble_layer(layer)
-            self._restart_service()
-            self.unit.status = ActiveStatus()
+            if not self._proxy_enabled:
+                # nginx holds the mongo-express port until it stops.
+                self._disable_proxy()
+            if self._reconcile(layer) and self._reconcile_proxy(layer):
+                self._gate_readiness()
+            # Last, so that the Kubernetes API does not hold up the workload changes.
+            self._apply_resources()
         except ConfigError as e:
             logger.info(f"Charm entered to BlockedStatus. Reason: {e}")
             self.unit.status = BlockedStatus(str(e))
+        except k8s.K8sError as e:
+            logger.error(f"Cannot patch the pod resources: {e}")
+            self.unit.status = BlockedStatus("cannot patch the pod resources, see juju trust")
 
     def _check_configuration(self):
-        for config_name in REQUIRED_CONFIG:
-            if config_name not in self.config:
-                raise ConfigError(key=config_name, message="missing configuration.")
-        if self.config["editor-theme"] not in EDITOR_THEMES:
-            raise ConfigError(key="editor-theme", message="invalid value.")
+        import k8s
+        import schema
+
+        error = schema.validate(self.config)
+        if error:
+            raise ConfigError(*error)
+        if self._backends and (self._workers > 1 or self._proxy_enabled):
+            raise ConfigError("mongo-url", "named backends need workers 1 and no proxy.")
+        if self._blue_green and not self._proxy_enabled:
+            raise ConfigError("restart-strategy", "blue-green needs enable-proxy.")
+        error = k8s.check_requests(self.config)
+        if error:
+            raise ConfigError(*error)
         logger.info("Charm configuration: checked.")
 
-    def _restart_service(self):
+    def _apply_resources(self):
+        """Patch the resources of the mongo-express container into the StatefulSet.
+
+        The leader patches them when they differ from the StatefulSet ones, and the pods
+        restart. The resources are left to the cluster defaults until an option is set.
+        """
+        import k8s
+
+        resources = k8s.container_resources(self.config)
+        managed = resources != k8s.container_resources({})
+        if not self.unit.is_leader() or not (managed or self._stored.resources_managed):
+            return
+        client = k8s.Client.in_cluster(self.model.name)
+        if client.patch_container_resources(self.app.name, "mongo-express", resources):
+            logger.info(f"mongo-express resources patched to {resources}, the pods restart")
+        self._stored.resources_managed = managed
+
+    def _reconcile(self, layer) -> bool:
+        """Bring the workload to the layer, returning False while waiting for the restart lock."""
+        import reconcile
+
+        services = layer["services"]
+        live = {name: service.to_dict() for name, service in self.services.items()}
+        decision = reconcile.decide(
+            services, live, self._stored.layer_fingerprint, self._services_running(services)
+        )
+        if decision.action != reconcile.NOOP and not self.cluster.request_restart():
+            logger.info("waiting for the restart lock")
+            self.unit.status = WaitingStatus("waiting for restart lock")
+            return False
+        workers_changed = self._workers_changed(decision)
+        if workers_changed and self._can_swap_workers():
+            # The previous workers keep serving, the unit stays in the peer ready set.
+            fingerprint = self._swap_workers(live, decision)
+            if fingerprint is None:
+                self.cluster.release_restart()
+                self.unit.status = BlockedStatus("new workers failed, previous workers kept")
+                return False
+            self._stored.ready = False
+            self._stored.restarts += 1
+            self._stored.layer_fingerprint = fingerprint
+            return True
+        if workers_changed or (decision.action != reconcile.NOOP and not self._blue_green):
+            # Leave the peer ready set until the restarted service is ready again.
+            self._stored.ready = False
+            self._set_ready(False)
+        self._update_layer(layer, live, decision, self._changed_checks(layer.get("checks", {})))
+        if decision.action != reconcile.NOOP:
+            self._stored.restarts += 1
+            self._push_scripts(services, fresh=not live)
+        if decision.action == reconcile.REPLAN:
+            if BALANCER_SERVICE in services:
+                # The changed workers one by one; the replan restarts the other services.
+                self._restart_service(decision.changed)
+            else:
+                self._drain(self._ports(live, decision.changed))
+            self.container.replan()
+            logger.info("mongo-express layer has been replanned")
+        elif decision.action == reconcile.RESTART:
+            self._restart_service()
+            if BALANCER_SERVICE in services:
+                self.container.replan()
+        else:
+            self._stored.restarts_avoided += 1
+            logger.info(
+                "mongo-express is up to date, restart skipped "
+                f"({self._stored.restarts_avoided} restarts avoided)"
+            )
+        self._stored.layer_fingerprint = decision.fingerprint
+        return True
+
+    def _reconcile_proxy(self, layer) -> bool:
+        """Bring the proxy sidecar in line with the mongo-express layer.
+
+        nginx is reloaded, not restarted, when only its configuration changed.
+        Returns False while the proxy container is not reachable.
+        """
+        import proxy
+        import reconcile
+
+        container = self.proxy_container
+        if not self._proxy_enabled:
+            return True
+        if not container.can_connect():
+            logger.info("proxy container not available")
+            self.unit.status = WaitingStatus("waiting for proxy container")
+            return False
+        environment = next(iter(layer["services"].values()))["environment"]
+        config = proxy.render_config(
+            base_url=environment["ME_CONFIG_SITE_BASEURL"],
+            port=PORT,
+            upstream_ports=self._worker_ports,
+            cache_max_age=self.config.get("proxy-cache-max-age", 604800),
+            cache_size=self.config.get("proxy-cache-size", "256m"),
+            authorization=self._auth_headers["Authorization"],
+            brotli=self.config.get("proxy-brotli", False),
+            request_size=parse_size(self.config.get("request-size", "100kb")),
+            upload_size=parse_size(self.config.get("gridfs-max-upload-size", "16mb")),
+        )
+        config_digest = hashlib.sha256(config.encode("utf-8")).hexdigest()
+        services = proxy.pebble_layer()["services"]
+        live = {
+            name: service.to_dict()
+            for name, service in self.snapshot.plan(container).services.items()
+        }
+        service_info = container.get_services(proxy.SERVICE)
+        running = proxy.SERVICE in service_info and service_info[proxy.SERVICE].is_running()
+        decision = reconcile.decide(services, live, self._stored.proxy_fingerprint, running)
+        config_changed = config_digest != self._stored.proxy_config_digest
+        if config_changed or decision.action != reconcile.NOOP:
+            # Readable by nginx only: it holds the web credentials.
+            container.push(proxy.CONFIG_PATH, config, make_dirs=True, permissions=0o600)
+        if decision.changed:
+            self.snapshot.add_layer(container, "proxy", proxy.pebble_layer())
+        if decision.action == reconcile.REPLAN:
+            container.replan()
+        elif decision.action == reconcile.RESTART:
+            container.restart(proxy.SERVICE)
+        elif config_changed:
+            container.send_signal("SIGHUP", proxy.SERVICE)
+            logger.info("proxy configuration reloaded")
+        self._stored.proxy_fingerprint = decision.fingerprint
+        self._stored.proxy_config_digest = config_digest
+        return True
+
+    def _disable_proxy(self):
+        import proxy
+
+        container = self.proxy_container
+        if self._stored.proxy_fingerprint is None or not container.can_connect():
+            return
+        self.snapshot.add_layer(
+            container,
+            "proxy",
+            {"services": {proxy.SERVICE: {"override": "merge", "startup": "disabled"}}},
+        )
+        if container.get_service(proxy.SERVICE).is_running():
+            container.stop(proxy.SERVICE)
+        logger.info("proxy disabled")
+        self._stored.proxy_fingerprint = None
+        self._stored.proxy_config_digest = None
+
+    def _gate_readiness(self, timeout: Optional[float] = None):
+        """Report the unit active, ready and done restarting only once mongo-express serves.
+
+        After a restart, wait for mongo-express to answer authenticated requests and
+        warm it up by requesting its key pages, recording how long both took.
+
+        Args:
+            timeout: seconds to wait for mongo-express, readiness-timeout by default.
+        """
+        if not self._stored.ready:
+            start = time.monotonic()
+            if timeout is None:
+                timeout = self.config.get("readiness-timeout", 60)
+            if not wait_for(self._is_ready, timeout):
+                logger.warning("mongo-express is not ready, keeping restart lock")
+                self.unit.status = WaitingStatus(NOT_READY_MESSAGE)
+                return
+            ready = time.monotonic()
+            self._warm_up()
+            self._stored.readiness_time = round(ready - start, 1)
+            self._stored.warmup_time = round(time.monotonic() - ready, 1)
+            self._stored.ready = True
+            logger.info(
+                f"mongo-express ready in {self._stored.readiness_time}s, "
+                f"warmed up in {self._stored.warmup_time}s"
+            )
+        self._set_ready(True)
+        if self.cluster.restart_pending:
+            self.cluster.release_restart()
+        self.unit.status = self._workers_status()
+
+    def _is_ready(self) -> bool:
+        return http_get(self._base_url, headers=self._auth_headers) == 200
+
+    def _is_mongodb_reachable(self) -> bool:
+        import backends
+
+        # With named backends, the first one stands for all of them.
+        urls = [backend.url for backend in self._backends] or self.mongodb.hosts
+        return is_tcp_open(*backends.address((urls or [self._mongo_url])[0]))
+
+    def _warm_up(self):
+        for path in WARMUP_PATHS:
+            status = http_get(f"{self._base_url}{path}", headers=self._auth_headers, timeout=30)
+            logger.debug(f"warm-up request to /{path}: {status}")
+
+    @property
+    def _base_url(self) -> str:
+        return f"http://localhost:{PORT}/"
+
+    @property
+    def _auth_headers(self) -> dict:
+        credentials = f"{self.config['web-username']}:{self.cluster.web_password}"
+        token = base64.b64encode(credentials.encode("utf-8")).decode("utf-8")
+        return {"Authorization": f"Basic {token}"}
+
+    def _services_running(self, services) -> bool:
+        # Services disabled at startup, such as the backends, are started on demand.
+        enabled = [name for name, service in services.items() if service["startup"] == "enabled"]
+        service_info = self.container.get_services(*enabled)
+        return len(service_info) == len(enabled) and all(
+            info.is_running() for info in service_info.values()
+        )
+
+    def _changed_checks(self, checks: dict) -> dict:
+        """Return, per check, the fields that differ from the live plan."""
+        import reconcile
+
+        live = {
+            name: check.to_dict()
+            for name, check in self.snapshot.plan(self.container).checks.items()
+        }
+        if not live and reconcile.fingerprint(checks) == self._stored.checks_fingerprint:
+            # A plan without checks, such as the Harness one, is compared with the last layer.
+            return {}
+        return reconcile.changed_checks(checks, live)
+
+    def _update_layer(self, layer, live, decision: "reconcile.Decision", changed_checks: dict):
+        """Add the layer if it changed, disabling and stopping the services it no longer contains.
+
+        Pebble cannot remove services from the plan: they are disabled instead. Services that
+        start disabled, like the backends, may be running all the same, and are stopped too.
+        """
+        services = layer["services"]
+        removed = sorted(name for name in live if name not in services)
+        stale = [name for name in removed if live[name].get("startup") != "disabled"]
+        if stale:
+            logger.info(f"disabling services no longer in the layer: {stale}")
+            layer = dict(layer, services=dict(services))
+            for name in stale:
+                layer["services"][name] = {"override": "merge", "startup": "disabled"}
+        if decision.changed or changed_checks or stale:
+            logger.debug(f"pebble layer changes: {decision.changed}, checks: {changed_checks}")
+            self._set_pebble_layer(layer)
+        if removed and (decision.changed or stale):
+            service_info = self.container.get_services(*removed)
+            running = [name for name, info in service_info.items() if info.is_running()]
+            if running:
+                logger.info(f"stopping services no longer in the layer: {running}")
+                self._drain(self._ports(live, running))
+                self.container.stop(*running)
+
+    def _restart_service(self, names: Optional[Collection[str]] = None):
+        """Restart the workers one by one, so the unit keeps serving with several of them.
+
+        Args:
+            names: services to restart, all the workers by default; other services are ignored.
+        """
         container = self.container
-        if "mongo-express" in self.services:
-            container.restart("mongo-express")
-            logger.info("mongo-express service has been restarted")
+        services = self.services
+        self._stop_backends()
+        workers = [
+            (name, port)
+            for name, port in zip(self._worker_services, self._worker_ports)
+            if name in services and (names is None or name in names)
+        ]
+        for name, port in workers:
+            self._drain({name: port})
+            container.restart(name)
+            logger.info(f"{name} service has been restarted")
+            if len(workers) > 1 and not wait_for(
+                lambda: is_http_ready(f"http://localhost:{port}"), HEALTH_CHECK_TIMEOUT
+            ):
+                logger.warning(f"{name} did not pass its health check")
 
-    def _get_pebble_layer(self):
+    def _drain(self, ports: dict):
+        """Stop workers accepting connections, and wait for their requests in flight.
+
+        Only the running workers preloading the drain hook, which writes their drain state,
+        are drained, for up to drain-timeout seconds.
+
+        Args:
+            ports: ports of the workers to drain, by service name.
+        """
+        timeout = self.config.get("drain-timeout", 20)
+        if not timeout or not ports:
+            return
+        paths = {
+            name: f"{DRAIN_DIR}/worker-{port}.json"
+            for name, port in ports.items()
+            if self._read_workload_file(f"{DRAIN_DIR}/worker-{port}.json") is not None
+        }
+        service_info = self.container.get_services(*paths) if paths else {}
+        running = [name for name, info in service_info.items() if info.is_running()]
+        if not running:
+            return
+        if self._unready_since is not None:
+            # Until the serving check fails, the Service still routes new connections here.
+            time.sleep(max(0, self._unready_since + READY_CHECK_PERIOD - time.monotonic()))
+        self.container.send_signal("SIGUSR2", *running)
+        paths = [paths[name] for name in running]
+        names = sorted(ports)
+        start = time.monotonic()
+        if wait_for(lambda: all(self._is_drained(path) for path in paths), timeout, 0.5):
+            logger.info(f"{names} drained in {round(time.monotonic() - start, 1)}s")
+        else:
+            logger.warning(f"{names} still serving requests after {timeout}s, restarting")
+
+    @staticmethod
+    def _ports(services: dict, names) -> dict:
+        """Return the ports of the mongo-express processes among names, by service name."""
+        environments = {name: services.get(name, {}).get("environment", {}) for name in names}
         return {
+            name: environment["VCAP_APP_PORT"]
+            for name, environment in environments.items()
+            if "VCAP_APP_PORT" in environment
+        }
+
+    def _is_drained(self, path: str) -> bool:
+        state = json.loads(self._read_workload_file(path) or "{}")
+        return state.get("draining", False) and not state.get("inflight")
+
+    def _workers_changed(self, decision: "reconcile.Decision") -> bool:
+        """Return True if the decision restarts the workers, not only the other services."""
+        import reconcile
+
+        if decision.action == reconcile.RESTART:
+            return True
+        return decision.action == reconcile.REPLAN and any(
+            name in decision.changed for name in self._worker_services
+        )
+
+    def _can_swap_workers(self) -> bool:
+        """Return True if the workers can be restarted blue/green, behind a running proxy."""
+        if not self._blue_green or not self.proxy_container.can_connect():
+            return False
+        service_info = self.container.get_services(*self._worker_services)
+        return any(info.is_running() for info in service_info.values())
+
+    def _swap_workers(self, live: dict, decision: "reconcile.Decision") -> Optional[str]:
+        """Restart the workers blue/green, returning the fingerprint of the new services.
+
+        The new workers start on the spare ports while the previous ones serve. Once they
+        answer, the proxy switches over to them, then the previous workers are drained and
+        stopped. When a new worker does not answer, or the proxy cannot switch over, the new
+        workers are stopped and the previous ones keep serving: None is returned.
+        """
+        import reconcile
+
+        self._stored.worker_slot = 1 - self._stored.worker_slot
+        layer = self._get_pebble_layer()
+        self._set_pebble_layer(layer)
+        self._push_scripts(layer["services"], fresh=False)
+        workers = self._worker_services
+        self.container.start(*workers)
+        for name, port in zip(workers, self._worker_ports):
+            if not wait_for(
+                lambda: is_http_ready(f"http://localhost:{port}"), HEALTH_CHECK_TIMEOUT
+            ):
+                logger.error(f"{name} did not pass its health check, keeping the previous workers")
+                self._abort_swap(workers, restore_proxy=False)
+                return None
+        try:
+            switched = self._reconcile_proxy(layer)
+        except (APIError, ChangeError, ConnectionError) as e:
+            logger.error(f"cannot switch the proxy over: {e}")
+            switched = False
+        if not switched:
+            logger.error(f"proxy not switched over to {workers}, keeping the previous workers")
+            self._abort_swap(workers, restore_proxy=True)
+            return None
+        # The previous workers are no longer in the layer: drain, stop and disable them.
+        self._update_layer(layer, live, decision, {})
+        self.container.replan()
+        logger.info(f"mongo-express workers swapped to {workers}")
+        return reconcile.fingerprint(layer["services"])
+
+    def _abort_swap(self, workers: list, restore_proxy: bool):
+        """Stop and disable the new workers of a failed swap, and go back to the previous ones."""
+        service_info = self.container.get_services(*workers)
+        running = [name for name, info in service_info.items() if info.is_running()]
+        if running:
+            self.container.stop(*running)
+        disabled = {name: {"override": "merge", "startup": "disabled"} for name in workers}
+        self.snapshot.add_layer(self.container, "mongo-express", {"services": disabled})
+        self._stored.worker_slot = 1 - self._stored.worker_slot
+        if restore_proxy:
+            # Push the configuration of the previous workers again, whatever was pushed.
+            self._stored.proxy_config_digest = None
+            self._reconcile_proxy(self._get_pebble_layer())
+
+    def _stop_backends(self):
+        """Stop the running backends: the router starts them again, with the new plan."""
+        names = [backend.service for backend in self._backends]
+        if not names:
+            return
+        service_info = self.container.get_services(*names)
+        running = [name for name, info in service_info.items() if info.is_running()]
+        if running:
+            self.container.stop(*running)
+
+    def _workers_status(self):
+        workers = self._worker_services
+        readiness = f"ready in {self._stored.readiness_time}s, warm-up {self._stored.warmup_time}s"
+        if len(workers) == 1:
+            return ActiveStatus(readiness)
+        service_info = self.container.get_services(*workers)
+        running = sum(1 for info in service_info.values() if info.is_running())
+        if running < len(workers):
+            return WaitingStatus(f"{running}/{len(workers)} workers running")
+        return ActiveStatus(f"{running} workers, {readiness}")
+
+    @property
+    def _workers(self) -> int:
+        workers = str(self.config.get("workers", "1"))
+        if workers != "auto":
+            return int(workers)
+        cpus = self._container_limits.cpus
+        return min(max(math.ceil(cpus) if cpus else os.cpu_count() or 1, 1), MAX_WORKERS)
+
+    @property
+    def _worker_services(self) -> list:
+        return self._worker_names(self._worker_slot)
+
+    def _worker_names(self, slot: int) -> list:
+        workers = self._workers
+        name = "mongo-express-green" if slot else "mongo-express"
+        if workers == 1:
+            return [name]
+        return [f"{name}-{index}" for index in range(workers)]
+
+    @property
+    def _worker_ports(self) -> list:
+        workers = self._workers
+        if workers == 1 and not self._proxy_enabled:
+            return [PORT]
+        base_port = WORKER_BASE_PORT + self._worker_slot * MAX_WORKERS
+        return [base_port + index for index in range(workers)]
+
+    @property
+    def _worker_slot(self) -> int:
+        return self._stored.worker_slot if self._blue_green else 0
+
+    @property
+    def _blue_green(self) -> bool:
+        return self.config.get("restart-strategy", "drain") == "blue-green"
+
+    @property
+    def _proxy_enabled(self) -> bool:
+        return bool(self.config.get("enable-proxy", False))
+
+    def _push_scripts(self, services, fresh: bool):
+        """Push the charm scripts run by the services of the layer, and config.js.
+
+        Args:
+            services: services of the layer.
+            fresh: whether the container is new, its plan empty, and missing every file.
+        """
+        import appconfig
+
+        if fresh:
+            # Pushed once the unit is ready again.
+            self._stored.pushed_files.pop(READY_PATH, None)
+        self._push_changed(appconfig.CONFIG_PATH, self._config_js, fresh)
+        self._push_changed(DRAIN_HOOK_PATH, self._charm_file("drain-hook.js"), fresh)
+        if BALANCER_SERVICE in services:
+            self._push_balancer()
+        if EXPORTER_SERVICE in services:
+            self._push_metrics_scripts()
+        if LOG_FORWARDER_SERVICE in services:
+            self._push_changed(LOG_FORWARDER_PATH, self._charm_file("log-forwarder.js"), fresh)
+        if self._stored.workload_profile:
+            self._push_changed(PROFILE_HOOK_PATH, self._charm_file("profile-hook.js"), fresh)
+        if self._backends:
+            import backends
+
+            self.container.push(
+                backends.ROUTER_PATH, self._charm_file("router.js"), make_dirs=True
+            )
+
+    def _push_changed(self, path: str, content: str, fresh: bool):
+        """Push content to path, unless it is the content last pushed there."""
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        if fresh or self._stored.pushed_files.get(path) != digest:
+            self.container.push(path, content, make_dirs=True)
+            self._stored.pushed_files[path] = digest
+
+    @property
+    def _config_js(self) -> str:
+        import appconfig
+
+        return appconfig.render_config(
+            documents_per_page=self.config.get("documents-per-page", 10),
+            max_prop_size=parse_size(self.config.get("max-prop-size", "100kb")),
+            max_row_size=parse_size(self.config.get("max-row-size", "1mb")),
+            export=self.config.get("enable-export", True),
+        )
+
+    def _push_metrics_scripts(self):
+        self.container.push(EXPORTER_PATH, self._charm_file("exporter.js"), make_dirs=True)
+        self.container.push(METRICS_HOOK_PATH, self._charm_file("metrics-hook.js"), make_dirs=True)
+
+    def _push_charm_metrics(self):
+        """Push the charm metrics served by the exporter, at the end of every hook they changed."""
+        if not self.metrics.enabled or not self.container.can_connect():
+            return
+        rendered = render_metrics(self._charm_metrics())
+        # An empty plan is a new container: the metrics pushed before are gone.
+        self._push_changed(CHARM_METRICS_PATH, rendered, fresh=not self.services)
+
+    def _charm_metrics(self) -> list:
+        """Return the charm metrics; labels only take a handful of values, for any unit count."""
+        import health
+
+        durations = self._stored.handler_durations
+        summary = health.summarise(self._stored.probe_samples)
+        probes = {"http": summary.http_p95, "mongodb": summary.mongodb_p95}
+        return [
+            Metric(
+                "mongo_express_charm_restarts_total",
+                "counter",
+                "Restarts and replans of mongo-express done by the unit.",
+                [({}, self._stored.restarts)],
+            ),
+            Metric(
+                "mongo_express_charm_last_restart_seconds",
+                "gauge",
+                "Time the last restart took for mongo-express to be ready, and to warm up.",
+                [
+                    ({"phase": "ready"}, self._stored.readiness_time),
+                    ({"phase": "warmup"}, self._stored.warmup_time),
+                ],
+            ),
+            Metric(
+                "mongo_express_charm_handler_duration_seconds",
+                "gauge",
+                "Mean and maximum duration of the charm handlers, over their last calls.",
+                [
+                    ({"handler": name, "stat": stat}, value)
+                    for name in sorted(durations)
+                    for stat, value in zip(("mean", "max"), durations[name])
+                ],
+            ),
+            Metric(
+                "mongo_express_charm_deferred_events",
+                "gauge",
+                "Events deferred until the Pebble socket is available.",
+                [({}, int(self._stored.deferred_event is not None))],
+            ),
+            Metric(
+                "mongo_express_charm_events_total",
+                "counter",
+                "Events coalesced into a pending reconcile, or dropped.",
+                [({"outcome": outcome}, count) for outcome, count in self.event_counters.items()],
+            ),
+            Metric(
+                "mongo_express_charm_workers",
+                "gauge",
+                "mongo-express processes configured in the unit.",
+                [({}, self._workers)],
+            ),
+            Metric(
+                "mongo_express_charm_mongodb_members",
+                "gauge",
+                "MongoDB members configured as the backend.",
+                [({}, len(self.mongodb.hosts) or 1)],
+            ),
+            Metric(
+                "mongo_express_charm_backends",
+                "gauge",
+                "Named MongoDB backends served by the unit, 0 without named backends.",
+                [({}, len(self._backends))],
+            ),
+            Metric(
+                "mongo_express_charm_mongodb_max_pool_size",
+                "gauge",
+                "Configured MongoDB connection pool size, 0 for the driver default.",
+                [({}, self.config.get("mongodb-max-pool-size", 0))],
+            ),
+            Metric(
+                "mongo_express_charm_probe_p95_seconds",
+                "gauge",
+                "p95 latency of the update-status probes.",
+                [
+                    ({"target": target}, None if latency is None else latency / 1000)
+                    for target, latency in probes.items()
+                ],
+            ),
+        ]
+
+    def _push_balancer(self):
+        self.container.push(BALANCER_PATH, self._balancer_script, make_dirs=True)
+
+    @property
+    def _balancer_script(self) -> str:
+        return self._charm_file("balancer.js")
+
+    def _charm_file(self, name: str) -> str:
+        return (self.charm_dir / "files" / name).read_text()
+
+    def _get_pebble_layer(self):
+        layer = {
             "summary": "mongo express layer",
             "description": "pebble config layer for httpbin",
             "services": {
                 "mongo-express": {
                     "override": "replace",
                     "summary": "mongo-express service",
-                    "command": "tini -s -- /docker-entrypoint.sh",
+                    "command": self._node_command,
                     "startup": "enabled",
                     "environment": {
                         "ME_CONFIG_MONGODB_SERVER": self._mongo_url,
@@ -159,11 +1155,11 @@ class MongoExpressCharm(CharmBase):
                         # "ME_CONFIG_MONGODB_AUTH_USERNAME": "",
                         # "ME_CONFIG_MONGODB_AUTH_PASSWORD": "",
                         "ME_CONFIG_SITE_BASEURL": "/",
-                        "ME_CONFIG_SITE_COOKIESECRET": "cookiesecret",
-                        "ME_CONFIG_SITE_SESSIONSECRET": "sessionsecret",
+                        "ME_CONFIG_SITE_COOKIESECRET": self.cluster.cookie_secret,
+                        "ME_CONFIG_SITE_SESSIONSECRET": self.cluster.session_secret,
                         "ME_CONFIG_BASICAUTH_USERNAME": self.config["web-username"],
                         "ME_CONFIG_BASICAUTH_PASSWORD": self.cluster.web_password,
-                        # "ME_CONFIG_REQUEST_SIZE": "100kb",
+                        "ME_CONFIG_REQUEST_SIZE": self.config.get("request-size", "100kb"),
                         "ME_CONFIG_OPTIONS_EDITORTHEME": self.config["editor-theme"],
                         "ME_CONFIG_OPTIONS_READONLY": self.config["read-only"],
                         # "ME_CONFIG_SITE_SSL_ENABLED": False,
@@ -178,9 +1174,277 @@ class MongoExpressCharm(CharmBase):
                 }
             },
         }
+        environment = layer["services"]["mongo-express"]["environment"]
+        connection_url = self.mongodb.connection_url
+        if connection_url:
+            # mongo-express ignores the connection URL whenever a server is set.
+            del environment["ME_CONFIG_MONGODB_SERVER"]
+            del environment["ME_CONFIG_MONGODB_PORT"]
+            environment["ME_CONFIG_MONGODB_URL"] = connection_url
+        environment.update(self._node_environment)
+        # Every mongo-express process can be drained before it is restarted.
+        options = environment.get("NODE_OPTIONS", "").split()
+        environment["NODE_OPTIONS"] = " ".join(options + [f"--require={DRAIN_HOOK_PATH}"])
+        environment["DRAIN_DIR"] = DRAIN_DIR
+        # Restart mongo-express when its config.js, or the preloaded drain hook the charm
+        # ships, changes: the reconcile pushes them then, after an upgrade too.
+        config_js = self._config_js.encode("utf-8")
+        environment["CONFIG_JS_DIGEST"] = hashlib.sha256(config_js).hexdigest()
+        drain_hook = self._charm_file("drain-hook.js").encode("utf-8")
+        environment["DRAIN_HOOK_DIGEST"] = hashlib.sha256(drain_hook).hexdigest()
+        if self._backends:
+            self._split_backends(layer)
+        elif self._workers > 1 or self._proxy_enabled:
+            self._split_workers(layer)
+        if self._stored.workload_profile:
+            self._add_profiling(layer)
+        if self.metrics.enabled:
+            self._add_exporter(layer)
+        if self.logging.endpoints:
+            self._add_log_forwarder(layer)
+        layer["checks"] = self._get_pebble_checks(environment["ME_CONFIG_SITE_BASEURL"])
+        return layer
+
+    def _get_pebble_checks(self, base_url: str) -> dict:
+        """Return ready checks on the endpoint and the ready set, and an alive check per worker."""
+        checks = {
+            "mongo-express-ready": {
+                "override": "replace",
+                "level": "ready",
+                "http": {
+                    "url": f"http://localhost:{PORT}{base_url}",
+                    "headers": self._auth_headers,
+                },
+            },
+            # Takes the pod out of the Service endpoints as soon as the unit leaves the ready
+            # set, such as before draining its workers.
+            "mongo-express-serving": {
+                "override": "replace",
+                "level": "ready",
+                "period": f"{READY_CHECK_PERIOD}s",
+                "timeout": "1s",
+                "threshold": 1,
+                "exec": {"command": f"test -f {READY_PATH}"},
+            },
+        }
+        # Named after the slot 0 workers: Pebble cannot remove checks from the plan, and
+        # blue/green restarts would otherwise leave failing ones behind.
+        for name, port in zip(self._worker_names(0), self._worker_ports):
+            checks[f"{name}-alive"] = {
+                "override": "replace",
+                "level": "alive",
+                "tcp": {"port": port},
+            }
+        return checks
+
+    def _split_workers(self, layer):
+        """Replace the mongo-express service by one service per worker on the worker ports.
+
+        Without the proxy, a balancer fronts the workers on PORT.
+        """
+        service = layer["services"].pop("mongo-express")
+        ports = self._worker_ports
+        for index, (name, port) in enumerate(zip(self._worker_services, ports)):
+            layer["services"][name] = dict(
+                service, environment=dict(service["environment"], VCAP_APP_PORT=port)
+            )
+            if len(ports) > 1:
+                layer["services"][name]["summary"] = f"mongo-express worker {index}"
+        if len(ports) == 1 or self._proxy_enabled:
+            return
+        script_digest = hashlib.sha256(self._balancer_script.encode("utf-8")).hexdigest()
+        layer["services"][BALANCER_SERVICE] = {
+            "override": "replace",
+            "summary": "mongo-express workers load balancer",
+            "command": f"node {BALANCER_PATH}",
+            "startup": "enabled",
+            "environment": {
+                "BALANCER_PORT": PORT,
+                "BALANCER_BACKENDS": ",".join(str(port) for port in ports),
+                # Restart the balancer when the charm ships a new script.
+                "BALANCER_SCRIPT_DIGEST": script_digest,
+            },
+        }
+
+    def _split_backends(self, layer):
+        """Replace the mongo-express service by one on-demand service per named backend.
+
+        The mongo-express service becomes the router, serving each backend under its name.
+        """
+        import backends
+
+        service = layer["services"]["mongo-express"]
+        routes = {}
+        for backend in self._backends:
+            excluded = {"ME_CONFIG_MONGODB_SERVER", "ME_CONFIG_MONGODB_URL"}
+            if "ME_CONFIG_MONGODB_URL" in backend.environment:
+                excluded.add("ME_CONFIG_MONGODB_PORT")
+            environment = {
+                key: value for key, value in service["environment"].items() if key not in excluded
+            }
+            environment.update(
+                backend.environment,
+                ME_CONFIG_SITE_BASEURL=backend.base_url,
+                VCAP_APP_PORT=backend.port,
+            )
+            layer["services"][backend.service] = dict(
+                service,
+                summary=f"mongo-express backend {backend.name}",
+                startup="disabled",
+                environment=environment,
+            )
+            routes[backend.name] = {"service": backend.service, "port": backend.port}
+        script_digest = hashlib.sha256(self._charm_file("router.js").encode("utf-8")).hexdigest()
+        layer["services"]["mongo-express"] = {
+            "override": "replace",
+            "summary": "mongo-express backends router",
+            "command": f"node {backends.ROUTER_PATH}",
+            "startup": "enabled",
+            "environment": {
+                "ROUTER_PORT": PORT,
+                "ROUTER_BACKENDS": json.dumps(routes, sort_keys=True),
+                "ROUTER_IDLE_TIMEOUT": self.config.get("backend-idle-timeout", 900),
+                "ROUTER_AUTHORIZATION": self._auth_headers["Authorization"],
+                # Restart the router when the charm ships a new script.
+                "ROUTER_SCRIPT_DIGEST": script_digest,
+            },
+        }
+
+    @property
+    def _backends(self) -> list:
+        import backends
+
+        try:
+            parsed = backends.parse(self.config.get("mongo-url"), self._stored.backend_ports)
+        except ValueError:
+            return []
+        # Each backend keeps its port for as long as it is configured.
+        ports = {backend.name: backend.port for backend in parsed}
+        if ports != dict(self._stored.backend_ports):
+            self._stored.backend_ports = ports
+        return parsed
+
+    def _add_profiling(self, layer):
+        """Preload the profile hook in the mongo-express processes, for the requested run."""
+        import runtime
+
+        profile = self._stored.workload_profile
+        directory = f"{WORKLOAD_PROFILE_DIR}/{profile['name']}"
+        for name in self._profiled_services:
+            environment = layer["services"][name]["environment"]
+            options = environment.get("NODE_OPTIONS", "").split()
+            environment["NODE_OPTIONS"] = " ".join(options + [f"--require={PROFILE_HOOK_PATH}"])
+            environment.update(
+                runtime.profiling_environment(
+                    directory, name, profile["duration"], cpu=profile["cpu"], heap=profile["heap"]
+                )
+            )
+
+    def _add_exporter(self, layer):
+        """Preload the request metrics hook in the workers, and add the exporter service."""
+        services = layer["services"]
+        hook = self._charm_file("metrics-hook.js")
+        for name in self._worker_services:
+            environment = services[name]["environment"]
+            options = environment.get("NODE_OPTIONS", "").split()
+            environment["NODE_OPTIONS"] = " ".join(options + [f"--require={METRICS_HOOK_PATH}"])
+            environment["METRICS_DIR"] = METRICS_DIR
+            # Restart the workers preloading the hook when the charm ships a new one.
+            environment["METRICS_HOOK_DIGEST"] = hashlib.sha256(hook.encode("utf-8")).hexdigest()
+        scripts = self._charm_file("exporter.js") + hook
+        services[EXPORTER_SERVICE] = {
+            "override": "replace",
+            "summary": "mongo-express prometheus exporter",
+            "command": f"node {EXPORTER_PATH}",
+            "startup": "enabled",
+            "environment": {
+                "METRICS_PORT": METRICS_PORT,
+                "METRICS_DIR": METRICS_DIR,
+                # Restart the exporter and the workers when the charm ships new scripts.
+                "METRICS_SCRIPTS_DIGEST": hashlib.sha256(scripts.encode("utf-8")).hexdigest(),
+            },
+        }
+
+    def _add_log_forwarder(self, layer):
+        """Add the service forwarding the logs of the other services to Loki."""
+        services = layer["services"]
+        followed = sorted(name for name in services if name != EXPORTER_SERVICE)
+        script = self._charm_file("log-forwarder.js").encode("utf-8")
+        services[LOG_FORWARDER_SERVICE] = {
+            "override": "replace",
+            "summary": "mongo-express log forwarder",
+            "command": f"node {LOG_FORWARDER_PATH}",
+            "startup": "enabled",
+            "environment": {
+                "LOG_LOKI_URLS": json.dumps(self.logging.endpoints),
+                "LOG_SERVICES": ",".join(followed),
+                "LOG_LABELS": json.dumps(self.logging.labels(), sort_keys=True),
+                "LOG_BATCH_SIZE": self.config.get("log-batch-size", 500),
+                "LOG_FLUSH_INTERVAL_MS": self.config.get("log-flush-interval-ms", 1000),
+                "LOG_BUFFER_SIZE": self.config.get("log-buffer-size", 10000),
+                "LOG_STATS_PATH": LOG_STATS_PATH,
+                # Restart the forwarder when the charm ships a new script.
+                "LOG_FORWARDER_DIGEST": hashlib.sha256(script).hexdigest(),
+            },
+        }
+        if EXPORTER_SERVICE in services:
+            # The exporter serves the forwarder counters, only while the forwarder runs.
+            services[EXPORTER_SERVICE]["environment"]["LOG_STATS_PATH"] = LOG_STATS_PATH
 
     def _set_pebble_layer(self, layer):
-        self.container.add_layer("mongo-express", layer, combine=True)
+        import reconcile
+
+        self.snapshot.add_layer(self.container, "mongo-express", layer)
+        self._stored.checks_fingerprint = reconcile.fingerprint(layer.get("checks", {}))
+
+    @property
+    def _container_limits(self) -> "runtime.CgroupLimits":
+        import runtime
+
+        if self._cgroup_limits is None:
+            self._cgroup_limits = runtime.read_cgroup_limits(self._read_workload_file)
+            logger.debug(f"mongo-express container limits: {self._cgroup_limits}")
+        return self._cgroup_limits
+
+    @property
+    def _process_limits(self) -> "runtime.CgroupLimits":
+        import runtime
+
+        # Every worker, or backend, gets an equal share of the container resources.
+        limits = self._container_limits
+        workers = len(self._backends) or self._workers
+        return runtime.CgroupLimits(
+            memory=limits.memory // workers if limits.memory else None,
+            cpus=limits.cpus / workers if limits.cpus else None,
+        )
+
+    @property
+    def _node_environment(self):
+        import runtime
+
+        return runtime.node_environment(
+            self._process_limits,
+            max_old_space_size=self.config.get("node-max-old-space-size", 0),
+            max_semi_space_size=self.config.get("node-max-semi-space-size", 0),
+            uv_threadpool_size=self.config.get("uv-threadpool-size", 0),
+        )
+
+    @property
+    def _node_command(self) -> str:
+        """Return the mongo-express command, with the V8 options not allowed in NODE_OPTIONS."""
+        import runtime
+
+        arguments = runtime.node_arguments(
+            self._process_limits,
+            max_semi_space_size=self.config.get("node-max-semi-space-size", 0),
+        )
+        return " ".join(["tini -s -- node", *arguments, MONGO_EXPRESS_APP_PATH])
+
+    def _read_workload_file(self, path: str):
+        try:
+            return self.container.pull(path).read()
+        except (PathError, ConnectionError):
+            return None
 
     @property
     def _mongo_url(self):
@@ -3,10 +3,20 @@
 
 """Mongo Express cluster module."""
 
+import hashlib
+import json
 import logging
+import time
 
-from ops.charm import CharmEvents, RelationChangedEvent, RelationCreatedEvent
-from ops.framework import EventBase, EventSource, Object
+from ops.charm import (
+    CharmEvents,
+    RelationChangedEvent,
+    RelationCreatedEvent,
+    RelationDepartedEvent,
+)
+from ops.framework import EventBase, EventSource, Object, StoredState
+
+from instrumentation import instrumented
 
 logger = logging.getLogger(__name__)
 
@@ -19,44 +29,279 @@ class WebPasswordChangeEvent(EventBase):
     """Event triggered when the web-password is set or changed."""
 
 
+class SiteSecretsChangeEvent(EventBase):
+    """Event triggered when the cookie and session secrets are set or rotated."""
+
+
+class RestartGrantedEvent(EventBase):
+    """Event triggered when this unit is granted the restart lock."""
+
+
 class MongoExpressClusterEvents(CharmEvents):
     """Custom charm events."""
 
     cluster_ready = EventSource(MongoExpressClusterReadyEvent)
     web_password_changed = EventSource(WebPasswordChangeEvent)
+    site_secrets_changed = EventSource(SiteSecretsChangeEvent)
+    restart_granted = EventSource(RestartGrantedEvent)
 
 
 class MongoExpressCluster(Object):
     """Mongo Express Cluster (peer) relation."""
 
+    _stored = StoredState()
+
     def __init__(self, charm):
         super().__init__(charm, "cluster")
         self.charm = charm
         event_observe_mapping = {
             self.charm.on.cluster_relation_created: self._on_cluster_relation_created,
             self.charm.on.cluster_relation_changed: self._on_cluster_relation_changed,
+            self.charm.on.cluster_relation_departed: self._on_cluster_relation_departed,
         }
         for event, observer in event_observe_mapping.items():
             self.framework.observe(event, observer)
+        self._stored.set_default(digests={}, duplicate_events=0)
 
+    @instrumented
     def _on_cluster_relation_created(self, _: RelationCreatedEvent):
         self.charm.on.cluster_ready.emit()
 
+    @instrumented
     def _on_cluster_relation_changed(self, event: RelationChangedEvent):
         if self.framework.model.app in event.relation.data:
-            app_relation_data = event.relation.data[self.framework.model.app]
-            if app_relation_data.get("web-password"):
-                self.charm.on.web_password_changed.emit()
+            snapshot, app = self.charm.snapshot, self.framework.model.app
+            password = snapshot.get(event.relation, app, "web-password")
+            if password:
+                self._announce("web-password", password, self.charm.on.web_password_changed)
+            cookie_secret = snapshot.get(event.relation, app, "cookie-secret")
+            session_secret = snapshot.get(event.relation, app, "session-secret")
+            if cookie_secret and session_secret:
+                self._announce(
+                    "site-secrets",
+                    f"{cookie_secret}:{session_secret}",
+                    self.charm.on.site_secrets_changed,
+                )
+        if self.framework.model.unit.is_leader():
+            self._grant_restarts()
+        if self.restart_pending and self.has_restart_lock:
+            self.charm.on.restart_granted.emit()
+
+    @instrumented
+    def _on_cluster_relation_departed(self, _: RelationDepartedEvent):
+        if self.framework.model.unit.is_leader():
+            self._grant_restarts()
 
     def set_web_password(self, password: str):
         """Set web password."""
-        self.relation.data[self.framework.model.app]["web-password"] = password
-        self.charm.on.web_password_changed.emit()
+        self.charm.snapshot.set(self.relation, self.framework.model.app, "web-password", password)
+        self._announce("web-password", password, self.charm.on.web_password_changed)
+
+    def set_site_secrets(self, cookie_secret: str, session_secret: str):
+        """Set the cookie and session secrets shared by all the units."""
+        relation, app = self.relation, self.framework.model.app
+        self.charm.snapshot.set(relation, app, "cookie-secret", cookie_secret)
+        self.charm.snapshot.set(relation, app, "session-secret", session_secret)
+        self._announce(
+            "site-secrets", f"{cookie_secret}:{session_secret}", self.charm.on.site_secrets_changed
+        )
+
+    def request_restart(self) -> bool:
+        """Ask the leader for the restart lock.
+
+        A unit whose grant was revoked requests the lock anew, queueing behind the others.
+
+        Returns:
+            True if this unit holds the restart lock and may restart right away.
+        """
+        relation = self.relation
+        if relation is not None and (not self.restart_pending or self.restart_revoked):
+            self.charm.snapshot.set(
+                relation, self.framework.model.unit, "restart-request", str(time.time())
+            )
+            logger.info("restart lock requested")
+        if self.framework.model.unit.is_leader():
+            self._grant_restarts()
+        return self.has_restart_lock
+
+    def release_restart(self):
+        """Give the restart lock back so that the leader can grant it to another unit."""
+        relation = self.relation
+        if relation is None:
+            return
+        self.charm.snapshot.set(relation, self.framework.model.unit, "restart-request", None)
+        logger.info("restart lock released")
+        if self.framework.model.unit.is_leader():
+            self._grant_restarts()
+
+    def set_ready(self, ready: bool):
+        """Add this unit to, or remove it from, the set of units ready to serve requests."""
+        relation = self.relation
+        if relation is None:
+            return
+        self.charm.snapshot.set(
+            relation, self.framework.model.unit, "ready", "true" if ready else None
+        )
+
+    @property
+    def is_ready(self) -> bool:
+        """Return True if this unit is in the set of units ready to serve requests."""
+        relation = self.relation
+        return bool(
+            relation and self.charm.snapshot.get(relation, self.framework.model.unit, "ready")
+        )
+
+    @property
+    def ready_units(self) -> list:
+        """Return the names of the units ready to serve requests."""
+        relation = self.relation
+        if relation is None:
+            return []
+        return sorted(
+            unit.name
+            for unit in relation.units | {self.framework.model.unit}
+            if self.charm.snapshot.get(relation, unit, "ready") == "true"
+        )
+
+    @property
+    def restart_pending(self) -> bool:
+        """Return True if this unit has requested the restart lock and not released it."""
+        relation = self.relation
+        return bool(
+            relation
+            and self.charm.snapshot.get(relation, self.framework.model.unit, "restart-request")
+        )
+
+    @property
+    def restart_revoked(self) -> bool:
+        """Return True if the leader revoked the grant of the pending request of this unit."""
+        relation = self.relation
+        if relation is None:
+            return False
+        unit = self.framework.model.unit
+        request = self.charm.snapshot.get(relation, unit, "restart-request")
+        return bool(request) and self._revoked.get(unit.name) == request
+
+    @property
+    def has_restart_lock(self) -> bool:
+        """Return True if this unit is allowed to restart its service."""
+        relation = self.relation
+        if relation is None or not relation.units:
+            return True
+        return self.framework.model.unit.name in self.restart_grants
+
+    @property
+    def restart_grants(self) -> list:
+        """Return the units currently allowed to restart."""
+        return list(self._grants)
+
+    @property
+    def _grants(self) -> dict:
+        """Return the time each unit currently allowed to restart was granted the lock."""
+        relation = self.relation
+        if relation is None:
+            return {}
+        grants = json.loads(
+            self.charm.snapshot.get(relation, self.framework.model.app, "restart-grants") or "{}"
+        )
+        # Grants written without their time count from now.
+        return dict.fromkeys(grants, time.time()) if isinstance(grants, list) else grants
+
+    @property
+    def _revoked(self) -> dict:
+        """Return the requests whose grant was revoked, by unit name."""
+        relation = self.relation
+        if relation is None:
+            return {}
+        revoked = self.charm.snapshot.get(relation, self.framework.model.app, "restart-revoked")
+        return json.loads(revoked or "{}")
+
+    def check_restart_grants(self):
+        """Revoke the grants held for longer than restart-lock-timeout; leader only."""
+        if self.framework.model.unit.is_leader():
+            self._grant_restarts()
+
+    def _grant_restarts(self):
+        """Grant the restart lock to the oldest requests, up to max-concurrent-restarts.
+
+        A unit holding the lock for longer than restart-lock-timeout, typically because it
+        never became ready again, loses it, so that the other units can go on restarting.
+        It is not granted the lock again until it requests it anew.
+        """
+        relation = self.relation
+        if relation is None:
+            return
+        requests = {}
+        for unit in relation.units | {self.framework.model.unit}:
+            request = self.charm.snapshot.get(relation, unit, "restart-request")
+            if request:
+                requests[unit.name] = request
+        grants = {name: granted for name, granted in self._grants.items() if name in requests}
+        revoked = {
+            name: request
+            for name, request in self._revoked.items()
+            if requests.get(name) == request
+        }
+        self._revoke_stale_grants(grants, revoked, requests)
+        waiting = sorted(
+            (float(request), name)
+            for name, request in requests.items()
+            if name not in grants and name not in revoked
+        )
+        limit = max(int(self.charm.config.get("max-concurrent-restarts", 1)), 1)
+        for _, name in waiting[: max(limit - len(grants), 0)]:
+            grants[name] = time.time()
+            logger.info(f"restart lock granted to {name}")
+        app = self.framework.model.app
+        if grants != self._grants:
+            self.charm.snapshot.set(
+                relation, app, "restart-grants", json.dumps(grants) if grants else None
+            )
+        if revoked != self._revoked:
+            self.charm.snapshot.set(
+                relation, app, "restart-revoked", json.dumps(revoked) if revoked else None
+            )
+
+    def _revoke_stale_grants(self, grants: dict, revoked: dict, requests: dict):
+        """Move the grants older than restart-lock-timeout from grants to revoked."""
+        timeout = self.charm.config.get("restart-lock-timeout", 600)
+        if not timeout:
+            return
+        for name, granted in list(grants.items()):
+            if time.time() - granted > timeout:
+                logger.warning(f"restart lock of {name} revoked, held for over {timeout}s")
+                del grants[name]
+                revoked[name] = requests[name]
+
+    @property
+    def duplicate_events(self) -> int:
+        """Return the number of change events suppressed as duplicates."""
+        return self._stored.duplicate_events
+
+    def _announce(self, key: str, value: str, event):
+        """Emit event, unless this unit has already announced the same value for key."""
+        digest = hashlib.sha256(value.encode("utf-8")).hexdigest()
+        if digest == self._stored.digests.get(key):
+            self._stored.duplicate_events += 1
+            logger.debug(f"{key} unchanged, {event.event_kind} not emitted")
+            return
+        self._stored.digests[key] = digest
+        event.emit()
 
     @property
     def web_password(self):
         """Return web password."""
-        return self.relation.data[self.framework.model.app].get("web-password")
+        return self.charm.snapshot.get(self.relation, self.framework.model.app, "web-password")
+
+    @property
+    def cookie_secret(self):
+        """Return cookie secret."""
+        return self.charm.snapshot.get(self.relation, self.framework.model.app, "cookie-secret")
+
+    @property
+    def session_secret(self):
+        """Return session secret."""
+        return self.charm.snapshot.get(self.relation, self.framework.model.app, "session-secret")
 
     @property
     def relation(self):
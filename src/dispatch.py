@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mongo Express charm entry point.
+
+Juju runs the entry point as __main__ for every hook, and Python never caches the
+bytecode of __main__: keep it minimal, so that the charm module is compiled once.
+"""
+
+from ops.main import main
+
+from charm import MongoExpressCharm
+
+if __name__ == "__main__":  # pragma: no-cover
+    main(MongoExpressCharm, use_juju_for_storage=True)
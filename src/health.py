@@ -0,0 +1,71 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mongo Express health module.
+
+Summarise the latencies of the periodic probes of mongo-express and its MongoDB backend,
+and tell whether the unit is degraded.
+"""
+
+from typing import List, NamedTuple, Optional, Sequence
+
+from utils import percentile
+
+# Number of probes (one per update-status) kept for the rolling summary.
+WINDOW = 10
+DEGRADED = "degraded"
+
+
+class Summary(NamedTuple):
+    """Rolling summary of the probes; latencies are in milliseconds."""
+
+    probes: int
+    errors: int
+    http_p95: Optional[float]
+    mongodb_p95: Optional[float]
+
+    @property
+    def error_rate(self) -> float:
+        """Return the share of the probes that failed."""
+        return self.errors / self.probes if self.probes else 0.0
+
+    @property
+    def message(self) -> str:
+        """Return the latencies as reported in the unit status, e.g. "p95 42ms"."""
+        parts = []
+        if self.http_p95 is not None:
+            parts.append(f"p95 {self.http_p95:.0f}ms")
+        if self.mongodb_p95 is not None:
+            parts.append(f"mongodb p95 {self.mongodb_p95:.0f}ms")
+        return ", ".join(parts)
+
+
+def summarise(samples: Sequence[Sequence[Optional[float]]]) -> Summary:
+    """Summarise probe samples, each the HTTP and MongoDB latencies or None if they failed."""
+    http_latencies: List[float] = [http for http, _ in samples if http is not None]
+    mongodb_latencies: List[float] = [mongodb for _, mongodb in samples if mongodb is not None]
+    return Summary(
+        probes=len(samples),
+        errors=sum(1 for sample in samples if None in sample),
+        http_p95=percentile(http_latencies, 95),
+        mongodb_p95=percentile(mongodb_latencies, 95),
+    )
+
+
+def check(summary: Summary, latency_threshold: int, error_threshold: int) -> Optional[str]:
+    """Return why the unit is degraded, or None if it is healthy.
+
+    Args:
+        summary: rolling summary of the probes.
+        latency_threshold: p95 latency in milliseconds above which the unit is degraded,
+            0 to ignore the latencies.
+        error_threshold: percentage of failed probes above which the unit is degraded,
+            0 to ignore the errors.
+    """
+    if error_threshold and summary.error_rate * 100 > error_threshold:
+        return f"{summary.error_rate:.0%} probes failed"
+    if latency_threshold:
+        for name, latency in (("p95", summary.http_p95), ("mongodb p95", summary.mongodb_p95)):
+            if latency is not None and latency > latency_threshold:
+                return f"{name} {latency:.0f}ms over {latency_threshold}ms"
+    return None
@@ -0,0 +1,77 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mongo Express ingress module.
+
+Provide the ingress relation requirer: the leader publishes the Kubernetes Service of the
+application, which the ingress routes to. The Service only routes to the ready pods, those
+of the units in the ready set (see the serving check of the pebble layer).
+"""
+
+import logging
+
+from ops.charm import RelationBrokenEvent
+from ops.framework import Object
+
+from instrumentation import instrumented
+from utils import PORT, parse_size
+
+logger = logging.getLogger(__name__)
+
+# Lifetime of the session affinity cookie, in seconds: mongo-express keeps the sessions in the
+# memory of each process, so the ingress keeps each browser on the unit holding its session.
+SESSION_COOKIE_MAX_AGE = 86400
+
+
+def max_body_size(config) -> int:
+    """Return the largest request body the units accept, in bytes; 0 for no limit.
+
+    GridFS uploads, when enabled, may be larger than request-size, the limit of the other
+    requests, so the ingress must let them through too.
+    """
+    size = parse_size(config.get("request-size", "100kb"))
+    if config.get("enable-gridfs"):
+        upload_size = parse_size(config.get("gridfs-max-upload-size", "16mb"))
+        size = 0 if upload_size == 0 else max(size, upload_size)
+    return size
+
+
+class IngressRequires(Object):
+    """ingress relation requirer.
+
+    The ingress only reads the application data bag, published by the leader. Its
+    max-body-size is in megabytes, so the largest request body is rounded up to one.
+    """
+
+    def __init__(self, charm, relation_name: str = "ingress"):
+        super().__init__(charm, relation_name)
+        self.charm = charm
+        self.relation_name = relation_name
+        self._broken = False
+        self.framework.observe(charm.on[relation_name].relation_broken, self._on_relation_broken)
+
+    @instrumented
+    def _on_relation_broken(self, _: RelationBrokenEvent):
+        self._broken = True
+
+    def publish(self):
+        """Publish the service to every ingress relation, if leader."""
+        relations = self.model.relations[self.relation_name]
+        if self._broken or not relations or not self.model.unit.is_leader():
+            return
+        import schema
+
+        # An invalid config blocks the unit, which keeps publishing the last valid one.
+        if schema.validate(self.charm.config) is not None:
+            return
+        app = self.model.app
+        config = {
+            "service-hostname": self.charm.config.get("ingress-hostname") or app.name,
+            "service-name": app.name,
+            "service-port": str(PORT),
+            "max-body-size": str(-(-max_body_size(self.charm.config) // (1 << 20))),
+            "session-cookie-max-age": str(SESSION_COOKIE_MAX_AGE),
+        }
+        for relation in relations:
+            for key, value in config.items():
+                self.charm.snapshot.set(relation, app, key, value)
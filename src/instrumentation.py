@@ -0,0 +1,213 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mongo Express instrumentation module.
+
+Measure where the hook time goes: the wall time, Pebble API calls and relation data reads
+and writes of every observer, and, while the profile-hooks option is set, a cProfile of the
+whole dispatch.
+"""
+
+import functools
+import json
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from ops.framework import Object, StoredState
+from ops.model import Container
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = "/var/tmp/mongo-express-charm/profiles"
+MAX_PROFILES = 20
+# Number of samples kept per handler for the rolling aggregates.
+WINDOW = 50
+DISPATCH = "dispatch"
+STARTUP = "startup"
+
+
+def hook_name() -> str:
+    """Return the name of the hook or action being dispatched."""
+    return os.environ.get("JUJU_DISPATCH_PATH", "").rpartition("/")[2] or "unknown"
+
+
+def handler_name(owner: Object, method: Callable) -> str:
+    """Return the name of an observer, e.g. "charm-config-changed"."""
+    name = method.__name__.lstrip("_")
+    if name.startswith("on_"):
+        name = name[3:]
+    return f"{owner.handle.key or 'charm'}-{name}".replace("_", "-")
+
+
+def instrumented(method: Callable) -> Callable:
+    """Decorate an observer so each call is measured by the charm instrumentation."""
+
+    @functools.wraps(method)
+    def wrapper(self, event):
+        charm = getattr(self, "charm", self)
+        with charm.instrumentation.measure(handler_name(self, method)):
+            return method(self, event)
+
+    return wrapper
+
+
+class _Measurement:
+    def __init__(self, instrumentation: "Instrumentation", name: str):
+        self._instrumentation = instrumentation
+        self._name = name
+
+    def __enter__(self):
+        self._start = self._instrumentation.sample()
+
+    def __exit__(self, *_):
+        self._instrumentation.record(self._name, self._start)
+
+
+class _CountedContainer:
+    """Container counting the Pebble API calls the charm makes through it."""
+
+    def __init__(self, container: Container, instrumentation: "Instrumentation"):
+        self._container = container
+        self._instrumentation = instrumentation
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._container, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def counted(*args, **kwargs):
+            self._instrumentation.pebble_calls += 1
+            return attribute(*args, **kwargs)
+
+        return counted
+
+
+class Instrumentation(Object):
+    """Count the Pebble and relation data round trips of the charm, and time its observers.
+
+    The Pebble API calls are counted on the containers returned by `container`, and the
+    relation data round trips by the dispatch snapshot of the charm.
+    """
+
+    _stored = StoredState()
+
+    def __init__(self, charm, key: str = "instrumentation"):
+        super().__init__(charm, key)
+        self.charm = charm
+        self._stored.set_default(samples={})
+        self.pebble_calls = 0
+        self._containers = {}
+        self._profiler = None
+        self._dispatch_start = self.sample()
+        if "JUJU_DISPATCH_PATH" in os.environ:
+            # CPU time spent by the process, from the interpreter start to the charm set up.
+            startup = self.sample()
+            startup[0] -= time.process_time()
+            self.record(f"{STARTUP}-{hook_name()}", startup)
+        if self.model.config.get("profile-hooks"):
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self.framework.observe(self.framework.on.pre_commit, self._on_pre_commit)
+        self.framework.observe(self.framework.on.commit, self._on_commit)
+
+    def container(self, container: Container) -> Container:
+        """Return container, counting the Pebble API calls made through it."""
+        if container.name not in self._containers:
+            self._containers[container.name] = _CountedContainer(container, self)
+        return self._containers[container.name]
+
+    def sample(self) -> List[float]:
+        """Return the current time and counters, to be passed to `record`."""
+        snapshot = self.charm.snapshot
+        return [
+            time.monotonic(),
+            self.pebble_calls,
+            snapshot.relation_reads,
+            snapshot.relation_writes,
+        ]
+
+    def measure(self, name: str):
+        """Return a context manager recording the time and round trips of its block."""
+        return _Measurement(self, name)
+
+    def record(self, name: str, start: List[float]):
+        """Record the time and round trips since start, as the latest sample of name.
+
+        Samples are inclusive: an observer emitting an event accounts for its handlers too.
+        """
+        end = self.sample()
+        sample = [round((end[0] - start[0]) * 1000, 3)] + [
+            int(value - initial) for initial, value in zip(start[1:], end[1:])
+        ]
+        samples = [list(previous) for previous in self._stored.samples.get(name, [])]
+        samples.append(sample)
+        self._stored.samples[name] = samples[-WINDOW:]
+        wall_ms, pebble_calls, relation_reads, relation_writes = sample
+        stats = {
+            "hook": hook_name(),
+            "handler": name,
+            "wall_ms": wall_ms,
+            "pebble_calls": pebble_calls,
+            "relation_reads": relation_reads,
+            "relation_writes": relation_writes,
+        }
+        logger.debug(f"handler stats {json.dumps(stats, sort_keys=True)}")
+
+    @property
+    def aggregates(self) -> Dict[str, Dict[str, float]]:
+        """Return the rolling aggregates of the recorded samples, per handler."""
+        aggregates = {}
+        for name, samples in self._stored.samples.items():
+            count = len(samples)
+            columns = list(zip(*samples))
+            aggregates[name] = {
+                "calls": count,
+                "mean-ms": round(sum(columns[0]) / count, 3),
+                "max-ms": max(columns[0]),
+                "mean-pebble-calls": round(sum(columns[1]) / count, 2),
+                "mean-relation-reads": round(sum(columns[2]) / count, 2),
+                "mean-relation-writes": round(sum(columns[3]) / count, 2),
+            }
+        return aggregates
+
+    def close(self):
+        """Stop profiling the dispatch, without saving the profile.
+
+        The dispatch profile is saved on commit; a Harness may be cleaned up before.
+        """
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler = None
+
+    def _on_pre_commit(self, _):
+        # Observed after the charm's pre_commit handler, where the reconcile runs;
+        # StoredState changes are no longer persisted once the commit event is emitted.
+        self.record(DISPATCH, self._dispatch_start)
+        self._dispatch_start = self.sample()
+
+    def _on_commit(self, _):
+        if self._profiler is None:
+            return
+        self._profiler.disable()
+        path = self._save_profile(self._profiler)
+        self._profiler = None
+        if path:
+            logger.info(f"dispatch profile saved to {path}")
+
+    def _save_profile(self, profiler) -> Optional[str]:
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{time.time_ns()}-{hook_name()}.prof")
+            profiler.dump_stats(path)
+            profiles = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith(".prof"))
+            for name in profiles[:-MAX_PROFILES]:
+                os.remove(os.path.join(PROFILE_DIR, name))
+        except OSError as e:
+            logger.warning(f"failed to save the dispatch profile: {e}")
+            return None
+        return path
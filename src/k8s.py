@@ -0,0 +1,204 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mongo Express Kubernetes module.
+
+Validate the CPU and memory quantities of the charm config, and patch them into the
+resources of the workload container of the application StatefulSet, through the
+Kubernetes API.
+"""
+
+import json
+import os
+import re
+import urllib.error
+import urllib.request
+from typing import Dict, Optional, Tuple
+
+SERVICE_ACCOUNT_DIR = "/var/run/secrets/kubernetes.io/serviceaccount"
+REQUEST_TIMEOUT = 30
+# Charm config option -> (resources section, resource name).
+RESOURCE_OPTIONS = {
+    "cpu-request": ("requests", "cpu"),
+    "cpu-limit": ("limits", "cpu"),
+    "memory-request": ("requests", "memory"),
+    "memory-limit": ("limits", "memory"),
+}
+CPU_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)(m?)$")
+MEMORY_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)([KMGT]i|[kMGT])?$")
+MEMORY_UNITS = {
+    None: 1,
+    "k": 10**3,
+    "M": 10**6,
+    "G": 10**9,
+    "T": 10**12,
+    "Ki": 1 << 10,
+    "Mi": 1 << 20,
+    "Gi": 1 << 30,
+    "Ti": 1 << 40,
+}
+
+
+class K8sError(Exception):
+    """Kubernetes API error."""
+
+
+def parse_cpu(value: str) -> Optional[float]:
+    """Return the millicores of a CPU quantity such as "500m" or "1.5", or None if invalid."""
+    match = CPU_PATTERN.match(str(value).strip())
+    if not match:
+        return None
+    number, milli = match.groups()
+    return float(number) if milli else float(number) * 1000
+
+
+def parse_memory(value: str) -> Optional[float]:
+    """Return the bytes of a memory quantity such as "512Mi" or "1G", or None if invalid."""
+    match = MEMORY_PATTERN.match(str(value).strip())
+    if not match:
+        return None
+    number, unit = match.groups()
+    return float(number) * MEMORY_UNITS[unit]
+
+
+def validate_cpu(value: str) -> Optional[str]:
+    """Return why value is not a CPU quantity, or None if it is one or empty."""
+    if value and parse_cpu(value) is None:
+        return "must be a number of CPUs, or of millicores followed by m."
+    return None
+
+
+def validate_memory(value: str) -> Optional[str]:
+    """Return why value is not a memory quantity, or None if it is one or empty."""
+    if value and parse_memory(value) is None:
+        return "must be a number of bytes, optionally followed by k, M, G, T, Ki, Mi, Gi or Ti."
+    return None
+
+
+def container_resources(config) -> Dict[str, Dict[str, str]]:
+    """Return the container resources set by the charm config; unset options are omitted."""
+    resources = {"limits": {}, "requests": {}}
+    for option, (section, name) in RESOURCE_OPTIONS.items():
+        value = str(config.get(option) or "").strip()
+        if value:
+            resources[section][name] = value
+    return resources
+
+
+def check_requests(config) -> Optional[Tuple[str, str]]:
+    """Return the first request option exceeding its limit and why, or None."""
+    for resource, parse in (("cpu", parse_cpu), ("memory", parse_memory)):
+        request, limit = config.get(f"{resource}-request"), config.get(f"{resource}-limit")
+        if request and limit and parse(request) > parse(limit):
+            return f"{resource}-request", f"must not exceed {resource}-limit."
+    return None
+
+
+def _quantity(name: str, value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    return parse_cpu(value) if name == "cpu" else parse_memory(value)
+
+
+class Client:
+    """Minimal Kubernetes API client, authenticated with the pod service account."""
+
+    def __init__(self, url: str, token: str, namespace: str, context=None):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.namespace = namespace
+        self.context = context
+
+    @classmethod
+    def in_cluster(cls, namespace: str) -> "Client":
+        """Return a client of the cluster the charm runs in.
+
+        Raises:
+            K8sError: if the charm does not run in a Kubernetes pod.
+        """
+        import ssl
+
+        host = os.environ.get("KUBERNETES_SERVICE_HOST")
+        port = os.environ.get("KUBERNETES_SERVICE_PORT", "443")
+        try:
+            with open(f"{SERVICE_ACCOUNT_DIR}/token") as token_file:
+                token = token_file.read().strip()
+        except OSError as e:
+            raise K8sError(f"cannot read the service account token: {e}")
+        if not host:
+            raise K8sError("KUBERNETES_SERVICE_HOST is not set")
+        context = ssl.create_default_context(cafile=f"{SERVICE_ACCOUNT_DIR}/ca.crt")
+        return cls(f"https://{host}:{port}", token, namespace, context)
+
+    def _request(self, method: str, path: str, body: dict = None, content_type: str = None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Authorization": f"Bearer {self.token}", "Accept": "application/json"}
+        if content_type:
+            headers["Content-Type"] = content_type
+        request = urllib.request.Request(
+            f"{self.url}{path}", data=data, headers=headers, method=method
+        )
+        try:
+            with urllib.request.urlopen(
+                request, timeout=REQUEST_TIMEOUT, context=self.context
+            ) as response:
+                return json.loads(response.read() or b"{}")
+        except urllib.error.HTTPError as e:
+            message = json.loads(e.read() or b"{}").get("message", e.reason)
+            raise K8sError(f"{method} {path}: {e.code} {message}")
+        except (urllib.error.URLError, OSError) as e:
+            raise K8sError(f"{method} {path}: {e}")
+
+    def _statefulset_path(self, name: str) -> str:
+        return f"/apis/apps/v1/namespaces/{self.namespace}/statefulsets/{name}"
+
+    def get_statefulset(self, name: str) -> dict:
+        """Return the StatefulSet called name."""
+        return self._request("GET", self._statefulset_path(name))
+
+    def patch_container_resources(
+        self, statefulset: str, container: str, resources: Dict[str, Dict[str, str]]
+    ) -> bool:
+        """Set the managed resources of a container of a StatefulSet, if they differ.
+
+        Resources missing from resources are removed, so unsetting an option unsets the
+        resource. Changing the pod template restarts the pods, one at a time.
+
+        Returns:
+            True if the StatefulSet was patched, False if it already had the resources.
+
+        Raises:
+            K8sError: if the API request failed, or the container does not exist.
+        """
+        spec = self.get_statefulset(statefulset)["spec"]["template"]["spec"]
+        current = next(
+            (
+                item.get("resources", {})
+                for item in spec["containers"]
+                if item["name"] == container
+            ),
+            None,
+        )
+        if current is None:
+            raise K8sError(f"container {container} not found in {statefulset}")
+        patch = {"limits": {}, "requests": {}}
+        changed = False
+        for section, name in RESOURCE_OPTIONS.values():
+            wanted = resources[section].get(name)
+            patch[section][name] = wanted
+            present = current.get(section, {}).get(name)
+            changed = changed or _quantity(name, wanted) != _quantity(name, present)
+        if not changed:
+            return False
+        body = {
+            "spec": {
+                "template": {"spec": {"containers": [{"name": container, "resources": patch}]}}
+            }
+        }
+        self._request(
+            "PATCH",
+            self._statefulset_path(statefulset),
+            body,
+            "application/strategic-merge-patch+json",
+        )
+        return True
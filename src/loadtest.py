@@ -0,0 +1,128 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mongo Express load test module.
+
+Send concurrent HTTP requests to mongo-express for a while, and summarise their latencies.
+"""
+
+import http.client
+import itertools
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from utils import percentile
+
+# Pause after a failed connection, doubled on every failure in a row up to the maximum.
+MIN_BACKOFF = 0.05
+MAX_BACKOFF = 1.0
+
+
+class LoadResult(NamedTuple):
+    """Outcome of a load test; latencies (seconds) are those of the successful requests."""
+
+    requests: int
+    errors: int
+    duration: float
+    latencies: List[float]
+
+    @property
+    def rps(self) -> float:
+        """Return the number of requests completed per second."""
+        return self.requests / self.duration if self.duration else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        """Return the share of the requests that failed."""
+        return self.errors / self.requests if self.requests else 0.0
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Return the latency (nearest rank) below which percent of the requests completed."""
+        return percentile(self.latencies, percent)
+
+
+class _Client(threading.Thread):
+    """Send requests over a keep-alive connection, one at a time, until the deadline."""
+
+    def __init__(self, host, port, paths, headers, deadline, timeout):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = port
+        self.paths = paths
+        self.headers = headers
+        self.deadline = deadline
+        self.timeout = timeout
+        self.requests = 0
+        self.errors = 0
+        self.latencies = []
+
+    def run(self):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        backoff = 0.0
+        for path in itertools.cycle(self.paths):
+            start = time.monotonic()
+            if start >= self.deadline:
+                break
+            try:
+                connection.request("GET", path, headers=self.headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status < 400
+                backoff = 0.0
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                ok = False
+                # Do not hammer a server that refuses or drops the connections.
+                backoff = min(backoff * 2 or MIN_BACKOFF, MAX_BACKOFF)
+            self.requests += 1
+            if ok:
+                self.latencies.append(time.monotonic() - start)
+            else:
+                self.errors += 1
+            if backoff:
+                time.sleep(max(min(backoff, self.deadline - time.monotonic()), 0))
+        connection.close()
+
+
+def run(
+    host: str,
+    port: int,
+    paths: Sequence[str],
+    headers: Optional[Dict[str, str]] = None,
+    concurrency: int = 4,
+    duration: float = 10,
+    timeout: float = 5,
+) -> LoadResult:
+    """Send GET requests to the paths, in turn, from concurrent clients.
+
+    Args:
+        host: server host.
+        port: server port.
+        paths: URL paths requested by every client, in turn.
+        headers: request headers, e.g. the credentials.
+        concurrency: number of clients, each waiting for its response before the next request.
+        duration: seconds after which the clients stop sending requests.
+        timeout: seconds after which a request fails.
+
+    Raises:
+        ValueError: if a path does not start with "/".
+    """
+    invalid = [path for path in paths if not path.startswith("/")]
+    if invalid:
+        raise ValueError(f"paths must start with '/': {', '.join(invalid)}")
+    start = time.monotonic()
+    clients = [
+        _Client(host, port, list(paths), headers or {}, start + duration, timeout)
+        for _ in range(concurrency)
+    ]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    return LoadResult(
+        requests=sum(client.requests for client in clients),
+        errors=sum(client.errors for client in clients),
+        duration=time.monotonic() - start,
+        latencies=[latency for client in clients for latency in client.latencies],
+    )
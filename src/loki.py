@@ -0,0 +1,54 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mongo Express Loki module.
+
+Provide the logging relation (loki_push_api interface) requirer: the log forwarder service
+pushes the mongo-express logs to the push API endpoints published by the Loki units.
+"""
+
+import json
+import logging
+from typing import List
+
+from ops.framework import Object
+
+logger = logging.getLogger(__name__)
+
+LOG_FORWARDER_SERVICE = "log-forwarder"
+LOG_FORWARDER_PATH = "/srv/mongo-express-charm/log-forwarder.js"
+LOG_STATS_PATH = "/tmp/mongo-express-logs/stats.json"
+
+
+class LokiPushApiRequires(Object):
+    """logging relation requirer."""
+
+    def __init__(self, charm, relation_name: str = "logging"):
+        super().__init__(charm, relation_name)
+        self.charm = charm
+        self.relation_name = relation_name
+
+    @property
+    def endpoints(self) -> List[str]:
+        """Return the sorted push API URLs published by the related Loki units."""
+        urls = set()
+        for relation in self.model.relations[self.relation_name]:
+            for unit in relation.units:
+                endpoint = relation.data[unit].get("endpoint")
+                if not endpoint:
+                    continue
+                try:
+                    urls.add(json.loads(endpoint)["url"])
+                except (ValueError, TypeError, KeyError):
+                    logger.warning(f"ignoring the invalid Loki endpoint of {unit.name}")
+        return sorted(urls)
+
+    def labels(self) -> dict:
+        """Return the labels of the log streams, identifying the unit."""
+        return {
+            "juju_model": self.model.name,
+            "juju_model_uuid": self.model.uuid,
+            "juju_application": self.model.app.name,
+            "juju_unit": self.model.unit.name,
+            "juju_charm": self.charm.meta.name,
+        }
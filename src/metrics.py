@@ -0,0 +1,111 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mongo Express metrics module.
+
+Provide the metrics-endpoint relation (prometheus_scrape interface), scraping the
+exporter service of every unit, and render the charm metrics in the Prometheus text format.
+The prometheus_scrape charm library is not vendored in this charm: the provider publishes
+the scrape jobs and the unit addresses of that interface itself.
+"""
+
+import json
+import logging
+import socket
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from ops.charm import RelationBrokenEvent, RelationJoinedEvent
+from ops.framework import Object
+
+from instrumentation import instrumented
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = 9114
+METRICS_DIR = "/tmp/mongo-express-metrics"
+CHARM_METRICS_PATH = f"{METRICS_DIR}/charm.prom"
+EXPORTER_SERVICE = "mongo-express-exporter"
+EXPORTER_PATH = "/srv/mongo-express-charm/exporter.js"
+METRICS_HOOK_PATH = "/srv/mongo-express-charm/metrics-hook.js"
+
+
+class Metric(NamedTuple):
+    """Metric family; samples are (labels, value) pairs, None values being skipped."""
+
+    name: str
+    kind: str
+    help: str
+    samples: List[Tuple[Dict[str, str], Optional[float]]]
+
+
+def render_metrics(metrics: Iterable[Metric]) -> str:
+    """Render metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for labels, value in metric.samples:
+            if value is None:
+                continue
+            label_set = ",".join(f'{key}="{label}"' for key, label in sorted(labels.items()))
+            series = f"{metric.name}{{{label_set}}}" if labels else metric.name
+            lines.append(f"{series} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsEndpointProvider(Object):
+    """metrics-endpoint relation provider.
+
+    Every unit publishes its address, and the leader a scrape job targeting the exporter
+    port of each of them, so Prometheus scrapes all the units of the application.
+    """
+
+    def __init__(self, charm, relation_name: str = "metrics-endpoint"):
+        super().__init__(charm, relation_name)
+        self.charm = charm
+        self.relation_name = relation_name
+        self._broken = False
+        event_observe_mapping = {
+            charm.on[relation_name].relation_joined: self._on_relation_joined,
+            charm.on[relation_name].relation_broken: self._on_relation_broken,
+            charm.on.leader_elected: self._on_leader_elected,
+        }
+        for event, observer in event_observe_mapping.items():
+            self.framework.observe(event, observer)
+
+    @property
+    def enabled(self) -> bool:
+        """Return True if Prometheus is related, so the exporter should run."""
+        return not self._broken and bool(self.model.relations[self.relation_name])
+
+    @instrumented
+    def _on_relation_joined(self, event: RelationJoinedEvent):
+        self._publish(event.relation)
+
+    @instrumented
+    def _on_relation_broken(self, _: RelationBrokenEvent):
+        self._broken = True
+
+    @instrumented
+    def _on_leader_elected(self, _):
+        for relation in self.model.relations[self.relation_name]:
+            self._publish(relation)
+
+    def _publish(self, relation):
+        snapshot, unit = self.charm.snapshot, self.model.unit
+        snapshot.set(relation, unit, "prometheus_scrape_unit_address", socket.getfqdn())
+        snapshot.set(relation, unit, "prometheus_scrape_unit_name", unit.name)
+        if not unit.is_leader():
+            return
+        metadata = {
+            "model": self.model.name,
+            "model_uuid": self.model.uuid,
+            "application": self.model.app.name,
+            "charm_name": self.charm.meta.name,
+        }
+        jobs = [
+            {"metrics_path": "/metrics", "static_configs": [{"targets": [f"*:{METRICS_PORT}"]}]}
+        ]
+        app = self.model.app
+        snapshot.set(relation, app, "scrape_metadata", json.dumps(metadata, sort_keys=True))
+        snapshot.set(relation, app, "scrape_jobs", json.dumps(jobs))
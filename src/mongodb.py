@@ -0,0 +1,91 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mongo Express mongodb module."""
+
+import logging
+import urllib.parse
+from typing import Dict, List, Optional
+
+from ops.framework import Object
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 27017
+READ_PREFERENCES = frozenset(
+    ("primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest")
+)
+COMPRESSORS = frozenset(("snappy", "zlib", "zstd"))
+# Charm config option -> connection string option.
+CONNECTION_OPTIONS = {
+    "mongodb-read-preference": "readPreference",
+    "mongodb-max-pool-size": "maxPoolSize",
+    "mongodb-min-pool-size": "minPoolSize",
+    "mongodb-max-idle-time-ms": "maxIdleTimeMS",
+    "mongodb-compressors": "compressors",
+}
+
+
+def build_connection_url(
+    hosts: List[str], replica_set: Optional[str], options: Dict[str, str]
+) -> str:
+    """Build a MongoDB connection string for the given replica set members."""
+    query = {}
+    if replica_set:
+        query["replicaSet"] = replica_set
+    query.update((key, str(value)) for key, value in options.items() if value)
+    url = f"mongodb://{','.join(hosts)}/"
+    if query:
+        url += f"?{urllib.parse.urlencode(query, safe=',')}"
+    return url
+
+
+class MongoDBRequires(Object):
+    """MongoDB relation requirer."""
+
+    def __init__(self, charm, relation_name: str = "mongodb"):
+        super().__init__(charm, relation_name)
+        self.charm = charm
+        self.relation_name = relation_name
+
+    @property
+    def hosts(self) -> List[str]:
+        """Return the sorted host:port list of the related MongoDB members."""
+        relation = self.relation
+        if relation is None:
+            return []
+        hosts = set()
+        for unit in relation.units:
+            unit_data = relation.data[unit]
+            host = unit_data.get("hostname") or unit_data.get("host")
+            if host:
+                hosts.add(f"{host}:{unit_data.get('port') or DEFAULT_PORT}")
+        if not hosts and relation.app and relation.data[relation.app].get("replica_set_uri"):
+            uri = urllib.parse.urlsplit(relation.data[relation.app]["replica_set_uri"])
+            hosts.update(host for host in uri.netloc.rpartition("@")[2].split(",") if host)
+        return sorted(hosts)
+
+    @property
+    def replica_set(self) -> Optional[str]:
+        """Return the replica set name published by MongoDB, if any."""
+        relation = self.relation
+        if relation is None or relation.app is None:
+            return None
+        return relation.data[relation.app].get("replica_set_name")
+
+    @property
+    def connection_url(self) -> Optional[str]:
+        """Return the connection string for the related replica set, if any."""
+        hosts = self.hosts
+        if not hosts:
+            return None
+        options = {
+            option: self.charm.config.get(config_name)
+            for config_name, option in CONNECTION_OPTIONS.items()
+        }
+        return build_connection_url(hosts, self.replica_set, options)
+
+    @property
+    def relation(self):
+        """Return mongodb relation object."""
+        return self.framework.model.get_relation(self.relation_name)
@@ -0,0 +1,159 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mongo Express proxy module.
+
+Render the nginx configuration of the caching and compressing proxy sidecar.
+"""
+
+from typing import List
+
+CONFIG_PATH = "/etc/nginx/mongo-express.conf"
+CACHE_PATH = "/var/cache/nginx/mongo-express"
+SERVICE = "proxy"
+COMPRESSED_TYPES = (
+    "text/plain",
+    "text/css",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+)
+UPSTREAM_KEEPALIVE = 32
+# Name of the mongo-express session cookie (ME_CONFIG_SITE_COOKIEKEYNAME).
+SESSION_COOKIE = "mongo-express"
+
+
+def render_config(
+    base_url: str,
+    port: int,
+    upstream_ports: List[int],
+    cache_max_age: int,
+    cache_size: str,
+    authorization: str,
+    brotli: bool = False,
+    request_size: int = 100 << 10,
+    upload_size: int = 16 << 20,
+) -> str:
+    """Render the nginx configuration.
+
+    Args:
+        base_url: mongo-express base url (ME_CONFIG_SITE_BASEURL).
+        port: port the proxy listens on.
+        upstream_ports: local ports of the mongo-express processes.
+        cache_max_age: seconds the static assets are cached, by the proxy and the browsers.
+        cache_size: maximum size of the static assets cache, e.g. "256m".
+        authorization: Authorization header of the web credentials. The cached static
+            assets are only served to the requests presenting it.
+        brotli: compress with brotli too; needs an nginx image with the ngx_brotli module.
+        request_size: maximum request body size in bytes, as mongo-express accepts.
+        upload_size: maximum GridFS upload size in bytes, 0 for no limit. GridFS uploads
+            and downloads are streamed, not buffered by nginx.
+    """
+    base_url = base_url if base_url.endswith("/") else f"{base_url}/"
+    compressed_types = " ".join(COMPRESSED_TYPES)
+    servers = "\n".join(f"        server 127.0.0.1:{upstream};" for upstream in upstream_ports)
+    brotli_config = (
+        f"""
+    brotli on;
+    brotli_comp_level 5;
+    brotli_types {compressed_types};
+"""
+        if brotli
+        else ""
+    )
+    return f"""# Generated by the mongo-express charm, do not edit.
+worker_processes auto;
+error_log stderr warn;
+
+events {{
+    worker_connections 1024;
+}}
+
+http {{
+    include /etc/nginx/mime.types;
+    access_log off;
+    sendfile on;
+    tcp_nopush on;
+    keepalive_timeout 65;
+
+    gzip on;
+    gzip_vary on;
+    gzip_proxied any;
+    gzip_comp_level 5;
+    gzip_min_length 256;
+    gzip_types {compressed_types};
+{brotli_config}
+    proxy_cache_path {CACHE_PATH} levels=1:2 keys_zone=static:10m max_size={cache_size} inactive={cache_max_age}s use_temp_path=off;
+
+    # mongo-express keeps the sessions, with the CSRF tokens of its forms, in the memory of each
+    # worker: a session sticks to one worker, the requests without a session are spread.
+    map $http_cookie $mongo_express_session {{
+        "~(?:^|; *){SESSION_COOKIE}=(?<session>[^;]+)" $session;
+        default $request_id;
+    }}
+
+    upstream mongo_express {{
+        hash $mongo_express_session consistent;
+{servers}
+        keepalive {UPSTREAM_KEEPALIVE};
+    }}
+
+    server {{
+        listen {port};
+        client_max_body_size {request_size};
+
+        proxy_http_version 1.1;
+        proxy_set_header Connection "";
+        proxy_set_header Host $host;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto $scheme;
+
+        location {base_url}public/ {{
+            # Cached assets never reach mongo-express, which checks the credentials of every
+            # request: nginx checks them instead.
+            if ($http_authorization != "{authorization}") {{
+                add_header WWW-Authenticate 'Basic realm="Authorization Required"' always;
+                return 401;
+            }}
+            proxy_pass http://mongo_express;
+            proxy_cache static;
+            proxy_cache_valid 200 {cache_max_age}s;
+            proxy_cache_use_stale error timeout updating;
+            proxy_cache_lock on;
+            proxy_ignore_headers Cache-Control Expires Set-Cookie;
+            proxy_hide_header Cache-Control;
+            proxy_hide_header Set-Cookie;
+            add_header Cache-Control "public, max-age={cache_max_age}, immutable";
+            add_header X-Cache-Status $upstream_cache_status;
+        }}
+
+        location ~ ^{base_url}db/[^/]+/gridFS/ {{
+            client_max_body_size {upload_size};
+            proxy_request_buffering off;
+            proxy_buffering off;
+            proxy_pass http://mongo_express;
+        }}
+
+        location {base_url} {{
+            proxy_pass http://mongo_express;
+        }}
+    }}
+}}
+"""
+
+
+def pebble_layer() -> dict:
+    """Return the Pebble layer of the proxy container."""
+    return {
+        "summary": "mongo express proxy layer",
+        "description": "pebble config layer for the mongo express caching proxy",
+        "services": {
+            SERVICE: {
+                "override": "replace",
+                "summary": "mongo-express caching proxy",
+                "command": f"nginx -c {CONFIG_PATH} -g 'daemon off;'",
+                "startup": "enabled",
+            }
+        },
+    }
@@ -0,0 +1,121 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mongo Express reconcile module."""
+
+import hashlib
+import json
+from typing import Any, Dict, NamedTuple, Optional, Set
+
+NOOP = "noop"
+REPLAN = "replan"
+RESTART = "restart"
+
+# Service fields that are not passed to the running process: changing them
+# updates the plan, but never requires the workload to be restarted.
+COSMETIC_FIELDS = frozenset(("summary", "description", "override"))
+# Check fields Pebble fills in the plan when a layer leaves them out.
+CHECK_DEFAULTS = {"period": "10s", "timeout": "3s", "threshold": 3}
+
+
+class Decision(NamedTuple):
+    """Outcome of comparing the desired layer with the live plan."""
+
+    action: str
+    fingerprint: str
+    changed: Dict[str, Set[str]]
+
+
+def canonical(value: Any) -> Any:
+    """Return value normalised the way Pebble stores it in the plan.
+
+    Pebble keeps every environment value as a string and omits empty fields,
+    so ``True``, ``"true"`` and a missing field must all compare consistently.
+    """
+    if isinstance(value, dict):
+        normalised = {str(key): canonical(item) for key, item in value.items()}
+        return {key: item for key, item in normalised.items() if item not in ("", {}, [])}
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if value is None:
+        return ""
+    return str(value)
+
+
+def fingerprint(services: Dict[str, Any]) -> str:
+    """Return a stable hash of the runtime-relevant fields of the services."""
+    runtime = {
+        name: {
+            key: value for key, value in canonical(service).items() if key not in COSMETIC_FIELDS
+        }
+        for name, service in services.items()
+    }
+    payload = json.dumps(runtime, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def changed_fields(desired: Dict[str, Any], live: Dict[str, Any]) -> Dict[str, Set[str]]:
+    """Return, per desired service, the fields that differ from the live plan."""
+    changed = {}
+    for name, service in desired.items():
+        wanted = canonical(service)
+        current = canonical(live.get(name, {}))
+        fields = {
+            key for key in wanted.keys() | current.keys() if wanted.get(key) != current.get(key)
+        }
+        if fields:
+            changed[name] = fields
+    return changed
+
+
+def changed_checks(desired: Dict[str, Any], live: Dict[str, Any]) -> Dict[str, Set[str]]:
+    """Return, per desired check, the fields that differ from the live plan.
+
+    The defaults Pebble fills in are applied to both sides, and cosmetic fields ignored.
+    """
+
+    def with_defaults(checks: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            name: {
+                key: value
+                for key, value in dict(canonical(CHECK_DEFAULTS), **canonical(check)).items()
+                if key not in COSMETIC_FIELDS
+            }
+            for name, check in checks.items()
+        }
+
+    return changed_fields(with_defaults(desired), with_defaults(live))
+
+
+def decide(
+    desired: Dict[str, Any],
+    live: Dict[str, Any],
+    applied_fingerprint: Optional[str],
+    running: bool,
+) -> Decision:
+    """Choose the cheapest action that brings the workload to the desired state.
+
+    Args:
+        desired: services of the rendered layer.
+        live: services of the current Pebble plan, as dictionaries.
+        applied_fingerprint: fingerprint of the services the workload was last
+            (re)started with, if any.
+        running: whether all desired services are currently running.
+
+    Returns:
+        The decision: ``REPLAN`` when runtime fields differ from the live plan
+        (Pebble restarts only the affected services), ``RESTART`` when the plan is
+        already current but the running processes may not be, and ``NOOP``
+        otherwise.
+    """
+    desired_fingerprint = fingerprint(desired)
+    changed = changed_fields(desired, live)
+    if any(fields - COSMETIC_FIELDS for fields in changed.values()):
+        action = REPLAN
+    elif applied_fingerprint != desired_fingerprint or not running:
+        action = RESTART
+    else:
+        action = NOOP
+    return Decision(action, desired_fingerprint, changed)
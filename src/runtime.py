@@ -0,0 +1,167 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mongo Express runtime module.
+
+Derive Node.js runtime settings from the cgroup (v1 or v2) limits of the workload container.
+"""
+
+import math
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+MEMORY_LIMIT_FILES = (
+    "/sys/fs/cgroup/memory.max",
+    "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+)
+CPU_MAX_FILE = "/sys/fs/cgroup/cpu.max"
+CPU_QUOTA_FILES = (
+    ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us"),
+    (
+        "/sys/fs/cgroup/cpu,cpuacct/cpu.cfs_quota_us",
+        "/sys/fs/cgroup/cpu,cpuacct/cpu.cfs_period_us",
+    ),
+)
+# cgroup v1 reports "no limit" as a huge, page-aligned number.
+UNLIMITED_MEMORY = 1 << 60
+MIB = 1024 * 1024
+# Share of the memory limit given to the V8 heap; the rest is left to code,
+# buffers and native allocations.
+HEAP_RATIO = 0.75
+MIN_OLD_SPACE_MIB = 32
+MIN_SEMI_SPACE_MIB = 2
+MAX_SEMI_SPACE_MIB = 64
+MIN_THREADPOOL_SIZE = 4
+MAX_THREADPOOL_SIZE = 128
+
+
+class CgroupLimits(NamedTuple):
+    """Memory (bytes) and CPU (cores) limits, None when unlimited or unknown."""
+
+    memory: Optional[int] = None
+    cpus: Optional[float] = None
+
+
+def _read_int(read: Callable[[str], Optional[str]], path: str) -> Optional[int]:
+    content = read(path)
+    if content is None:
+        return None
+    try:
+        return int(content.strip())
+    except ValueError:
+        return None
+
+
+def read_memory_limit(read: Callable[[str], Optional[str]]) -> Optional[int]:
+    """Return the memory limit in bytes, or None if unlimited."""
+    for path in MEMORY_LIMIT_FILES:
+        limit = _read_int(read, path)
+        if limit is not None:
+            return limit if 0 < limit < UNLIMITED_MEMORY else None
+    return None
+
+
+def read_cpu_limit(read: Callable[[str], Optional[str]]) -> Optional[float]:
+    """Return the CPU limit in cores, or None if unlimited."""
+    content = read(CPU_MAX_FILE)
+    if content is not None:
+        quota, _, period = content.strip().partition(" ")
+        if quota == "max" or not period:
+            return None
+        try:
+            return int(quota) / int(period)
+        except (ValueError, ZeroDivisionError):
+            return None
+    for quota_path, period_path in CPU_QUOTA_FILES:
+        quota = _read_int(read, quota_path)
+        period = _read_int(read, period_path)
+        if quota is not None and period:
+            return quota / period if quota > 0 else None
+    return None
+
+
+def read_cgroup_limits(read: Callable[[str], Optional[str]]) -> CgroupLimits:
+    """Read the container limits.
+
+    Args:
+        read: function returning the content of a file in the container, or None
+            if it does not exist.
+    """
+    return CgroupLimits(memory=read_memory_limit(read), cpus=read_cpu_limit(read))
+
+
+def semi_space_size(limits: CgroupLimits) -> Optional[int]:
+    """Return the V8 max semi-space size in MiB: 1 MiB per 64 MiB of memory, as a power of 2."""
+    if limits.memory is None:
+        return None
+    size = limits.memory // MIB // 64
+    size = 1 << max(size.bit_length() - 1, 0)
+    return min(max(size, MIN_SEMI_SPACE_MIB), MAX_SEMI_SPACE_MIB)
+
+
+def old_space_size(limits: CgroupLimits, semi_space: Optional[int]) -> Optional[int]:
+    """Return the V8 max old-space size in MiB, leaving room for the young generation."""
+    if limits.memory is None:
+        return None
+    young_generation = 3 * (semi_space or 0)
+    return max(int(limits.memory // MIB * HEAP_RATIO) - young_generation, MIN_OLD_SPACE_MIB)
+
+
+def threadpool_size(limits: CgroupLimits) -> Optional[int]:
+    """Return the libuv threadpool size: 4 threads per core."""
+    if limits.cpus is None:
+        return None
+    size = math.ceil(limits.cpus) * 4
+    return min(max(size, MIN_THREADPOOL_SIZE), MAX_THREADPOOL_SIZE)
+
+
+def node_environment(
+    limits: CgroupLimits,
+    max_old_space_size: int = 0,
+    max_semi_space_size: int = 0,
+    uv_threadpool_size: int = 0,
+) -> Dict[str, str]:
+    """Return the NODE_OPTIONS and UV_THREADPOOL_SIZE environment for the limits.
+
+    Non-zero arguments override the values derived from the limits. The semi-space size is
+    left to `node_arguments`.
+    """
+    semi_space = max_semi_space_size or semi_space_size(limits)
+    old_space = max_old_space_size or old_space_size(limits, semi_space)
+    threads = uv_threadpool_size or threadpool_size(limits)
+    environment = {}
+    if old_space:
+        environment["NODE_OPTIONS"] = f"--max-old-space-size={old_space}"
+    if threads:
+        environment["UV_THREADPOOL_SIZE"] = str(threads)
+    return environment
+
+
+def node_arguments(limits: CgroupLimits, max_semi_space_size: int = 0) -> List[str]:
+    """Return the V8 options for the limits, to pass on the node command line.
+
+    The Node.js of the mongo-express image rejects --max-semi-space-size in NODE_OPTIONS.
+    A non-zero max_semi_space_size overrides the size derived from the limits.
+    """
+    semi_space = max_semi_space_size or semi_space_size(limits)
+    return [f"--max-semi-space-size={semi_space}"] if semi_space else []
+
+
+def profiling_environment(
+    directory: str, name: str, duration: float, cpu: bool = True, heap: bool = True
+) -> Dict[str, str]:
+    """Return the environment of a process profiled by the preloaded profile hook.
+
+    Args:
+        directory: directory the profiles are written to.
+        name: name of the service, prefixing its profiles.
+        duration: seconds profiled, from the start of the process.
+        cpu: write a CPU profile (.cpuprofile).
+        heap: write a sampling heap profile (.heapprofile).
+    """
+    return {
+        "PROFILE_DIR": directory,
+        "PROFILE_NAME": name,
+        "PROFILE_DURATION_MS": str(int(duration * 1000)),
+        "PROFILE_CPU": "true" if cpu else "false",
+        "PROFILE_HEAP": "true" if heap else "false",
+    }
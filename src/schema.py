@@ -0,0 +1,138 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mongo Express configuration schema module.
+
+Declare the constraints of the charm options once, as a table built at import time,
+so validating the configuration is a few dictionary and set lookups per option.
+"""
+
+import importlib
+from typing import Any, Callable, FrozenSet, Mapping, NamedTuple, Optional, Tuple
+
+# mongodb is imported by the charm module anyway; backends and k8s are only imported by the
+# validators of the options using them.
+from mongodb import COMPRESSORS, READ_PREFERENCES
+from utils import EDITOR_THEMES, MAX_WORKERS, parse_size
+
+
+class Option(NamedTuple):
+    """Constraints of a charm option; unset options are only checked for presence."""
+
+    name: str
+    required: bool = False
+    choices: Optional[FrozenSet[str]] = None
+    # Values are lists of choices, e.g. "snappy,zstd".
+    separator: Optional[str] = None
+    minimum: Optional[int] = None
+    maximum: Optional[int] = None
+    # Name of an option this one must not exceed, when that option is set (non-zero).
+    at_most: Optional[str] = None
+    # Values are sizes, e.g. "100kb", checked in bytes.
+    size: bool = False
+    # Returns why a value is invalid, or None, for constraints the table cannot express.
+    validator: Optional[Callable[[Any], Optional[str]]] = None
+    message: Optional[str] = None
+
+
+def _validator(module: str, function: str) -> Callable[[Any], Optional[str]]:
+    """Return a validator calling function of module, imported on the first validation."""
+
+    def validate(value: Any) -> Optional[str]:
+        return getattr(importlib.import_module(module), function)(value)
+
+    return validate
+
+
+MAX_DOCUMENTS_PER_PAGE = 1000
+SIZE_MESSAGE = "must be a number of bytes, optionally followed by b, kb, mb or gb."
+RESTART_STRATEGIES = frozenset(("drain", "blue-green"))
+WORKERS = frozenset(("auto", *(str(workers) for workers in range(1, MAX_WORKERS + 1))))
+
+SCHEMA = (
+    Option("editor-theme", required=True, choices=EDITOR_THEMES),
+    Option("web-username", required=True),
+    Option("read-only", required=True),
+    Option("enable-gridfs", required=True),
+    Option("mongo-url", validator=_validator("backends", "validate")),
+    Option("backend-idle-timeout", minimum=0),
+    Option("max-concurrent-restarts", minimum=1),
+    Option("restart-lock-timeout", minimum=0),
+    Option("readiness-timeout", minimum=1),
+    Option("drain-timeout", minimum=0),
+    Option("restart-strategy", choices=RESTART_STRATEGIES, message="must be drain or blue-green."),
+    Option("status-latency-threshold-ms", minimum=0),
+    Option("status-error-threshold", minimum=0, maximum=100),
+    Option("mongodb-read-preference", choices=READ_PREFERENCES),
+    Option("mongodb-max-pool-size", minimum=0),
+    Option("mongodb-min-pool-size", minimum=0, at_most="mongodb-max-pool-size"),
+    Option("mongodb-max-idle-time-ms", minimum=0),
+    Option("mongodb-compressors", choices=COMPRESSORS, separator=","),
+    Option("node-max-old-space-size", minimum=0),
+    Option("node-max-semi-space-size", minimum=0),
+    Option("uv-threadpool-size", minimum=0),
+    Option("log-batch-size", minimum=1, at_most="log-buffer-size"),
+    Option("log-flush-interval-ms", minimum=100),
+    Option("log-buffer-size", minimum=1),
+    Option("request-size", size=True, message=SIZE_MESSAGE),
+    Option("gridfs-max-upload-size", size=True, message=SIZE_MESSAGE),
+    Option("cpu-request", validator=_validator("k8s", "validate_cpu")),
+    Option("cpu-limit", validator=_validator("k8s", "validate_cpu")),
+    Option("memory-request", validator=_validator("k8s", "validate_memory")),
+    Option("memory-limit", validator=_validator("k8s", "validate_memory")),
+    Option("documents-per-page", minimum=1, maximum=MAX_DOCUMENTS_PER_PAGE),
+    Option("max-prop-size", size=True, message=SIZE_MESSAGE),
+    Option("max-row-size", size=True, message=SIZE_MESSAGE),
+    Option(
+        "workers",
+        choices=WORKERS,
+        message=f"must be auto or a number between 1 and {MAX_WORKERS}.",
+    ),
+)
+REQUIRED = tuple(option.name for option in SCHEMA if option.required)
+
+
+def _check(option: Option, value: Any, config: Mapping[str, Any]) -> Optional[str]:
+    """Return why value is invalid for option, or None if it is valid."""
+    if option.validator is not None:
+        return option.validator(value)
+    if option.size:
+        value = parse_size(value)
+        if value is None:
+            return option.message or "invalid size."
+    if option.choices is not None:
+        if option.separator:
+            valid = option.choices.issuperset(filter(None, str(value).split(option.separator)))
+        else:
+            valid = str(value) in option.choices
+        if not valid:
+            return option.message or "invalid value."
+    return _check_range(option, value, config)
+
+
+def _check_range(option: Option, value: Any, config: Mapping[str, Any]) -> Optional[str]:
+    """Return why value is out of the range of option, or None if it is in range."""
+    if option.minimum is not None and value < option.minimum:
+        if option.minimum:
+            return option.message or f"must be at least {option.minimum}."
+        return option.message or "must not be negative."
+    if option.maximum is not None and value > option.maximum:
+        return option.message or f"must not exceed {option.maximum}."
+    if option.at_most and config.get(option.at_most) and value > config[option.at_most]:
+        return option.message or f"must not exceed {option.at_most}."
+    return None
+
+
+def validate(config: Mapping[str, Any]) -> Optional[Tuple[str, str]]:
+    """Return the first invalid option of config and why, or None if it is valid."""
+    for name in REQUIRED:
+        if name not in config:
+            return name, "missing configuration."
+    for option in SCHEMA:
+        value = config.get(option.name)
+        if value is None:
+            continue
+        message = _check(option, value, config)
+        if message:
+            return option.name, message
+    return None
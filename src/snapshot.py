@@ -0,0 +1,82 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Mongo Express snapshot module.
+
+Serve the state read by the charm during one dispatch from memory, and batch its writes.
+"""
+
+import logging
+from typing import Dict, Optional, Set, Tuple
+
+from ops.framework import Object
+from ops.model import Container, Relation
+
+logger = logging.getLogger(__name__)
+
+
+class DispatchSnapshot(Object):
+    """Read-through cache of the Pebble plans and the relation data, for one dispatch.
+
+    The model already reads the config and each relation data bag at most once per
+    dispatch. Relation data writes, however, are a relation-set call each, and every
+    get_plan() is a Pebble round trip: the snapshot keeps the plans until a layer is
+    added, and holds the relation data writes until `flush`, keeping the last value
+    written to each key and skipping the values that did not change.
+    """
+
+    def __init__(self, charm, key: str = "snapshot"):
+        super().__init__(charm, key)
+        self._plans = {}
+        self._relations: Dict[int, Relation] = {}
+        self._pending: Dict[Tuple[int, str], Dict[str, str]] = {}
+        self._read: Set[Tuple[int, str]] = set()
+        # Relation data round trips of the dispatch, for the instrumentation.
+        self.relation_reads = 0
+        self.relation_writes = 0
+
+    @property
+    def config(self):
+        """Return the charm config, loaded once per dispatch by the model."""
+        return self.model.config
+
+    def plan(self, container: Container):
+        """Return the Pebble plan of container, fetched once until a layer is added."""
+        if container.name not in self._plans:
+            self._plans[container.name] = container.get_plan()
+        return self._plans[container.name]
+
+    def add_layer(self, container: Container, label: str, layer: dict):
+        """Add (combine) a layer to container, invalidating its plan."""
+        container.add_layer(label, layer, combine=True)
+        self._plans.pop(container.name, None)
+
+    def get(self, relation: Relation, entity, key: str) -> Optional[str]:
+        """Return the value of key in the data bag of entity, including pending writes."""
+        bag = (relation.id, entity.name)
+        pending = self._pending.get(bag, {})
+        if key in pending:
+            return pending[key] or None
+        if bag not in self._read:
+            # The model reads each data bag once.
+            self._read.add(bag)
+            self.relation_reads += 1
+        return relation.data[entity].get(key) or None
+
+    def set(self, relation: Relation, entity, key: str, value: Optional[str]):
+        """Set (or, with an empty value, remove) key in the data bag of entity at `flush`."""
+        self._relations[relation.id] = relation
+        self._pending.setdefault((relation.id, entity.name), {})[key] = value or ""
+
+    def flush(self):
+        """Write the pending relation data, and forget the plans."""
+        for (relation_id, name), values in self._pending.items():
+            entity = self.model.app if name == self.model.app.name else self.model.unit
+            data = self._relations[relation_id].data[entity]
+            for key, value in values.items():
+                if data.get(key, "") != value:
+                    data[key] = value
+                    self.relation_writes += 1
+        self._pending.clear()
+        self._relations.clear()
+        self._plans.clear()
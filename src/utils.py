@@ -4,71 +4,169 @@
 
 """Mongo Express utils module."""
 
+import math
+import re
+import socket
+import time
+import urllib.error
+import urllib.request
+from typing import Callable, Dict, Optional, Sequence
+
 PORT = 8081
-EDITOR_THEMES = (
-    "default",
-    "3024-day",
-    "3024-night",
-    "abbott",
-    "abcdef",
-    "ambiance",
-    "ayu-dark",
-    "ayu-mirage",
-    "base16-dark",
-    "base16-light",
-    "bespin",
-    "blackboard",
-    "cobalt",
-    "colorforth",
-    "darcula",
-    "dracula",
-    "duotone-dark",
-    "duotone-light",
-    "eclipse",
-    "elegant",
-    "erlang-dark",
-    "gruvbox-dark",
-    "hopscotch",
-    "icecoder",
-    "idea",
-    "isotope",
-    "juejin",
-    "lesser-dark",
-    "liquibyte",
-    "lucario",
-    "material",
-    "material-darker",
-    "material-palenight",
-    "material-ocean",
-    "mbo",
-    "mdn-like",
-    "midnight",
-    "monokai",
-    "moxer",
-    "neat",
-    "neo",
-    "night",
-    "nord",
-    "oceanic-next",
-    "panda-syntax",
-    "paraiso-dark",
-    "paraiso-light",
-    "pastel-on-dark",
-    "railscasts",
-    "rubyblue",
-    "seti",
-    "shadowfox",
-    "solarized dark",
-    "solarized light",
-    "the-matrix",
-    "tomorrow-night-bright",
-    "tomorrow-night-eighties",
-    "ttcn",
-    "twilight",
-    "vibrant-ink",
-    "xq-dark",
-    "xq-light",
-    "yeti",
-    "yonce",
-    "zenburn",
+WORKER_BASE_PORT = 8100
+MAX_WORKERS = 64
+BALANCER_PATH = "/srv/mongo-express-charm/balancer.js"
+PROFILE_HOOK_PATH = "/srv/mongo-express-charm/profile-hook.js"
+DRAIN_HOOK_PATH = "/srv/mongo-express-charm/drain-hook.js"
+# Drain state of the workers, one file per worker port.
+DRAIN_DIR = "/tmp/mongo-express-drain"
+# Present while the unit is in the ready set; the pod is ready only then.
+READY_PATH = "/tmp/mongo-express-ready"
+# Period of the serving check (seconds): the pod leaves the Service endpoints within it.
+READY_CHECK_PERIOD = 2
+# Node profiles, written in the mongo-express container and copied to the charm container.
+WORKLOAD_PROFILE_DIR = "/tmp/mongo-express-profiles"
+PROFILE_COPY_DIR = "/var/tmp/mongo-express-charm/workload-profiles"
+# Profiles kept in PROFILE_COPY_DIR, the oldest being removed beyond.
+MAX_WORKLOAD_PROFILES = 5
+# Longest profiling run (seconds).
+MAX_PROFILE_DURATION = 120
+# Seconds after which a profiling run is given up, collecting the profiles written, if any.
+PROFILE_COLLECT_TIMEOUT = 900
+HEALTH_CHECK_TIMEOUT = 60
+# Sizes in the format of ME_CONFIG_REQUEST_SIZE (the bytes package), e.g. "100kb" or "16mb".
+SIZE_PATTERN = re.compile(r"^(\d+)(b|kb|mb|gb)?$", re.IGNORECASE)
+SIZE_UNITS = {"b": 1, "kb": 1 << 10, "mb": 1 << 20, "gb": 1 << 30}
+WARMUP_PATHS = ("", "db/admin/")
+EDITOR_THEMES = frozenset(
+    (
+        "default",
+        "3024-day",
+        "3024-night",
+        "abbott",
+        "abcdef",
+        "ambiance",
+        "ayu-dark",
+        "ayu-mirage",
+        "base16-dark",
+        "base16-light",
+        "bespin",
+        "blackboard",
+        "cobalt",
+        "colorforth",
+        "darcula",
+        "dracula",
+        "duotone-dark",
+        "duotone-light",
+        "eclipse",
+        "elegant",
+        "erlang-dark",
+        "gruvbox-dark",
+        "hopscotch",
+        "icecoder",
+        "idea",
+        "isotope",
+        "juejin",
+        "lesser-dark",
+        "liquibyte",
+        "lucario",
+        "material",
+        "material-darker",
+        "material-palenight",
+        "material-ocean",
+        "mbo",
+        "mdn-like",
+        "midnight",
+        "monokai",
+        "moxer",
+        "neat",
+        "neo",
+        "night",
+        "nord",
+        "oceanic-next",
+        "panda-syntax",
+        "paraiso-dark",
+        "paraiso-light",
+        "pastel-on-dark",
+        "railscasts",
+        "rubyblue",
+        "seti",
+        "shadowfox",
+        "solarized dark",
+        "solarized light",
+        "the-matrix",
+        "tomorrow-night-bright",
+        "tomorrow-night-eighties",
+        "ttcn",
+        "twilight",
+        "vibrant-ink",
+        "xq-dark",
+        "xq-light",
+        "yeti",
+        "yonce",
+        "zenburn",
+    )
 )
+
+
+def http_get(url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 5):
+    """Send a GET request and return the response status code, or None if it failed."""
+    request = urllib.request.Request(url, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, OSError):
+        return None
+
+
+def is_http_ready(url: str, timeout: float = 5) -> bool:
+    """Return True if the url answers HTTP requests, whatever the status code."""
+    return http_get(url, timeout=timeout) is not None
+
+
+def is_tcp_open(host: str, port: int, timeout: float = 5) -> bool:
+    """Return True if a TCP connection to host:port succeeds."""
+    try:
+        socket.create_connection((host, port), timeout=timeout).close()
+    except OSError:
+        return False
+    return True
+
+
+def timed(predicate: Callable[[], bool]) -> Optional[float]:
+    """Return how long predicate took in milliseconds, or None if it returned False."""
+    start = time.monotonic()
+    if not predicate():
+        return None
+    return round((time.monotonic() - start) * 1000, 1)
+
+
+def percentile(values: Sequence[float], percent: float) -> Optional[float]:
+    """Return the value (nearest rank) below which percent of the values are."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+def wait_for(predicate: Callable[[], bool], timeout: float, interval: float = 1) -> bool:
+    """Poll predicate until it returns True or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    while True:
+        if predicate():
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval)
+
+
+def parse_size(value: str) -> Optional[int]:
+    """Return the number of bytes of a size such as "100kb", or None if it is invalid."""
+    match = SIZE_PATTERN.match(str(value).strip())
+    if not match:
+        return None
+    number, unit = match.groups()
+    return int(number) * SIZE_UNITS[(unit or "b").lower()]
@@ -0,0 +1,264 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Charm dispatch benchmarks.
+
+Measure the import, begin() and per-event dispatch cost of the charm under the Harness,
+at several peer counts, and the startup cost of a dispatch per hook type. The Pebble API
+calls and relation data writes of each event are compared with tests/benchmark/baseline.json:
+any increase fails the benchmark. Latencies are compared too when BENCHMARK_MAX_SLOWDOWN
+(e.g. "2.0") is set, as they depend on the machine. The results are written to
+BENCHMARK_RESULTS (benchmark-results.json), and copied to the baseline when
+BENCHMARK_UPDATE_BASELINE is set.
+"""
+
+import collections
+import functools
+import json
+import logging
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import time
+
+import pytest
+import yaml
+from ops.testing import Harness
+from pytest_mock import MockerFixture
+
+from charm import MongoExpressCharm
+
+logger = logging.getLogger(__name__)
+
+APP = "davigar15-mongo-express"
+PEERS = (1, 10, 100)
+ROUNDS = 10
+IMPORT_ROUNDS = 5
+BASELINE_PATH = pathlib.Path(__file__).parent / "baseline.json"
+ROOT_PATH = pathlib.Path(__file__).parents[2]
+SRC_PATH = ROOT_PATH / "src"
+STARTUP_HOOKS = ("config-changed", "cluster-relation-changed", "update-status", "upgrade-charm")
+# Run the charm entry point the way the dispatch does, up to the end of one hook.
+STARTUP_SCRIPT = """
+import sys, time, types
+from unittest import mock
+import ops.testing
+entrypoint, hook = sys.argv[1:]
+start = time.perf_counter()
+with mock.patch("utils.http_get", return_value=200):
+    # Like __main__, the entry point is compiled on every run.
+    with open(entrypoint) as source:
+        code = compile(source.read(), entrypoint, "exec")
+    module = sys.modules["dispatch"] = types.ModuleType("dispatch")
+    module.__file__ = entrypoint
+    exec(code, module.__dict__)
+    charm_class = module.MongoExpressCharm
+    with mock.patch.object(charm_class, "_read_workload_file", return_value=None):
+        harness = ops.testing.Harness(charm_class)
+        relation_id = harness.add_relation("cluster", "%s")
+        harness.update_relation_data(relation_id, "%s", {
+            "web-password": "password", "cookie-secret": "cookie", "session-secret": "session",
+        })
+        harness.begin()
+        event = getattr(harness.charm.on, hook.replace("-", "_"))
+        if hook.startswith("cluster-relation"):
+            event.emit(harness.model.get_relation("cluster"), harness.charm.app)
+        else:
+            event.emit()
+        harness.framework.commit()
+print(time.perf_counter() - start)
+""" % (APP, APP)
+
+
+def _median_ms(timings) -> float:
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def _get_credentials(harness: Harness):
+    harness.charm._on_get_credentials_action(ActionEventStub())
+
+
+def _change_password(harness: Harness):
+    harness.charm._on_change_password_action(ActionEventStub())
+
+
+def _cluster_relation_changed(harness: Harness):
+    relation = harness.charm.model.get_relation("cluster")
+    harness.charm.on.cluster_relation_changed.emit(relation, harness.charm.app)
+
+
+EVENTS = {
+    "config-changed": lambda harness: harness.charm.on.config_changed.emit(),
+    "pebble-ready": lambda harness: harness.charm.on.mongo_express_pebble_ready.emit(
+        "mongo-express"
+    ),
+    "cluster-relation-changed": _cluster_relation_changed,
+    "get-credentials": _get_credentials,
+    "change-password": _change_password,
+}
+
+
+class ActionEventStub:
+    """Action event collecting the results, as the Harness cannot run actions."""
+
+    def __init__(self):
+        self.results = None
+
+    def set_results(self, results):
+        """Record the results."""
+        self.results = results
+
+    def fail(self, message=""):
+        """Fail the benchmark: actions are expected to succeed."""
+        raise AssertionError(message)
+
+
+class PebbleCallCounter:
+    """Count the calls to the Pebble client of a container, per API method."""
+
+    def __init__(self, container):
+        self.calls = collections.Counter()
+        client = container._pebble
+        for name in dir(client):
+            attribute = getattr(client, name)
+            if not name.startswith("_") and callable(attribute):
+                setattr(client, name, self._counted(name, attribute))
+
+    def _counted(self, name, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            self.calls[name] += 1
+            return method(*args, **kwargs)
+
+        return wrapper
+
+
+@pytest.fixture(scope="module")
+def results():
+    results = {"import": {}, "startup": {}, "begin": {}, "events": {}}
+    yield results
+    path = pathlib.Path(os.environ.get("BENCHMARK_RESULTS", "benchmark-results.json"))
+    path.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+    if os.environ.get("BENCHMARK_UPDATE_BASELINE"):
+        BASELINE_PATH.write_text(path.read_text())
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    if not BASELINE_PATH.exists():
+        return {"import": {}, "startup": {}, "begin": {}, "events": {}}
+    return json.loads(BASELINE_PATH.read_text())
+
+
+@pytest.fixture(autouse=True)
+def workload(mocker: MockerFixture):
+    mocker.patch("charm.MongoExpressCharm._read_workload_file", return_value=None)
+    mocker.patch("charm.http_get", return_value=200)
+
+
+def _harness(peers: int) -> Harness:
+    harness = Harness(MongoExpressCharm)
+    harness.set_leader(True)
+    relation_id = harness.add_relation("cluster", APP)
+    for unit in range(1, peers):
+        harness.add_relation_unit(relation_id, f"{APP}/{unit}")
+        harness.update_relation_data(relation_id, f"{APP}/{unit}", {"ready": "true"})
+    return harness
+
+
+def _check_latency(measured: float, expected: float):
+    max_slowdown = os.environ.get("BENCHMARK_MAX_SLOWDOWN")
+    if max_slowdown and expected:
+        assert measured <= expected * float(max_slowdown)
+
+
+def test_import(results, baseline):
+    command = [
+        sys.executable,
+        "-c",
+        "import time; start = time.perf_counter(); import charm; "
+        "print(time.perf_counter() - start)",
+    ]
+    environment = dict(os.environ, PYTHONPATH=str(SRC_PATH))
+    timings = [
+        float(subprocess.check_output(command, env=environment, text=True))
+        for _ in range(IMPORT_ROUNDS)
+    ]
+    results["import"] = {"median-ms": _median_ms(timings)}
+    _check_latency(results["import"]["median-ms"], baseline["import"].get("median-ms"))
+
+
+def _entrypoint() -> str:
+    charmcraft = yaml.safe_load((ROOT_PATH / "charmcraft.yaml").read_text())
+    entrypoint = charmcraft["parts"]["charm"].get("charm-entrypoint", "src/charm.py")
+    return str(ROOT_PATH / entrypoint)
+
+
+@pytest.mark.parametrize("hook", STARTUP_HOOKS)
+def test_startup(results, baseline, hook):
+    command = [sys.executable, "-c", STARTUP_SCRIPT, _entrypoint(), hook]
+    # Juju does not disable the bytecode cache: the first run fills it.
+    environment = dict(os.environ, PYTHONPATH=str(SRC_PATH))
+    environment.pop("PYTHONDONTWRITEBYTECODE", None)
+    subprocess.check_output(command, env=environment, text=True)
+    timings = [
+        float(subprocess.check_output(command, env=environment, text=True).splitlines()[-1])
+        for _ in range(IMPORT_ROUNDS)
+    ]
+    median_ms = _median_ms(timings)
+    expected = baseline.get("startup", {}).get(hook, {}).get("median-ms")
+    if expected:
+        # Logged only: the results are copied to the baseline as they are.
+        logger.info(f"{hook} startup: {median_ms}ms, {median_ms / expected - 1:+.1%} vs baseline")
+    results["startup"][hook] = {"median-ms": median_ms}
+    _check_latency(median_ms, expected)
+
+
+@pytest.mark.parametrize("peers", PEERS)
+def test_begin(results, baseline, peers):
+    timings = []
+    for _ in range(ROUNDS):
+        harness = _harness(peers)
+        start = time.perf_counter()
+        harness.begin()
+        timings.append(time.perf_counter() - start)
+        harness.cleanup()
+    results["begin"][str(peers)] = {"median-ms": _median_ms(timings)}
+    _check_latency(_median_ms(timings), baseline["begin"].get(str(peers), {}).get("median-ms"))
+
+
+@pytest.mark.parametrize("peers", PEERS)
+@pytest.mark.parametrize("event", EVENTS)
+def test_event(results, baseline, event, peers):
+    harness = _harness(peers)
+    harness.begin()
+    # Start from a running workload: the benchmark measures the steady state.
+    harness.charm.on.cluster_ready.emit()
+    harness.charm.on.mongo_express_pebble_ready.emit("mongo-express")
+    harness.framework.commit()
+    counter = PebbleCallCounter(harness.charm.container)
+    snapshot = harness.charm.snapshot
+    timings = []
+    relation_writes = snapshot.relation_writes
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        EVENTS[event](harness)
+        harness.framework.commit()
+        timings.append(time.perf_counter() - start)
+    harness.cleanup()
+    result = {
+        "median-ms": _median_ms(timings),
+        "pebble-calls": {name: calls / ROUNDS for name, calls in sorted(counter.calls.items())},
+        "relation-writes": (snapshot.relation_writes - relation_writes) / ROUNDS,
+    }
+    results["events"].setdefault(event, {})[str(peers)] = result
+
+    expected = baseline["events"].get(event, {}).get(str(peers))
+    if expected is None:
+        pytest.skip(f"no baseline for {event} at {peers} peers")
+    for name, calls in result["pebble-calls"].items():
+        assert calls <= expected["pebble-calls"].get(name, 0), f"more {name} calls"
+    assert result["relation-writes"] <= expected["relation-writes"]
+    _check_latency(result["median-ms"], expected["median-ms"])
@@ -0,0 +1,378 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""GridFS transfer benchmarks.
+
+Upload files of increasing size to GridFS through mongo-express, download them back, and
+record the throughput of each transfer and the peak RSS of mongo-express, for several
+request-size settings. mongo-express runs with the environment and the node arguments of the
+Pebble layer the charm renders, related to a local mongod; only the addresses, ports and
+script paths are changed for the local machine. With the proxy enabled, nginx runs the
+configuration the charm renders too, and the uploads over and under gridfs-max-upload-size
+are checked. The benchmarks are skipped unless `mongod` is on the PATH and
+BENCHMARK_MONGO_EXPRESS points to a mongo-express checkout with its dependencies installed,
+as the transfer-benchmark CI job sets up; the proxied ones need `nginx` too. The results are
+written to BENCHMARK_TRANSFER_RESULTS (transfer-results.json); they depend on the machine and
+are not compared with a baseline.
+"""
+
+import base64
+import http.client
+import json
+import logging
+import os
+import pathlib
+import re
+import shutil
+import socket
+import subprocess
+import time
+import uuid
+
+import pytest
+from ops.testing import Harness
+from pytest_mock import MockerFixture
+
+import proxy
+from charm import MongoExpressCharm
+from utils import PORT, http_get, parse_size, wait_for
+
+logger = logging.getLogger(__name__)
+
+APP = "davigar15-mongo-express"
+ROOT_PATH = pathlib.Path(__file__).parents[2]
+# Directory of the charm scripts in the mongo-express container.
+SCRIPTS_DIR = "/srv/mongo-express-charm/"
+MONGO_EXPRESS_PATH = os.environ.get("BENCHMARK_MONGO_EXPRESS")
+REQUEST_SIZES = ("100kb", "16mb", "256mb")
+FILE_SIZES = ("1mb", "4mb", "16mb", "64mb")
+# Uploads through the proxy, by whether they are under gridfs-max-upload-size.
+MAX_UPLOAD_SIZE = "4mb"
+PROXIED_FILE_SIZES = {"1mb": True, "8mb": False}
+DATABASE = "benchmark"
+BUCKET = "fs"
+USERNAME = "admin"
+PASSWORD = "benchmark"
+STARTUP_TIMEOUT = 60
+TRANSFER_TIMEOUT = 300
+CHUNK_SIZE = 1 << 16
+
+pytestmark = pytest.mark.skipif(
+    not (MONGO_EXPRESS_PATH and shutil.which("mongod")),
+    reason="needs mongod on the PATH and BENCHMARK_MONGO_EXPRESS",
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def _auth_headers() -> dict:
+    credentials = base64.b64encode(f"{USERNAME}:{PASSWORD}".encode("utf-8")).decode("utf-8")
+    return {"Authorization": f"Basic {credentials}"}
+
+
+def _peak_rss(pid: int) -> int:
+    """Return the peak RSS of the process in bytes, from /proc."""
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _reset_peak_rss(pid: int):
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError as e:
+        logger.warning(f"cannot reset the peak RSS of mongo-express: {e}")
+
+
+@pytest.fixture(scope="module")
+def results():
+    results = {}
+    yield results
+    path = pathlib.Path(os.environ.get("BENCHMARK_TRANSFER_RESULTS", "transfer-results.json"))
+    path.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+
+
+@pytest.fixture(scope="module")
+def mongod(tmp_path_factory):
+    port = _free_port()
+    command = [
+        "mongod",
+        "--bind_ip",
+        "127.0.0.1",
+        "--port",
+        str(port),
+        "--dbpath",
+        str(tmp_path_factory.mktemp("mongod")),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    try:
+        if not wait_for(lambda: _accepts_connections(port), timeout=STARTUP_TIMEOUT):
+            pytest.fail("mongod did not start")
+        yield port
+    finally:
+        _stop(process)
+
+
+def _accepts_connections(port: int) -> bool:
+    try:
+        socket.create_connection(("127.0.0.1", port), timeout=1).close()
+    except OSError:
+        return False
+    return True
+
+
+def _render(mocker: MockerFixture, config: dict, mongod_port: int) -> tuple:
+    """Return the first worker service and the proxy configuration the charm renders.
+
+    The charm is related to the local mongod and configured with config.
+    """
+    mocker.patch("charm.MongoExpressCharm._read_workload_file", return_value=None)
+    mocker.patch("charm.http_get", return_value=200)
+    harness = Harness(MongoExpressCharm)
+    try:
+        harness.update_config(config)
+        relation_id = harness.add_relation("cluster", APP)
+        harness.update_relation_data(
+            relation_id,
+            APP,
+            {"web-password": PASSWORD, "cookie-secret": "cookie", "session-secret": "session"},
+        )
+        relation_id = harness.add_relation("mongodb", "mongodb-k8s")
+        harness.add_relation_unit(relation_id, "mongodb-k8s/0")
+        harness.update_relation_data(
+            relation_id, "mongodb-k8s/0", {"hostname": "127.0.0.1", "port": str(mongod_port)}
+        )
+        harness.begin()
+        layer = harness.charm._get_pebble_layer()
+        service = layer["services"][harness.charm._worker_services[0]]
+        proxy_config = None
+        if config.get("enable-proxy"):
+            assert harness.charm._reconcile_proxy(layer)
+            proxy_config = harness.charm.proxy_container.pull(proxy.CONFIG_PATH).read()
+        return service, proxy_config
+    finally:
+        harness.cleanup()
+
+
+def _local_environment(service: dict, port: int, drain_dir: str) -> dict:
+    """Return the environment of the service, as Pebble passes it, on the local machine."""
+    environment = dict(os.environ)
+    for name, value in service["environment"].items():
+        # Pebble reads the layer as YAML: booleans are passed as true and false.
+        environment[name] = str(value).lower() if isinstance(value, bool) else str(value)
+    environment["NODE_OPTIONS"] = environment.get("NODE_OPTIONS", "").replace(
+        SCRIPTS_DIR, f"{ROOT_PATH / 'files'}/"
+    )
+    environment.update(VCAP_APP_HOST="127.0.0.1", VCAP_APP_PORT=str(port), DRAIN_DIR=drain_dir)
+    return environment
+
+
+def _node_arguments(service: dict) -> list:
+    """Return the node arguments of the service command, before the mongo-express script."""
+    command = service["command"].split()
+    start = command.index("node") + 1
+    return command[start:-1]
+
+
+def _start_mongo_express(service: dict, drain_dir: str) -> tuple:
+    """Start mongo-express as the service, returning its process and port."""
+    port = _free_port()
+    process = subprocess.Popen(
+        ["node", *_node_arguments(service), "app.js"],
+        cwd=MONGO_EXPRESS_PATH,
+        env=_local_environment(service, port, drain_dir),
+        stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}/"
+    if not wait_for(lambda: http_get(url, headers=_auth_headers()) == 200, STARTUP_TIMEOUT):
+        _stop(process)
+        pytest.fail("mongo-express did not start")
+    return process, port
+
+
+@pytest.fixture(scope="module", params=REQUEST_SIZES)
+def mongo_express(request, module_mocker: MockerFixture, tmp_path_factory, mongod):
+    """Run mongo-express as the charm configures it, for a request-size setting."""
+    service, _ = _render(
+        module_mocker, {"request-size": request.param, "enable-gridfs": True}, mongod
+    )
+    process, port = _start_mongo_express(service, str(tmp_path_factory.mktemp("drain")))
+    try:
+        yield request.param, port, process.pid
+    finally:
+        _stop(process)
+
+
+@pytest.fixture(scope="module")
+def proxied(module_mocker: MockerFixture, tmp_path_factory, mongod):
+    """Run mongo-express behind nginx as the charm configures them, returning the nginx port."""
+    if not shutil.which("nginx"):
+        pytest.skip("needs nginx on the PATH")
+    config = {
+        "enable-proxy": True,
+        "enable-gridfs": True,
+        "gridfs-max-upload-size": MAX_UPLOAD_SIZE,
+    }
+    service, proxy_config = _render(module_mocker, config, mongod)
+    process, port = _start_mongo_express(service, str(tmp_path_factory.mktemp("drain")))
+    prefix = tmp_path_factory.mktemp("nginx")
+    proxy_port = _free_port()
+    upstream_port = service["environment"]["VCAP_APP_PORT"]
+    proxy_config = (
+        proxy_config.replace(f"server 127.0.0.1:{upstream_port};", f"server 127.0.0.1:{port};")
+        .replace(f"listen {PORT};", f"listen 127.0.0.1:{proxy_port};")
+        .replace(proxy.CACHE_PATH, str(prefix / "cache"))
+    )
+    (prefix / "nginx.conf").write_text(proxy_config)
+    nginx = subprocess.Popen(
+        [
+            "nginx",
+            "-p",
+            str(prefix),
+            "-c",
+            str(prefix / "nginx.conf"),
+            "-g",
+            f"daemon off; pid {prefix / 'nginx.pid'};",
+        ],
+    )
+    try:
+        if not wait_for(lambda: _accepts_connections(proxy_port), STARTUP_TIMEOUT):
+            pytest.fail("nginx did not start")
+        yield proxy_port, process.pid
+    finally:
+        _stop(nginx)
+        _stop(process)
+
+
+def _upload(port: int, name: str, size: int) -> int:
+    """Upload a file of size random bytes as a multipart form, returning the status."""
+    boundary = uuid.uuid4().hex
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{name}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode("utf-8")
+    tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+    body = head + os.urandom(size) + tail
+    headers = dict(
+        _auth_headers(),
+        **{"Content-Type": f"multipart/form-data; boundary={boundary}"},
+    )
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=TRANSFER_TIMEOUT)
+    try:
+        connection.request("POST", f"/db/{DATABASE}/gridFS/{BUCKET}", body, headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def _file_id(port: int, name: str) -> str:
+    """Return the id of the uploaded file, from the bucket page."""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=TRANSFER_TIMEOUT)
+    try:
+        connection.request("GET", f"/db/{DATABASE}/gridFS/{BUCKET}", headers=_auth_headers())
+        page = connection.getresponse().read().decode("utf-8")
+    finally:
+        connection.close()
+    for row in page.split("<tr")[1:]:
+        match = re.search(rf"gridFS/{BUCKET}/([0-9a-f]{{24}})", row)
+        if name in row and match:
+            return match.group(1)
+    raise AssertionError(f"{name} is not listed in the bucket")
+
+
+def _download(port: int, file_id: str) -> int:
+    """Download a file, streaming it, and return the number of bytes received."""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=TRANSFER_TIMEOUT)
+    try:
+        connection.request(
+            "GET", f"/db/{DATABASE}/gridFS/{BUCKET}/{file_id}", headers=_auth_headers()
+        )
+        response = connection.getresponse()
+        assert response.status == 200
+        received = 0
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                return received
+            received += len(chunk)
+    finally:
+        connection.close()
+
+
+def _throughput(size: int, seconds: float) -> float:
+    """Return the throughput in MiB/s."""
+    return round(size / (1 << 20) / seconds, 2) if seconds else 0.0
+
+
+@pytest.mark.parametrize("file_size", FILE_SIZES)
+def test_transfer(results, mongo_express, file_size):
+    request_size, port, pid = mongo_express
+    size = parse_size(file_size)
+    name = f"{request_size}-{file_size}.bin"
+    _reset_peak_rss(pid)
+    start = time.perf_counter()
+    status = _upload(port, name, size)
+    upload_seconds = time.perf_counter() - start
+    result = {"upload-status": status, "peak-rss-mib": round(_peak_rss(pid) / (1 << 20), 1)}
+    if status < 400:
+        file_id = _file_id(port, name)
+        start = time.perf_counter()
+        received = _download(port, file_id)
+        download_seconds = time.perf_counter() - start
+        assert received == size
+        result.update(
+            {
+                "upload-mib-s": _throughput(size, upload_seconds),
+                "download-mib-s": _throughput(size, download_seconds),
+                "peak-rss-mib": round(_peak_rss(pid) / (1 << 20), 1),
+            }
+        )
+    results.setdefault(request_size, {})[file_size] = result
+    logger.info(f"request-size {request_size}, {file_size} file: {result}")
+
+
+@pytest.mark.parametrize("file_size", PROXIED_FILE_SIZES)
+def test_proxied_upload(results, proxied, file_size):
+    port, pid = proxied
+    size = parse_size(file_size)
+    name = f"proxied-{file_size}.bin"
+    _reset_peak_rss(pid)
+    start = time.perf_counter()
+    status = _upload(port, name, size)
+    upload_seconds = time.perf_counter() - start
+    result = {"upload-status": status, "peak-rss-mib": round(_peak_rss(pid) / (1 << 20), 1)}
+    if PROXIED_FILE_SIZES[file_size]:
+        assert status < 400
+        file_id = _file_id(port, name)
+        start = time.perf_counter()
+        assert _download(port, file_id) == size
+        result.update(
+            {
+                "upload-mib-s": _throughput(size, upload_seconds),
+                "download-mib-s": _throughput(size, time.perf_counter() - start),
+            }
+        )
+    else:
+        # nginx rejects it before it reaches mongo-express.
+        assert status == 413
+    results.setdefault(f"proxied-{MAX_UPLOAD_SIZE}", {})[file_size] = result
+    logger.info(f"proxied, gridfs-max-upload-size {MAX_UPLOAD_SIZE}, {file_size} file: {result}")
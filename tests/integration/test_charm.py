@@ -31,6 +31,7 @@ async def test_build_and_deploy(ops_test: OpsTest):
     charm = await ops_test.build_charm(".")
     resources = {
         "mongo-express-image": METADATA["resources"]["mongo-express-image"]["upstream-source"],
+        "proxy-image": METADATA["resources"]["proxy-image"]["upstream-source"],
     }
     await ops_test.model.deploy(
         charm, resources=resources, application_name="mongo-express", trust=True
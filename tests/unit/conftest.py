@@ -0,0 +1,42 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import pytest
+from ops.testing import Harness
+from pytest_mock import MockerFixture
+
+from charm import MongoExpressCharm
+
+
+@pytest.fixture
+def cluster(mocker: MockerFixture):
+    """Mock the peer cluster, never holding up a restart; overridden to use the real one."""
+    cluster_mock = mocker.patch("charm.MongoExpressCluster")
+    cluster_mock.return_value.restart_pending = False
+    return cluster_mock
+
+
+@pytest.fixture
+def leader() -> bool:
+    """Whether the unit is the leader when the charm starts."""
+    return False
+
+
+@pytest.fixture
+def charm_config() -> dict:
+    """Options set before the charm starts."""
+    return {}
+
+
+@pytest.fixture
+def harness(mocker: MockerFixture, cluster, leader: bool, charm_config: dict):
+    mocker.patch("charm.MongoExpressCharm._read_workload_file", return_value=None)
+    mocker.patch("charm.http_get", return_value=200)
+    mongo_harness = Harness(MongoExpressCharm)
+    mongo_harness.set_leader(leader)
+    mongo_harness.update_config(charm_config)
+    mongo_harness.begin()
+    yield mongo_harness
+    # With profile-hooks, the dispatch profiler only stops on commit.
+    mongo_harness.charm.instrumentation.close()
+    mongo_harness.cleanup()
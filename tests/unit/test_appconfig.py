@@ -0,0 +1,108 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+import shutil
+import subprocess
+
+import pytest
+from ops.model import BlockedStatus
+from ops.testing import Harness
+from pytest_mock import MockerFixture
+
+import appconfig
+
+DEFAULT_CONFIG = """
+module.exports = {
+  site: { baseUrl: process.env.ME_CONFIG_SITE_BASEURL || "/" },
+  options: { documentsPerPage: 10, editorTheme: "default", noExport: false },
+};
+"""
+
+
+def _config_js(harness: Harness) -> str:
+    return harness.charm.container.pull(appconfig.CONFIG_PATH).read()
+
+
+def test_render_config():
+    config = appconfig.render_config(
+        documents_per_page=50, max_prop_size=1024, max_row_size=4096, export=False
+    )
+    assert config.startswith("// Generated by the mongo-express charm, do not edit.\n")
+    assert 'const defaults = require("./config.default");' in config
+    assert "    documentsPerPage: 50,\n" in config
+    assert "    maxPropSize: 1024,\n" in config
+    assert "    maxRowSize: 4096,\n" in config
+    assert "    noExport: true,\n" in config
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_render_config_merges_defaults(tmp_path):
+    (tmp_path / "config.default.js").write_text(DEFAULT_CONFIG)
+    (tmp_path / "config.js").write_text(appconfig.render_config(documents_per_page=25))
+    output = subprocess.check_output(
+        ["node", "-e", "console.log(JSON.stringify(require('./config')))"],
+        cwd=tmp_path,
+        env={"ME_CONFIG_SITE_BASEURL": "/mongo/"},
+    )
+    assert json.loads(output) == {
+        "site": {"baseUrl": "/mongo/"},
+        "options": {
+            "documentsPerPage": 25,
+            "editorTheme": "default",
+            "maxPropSize": 102400,
+            "maxRowSize": 1048576,
+            "noExport": False,
+        },
+    }
+
+
+def test_config_js_pushed(harness: Harness):
+    harness.update_config(
+        {"documents-per-page": 100, "max-prop-size": "10kb", "enable-export": False}
+    )
+    harness.charm.on.mongo_express_pebble_ready.emit("mongo-express")
+    harness.framework.commit()
+    config = _config_js(harness)
+    assert "    documentsPerPage: 100,\n" in config
+    assert "    maxPropSize: 10240,\n" in config
+    assert "    noExport: true,\n" in config
+
+
+def test_config_js_change_restarts_mongo_express(mocker: MockerFixture, harness: Harness):
+    harness.charm.on.mongo_express_pebble_ready.emit("mongo-express")
+    harness.framework.commit()
+    environment = harness.charm.services["mongo-express"].environment
+    digest = environment["CONFIG_JS_DIGEST"]
+    replan_spy = mocker.spy(harness.charm.container, "replan")
+    harness.update_config({"documents-per-page": 20})
+    harness.framework.commit()
+    assert harness.charm.services["mongo-express"].environment["CONFIG_JS_DIGEST"] != digest
+    assert "    documentsPerPage: 20,\n" in _config_js(harness)
+    replan_spy.assert_called_once()
+
+
+def test_config_js_pushed_only_when_changed(mocker: MockerFixture, harness: Harness):
+    harness.charm.on.mongo_express_pebble_ready.emit("mongo-express")
+    harness.framework.commit()
+    push_spy = mocker.spy(harness.charm.container, "push")
+    harness.update_config({"read-only": True})
+    harness.framework.commit()
+    assert appconfig.CONFIG_PATH not in [call.args[0] for call in push_spy.call_args_list]
+
+
+@pytest.mark.parametrize(
+    "config,message",
+    [
+        ({"documents-per-page": 0}, "documents-per-page: must be at least 1."),
+        ({"documents-per-page": 5000}, "documents-per-page: must not exceed 1000."),
+        (
+            {"max-row-size": "1 mb"},
+            "max-row-size: must be a number of bytes, optionally followed by b, kb, mb or gb.",
+        ),
+    ],
+)
+def test_invalid_options(harness: Harness, config: dict, message: str):
+    harness.update_config(config)
+    harness.framework.commit()
+    assert harness.charm.unit.status == BlockedStatus(message)
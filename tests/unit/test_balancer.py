@@ -0,0 +1,99 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import http.server
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+BALANCER = Path(__file__).parents[2] / "files" / "balancer.js"
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _backend(name: str):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            body = name.encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def balancer():
+    backends = [_backend("worker-0"), _backend("worker-1")]
+    port = _free_port()
+    # The last backend port is not listening, as if the worker was restarting.
+    ports = [server.server_address[1] for server in backends] + [_free_port()]
+    process = subprocess.Popen(
+        ["node", str(BALANCER)],
+        env=dict(
+            os.environ,
+            BALANCER_PORT=str(port),
+            BALANCER_BACKENDS=",".join(str(backend_port) for backend_port in ports),
+        ),
+        stdout=subprocess.PIPE,
+    )
+    process.stdout.readline()
+    yield f"http://127.0.0.1:{port}"
+    process.terminate()
+    process.wait(timeout=10)
+    for server in backends:
+        server.shutdown()
+
+
+def _get(url: str) -> str:
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return response.read().decode()
+
+
+def test_balancer_round_robin_skips_down_workers(balancer: str):
+    answers = [_get(balancer) for _ in range(6)]
+    assert sorted(set(answers)) == ["worker-0", "worker-1"]
+    assert abs(answers.count("worker-0") - answers.count("worker-1")) <= 2
+
+
+def test_balancer_retries_without_leaking_listeners():
+    backend = _backend("worker-0")
+    port = _free_port()
+    # Twelve retries on workers that are down, beyond the listener limit of a socket.
+    ports = [_free_port() for _ in range(12)] + [backend.server_address[1]]
+    process = subprocess.Popen(
+        ["node", "--trace-warnings", str(BALANCER)],
+        env=dict(
+            os.environ,
+            BALANCER_PORT=str(port),
+            BALANCER_BACKENDS=",".join(str(backend_port) for backend_port in ports),
+        ),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        process.stdout.readline()
+        assert _get(f"http://127.0.0.1:{port}") == "worker-0"
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        backend.shutdown()
+    assert b"MaxListenersExceededWarning" not in process.stderr.read()
@@ -2,18 +2,19 @@
 # See LICENSE file for licensing details.
 
 import pytest
+from ops.model import ActiveStatus, WaitingStatus
 from ops.testing import Harness
 from pytest_mock import MockerFixture
 
-from charm import MongoExpressCharm
-
 
 @pytest.fixture
-def harness():
-    mongo_harness = Harness(MongoExpressCharm)
-    mongo_harness.begin()
-    yield mongo_harness
-    mongo_harness.cleanup()
+def cluster():
+    """The real peer cluster."""
+
+
+@pytest.fixture(autouse=True)
+def http_ready(mocker: MockerFixture):
+    mocker.patch("charm.is_http_ready", return_value=True)
 
 
 def test_cluster_relation(mocker: MockerFixture, harness: Harness):
@@ -23,3 +24,171 @@ def test_cluster_relation(mocker: MockerFixture, harness: Harness):
     harness.update_relation_data(peer_rel_id, "test-charm", {})
     harness.charm.cluster.set_web_password("password")
     assert harness.charm.cluster.web_password == "password"
+
+
+def test_cluster_relation_changed_deduplicates_password(mocker: MockerFixture, harness: Harness):
+    peer_rel_id = harness.add_relation("cluster", "davigar15-mongo-express")
+    harness.add_relation_unit(peer_rel_id, "davigar15-mongo-express/1")
+    observer = mocker.spy(harness.charm, "_on_config_changed")
+    harness.update_relation_data(
+        peer_rel_id, "davigar15-mongo-express", {"web-password": "password"}
+    )
+    harness.update_relation_data(
+        peer_rel_id, "davigar15-mongo-express/1", {"some-key": "some-value"}
+    )
+    assert observer.call_count == 1
+    assert harness.charm.cluster.duplicate_events == 1
+
+
+@pytest.mark.parametrize("max_restarts", [1, 3])
+def test_rolling_restart_lock_limits_concurrent_restarts(harness: Harness, max_restarts: int):
+    app = "davigar15-mongo-express"
+    harness.set_leader(True)
+    harness.update_config({"max-concurrent-restarts": max_restarts})
+    peer_rel_id = harness.add_relation("cluster", app)
+    units = [f"{app}/{number}" for number in range(1, 25)]
+    for unit in units:
+        harness.add_relation_unit(peer_rel_id, unit)
+    for number, unit in enumerate(units):
+        harness.update_relation_data(peer_rel_id, unit, {"restart-request": str(number)})
+        assert len(harness.charm.cluster.restart_grants) <= max_restarts
+
+    restarted = []
+    while harness.charm.cluster.restart_grants:
+        down = harness.charm.cluster.restart_grants
+        assert len(down) <= max_restarts
+        # The first granted unit becomes healthy again and releases the lock.
+        restarted.append(down[0])
+        harness.update_relation_data(peer_rel_id, down[0], {"restart-request": ""})
+    assert restarted == units
+
+
+def test_rolling_restart_lock_departed_unit_is_released(harness: Harness):
+    app = "davigar15-mongo-express"
+    harness.set_leader(True)
+    peer_rel_id = harness.add_relation("cluster", app)
+    for unit in (f"{app}/1", f"{app}/2"):
+        harness.add_relation_unit(peer_rel_id, unit)
+        harness.update_relation_data(peer_rel_id, unit, {"restart-request": "1"})
+    assert harness.charm.cluster.restart_grants == [f"{app}/1"]
+    harness.remove_relation_unit(peer_rel_id, f"{app}/1")
+    assert harness.charm.cluster.restart_grants == [f"{app}/2"]
+
+
+def test_rolling_restart_lock_revoked_from_unit_never_ready(
+    mocker: MockerFixture, harness: Harness
+):
+    app = "davigar15-mongo-express"
+    clock = mocker.patch("cluster.time.time", return_value=1000.0)
+    harness.set_leader(True)
+    harness.update_config({"restart-lock-timeout": 300})
+    peer_rel_id = harness.add_relation("cluster", app)
+    units = [f"{app}/{number}" for number in range(1, 4)]
+    for number, unit in enumerate(units):
+        harness.add_relation_unit(peer_rel_id, unit)
+        harness.update_relation_data(peer_rel_id, unit, {"restart-request": str(number)})
+    assert harness.charm.cluster.restart_grants == [f"{app}/1"]
+    # app/1 restarted but never becomes ready: it keeps its request, and never releases it.
+    clock.return_value = 1200.0
+    harness.charm.on.update_status.emit()
+    harness.framework.commit()
+    assert harness.charm.cluster.restart_grants == [f"{app}/1"]
+    clock.return_value = 1301.0
+    harness.charm.on.update_status.emit()
+    harness.framework.commit()
+    assert harness.charm.cluster.restart_grants == [f"{app}/2"]
+    # The rollout goes on without app/1.
+    harness.update_relation_data(peer_rel_id, f"{app}/2", {"restart-request": ""})
+    assert harness.charm.cluster.restart_grants == [f"{app}/3"]
+    harness.update_relation_data(peer_rel_id, f"{app}/3", {"restart-request": ""})
+    # The leader itself queued behind them on config-changed.
+    assert harness.charm.cluster.restart_grants == [f"{app}/0"]
+    harness.charm.cluster.release_restart()
+    harness.framework.commit()
+    assert harness.charm.cluster.restart_grants == []
+
+
+def test_rolling_restart_lock_requested_again_once_revoked(
+    mocker: MockerFixture, harness: Harness
+):
+    app = "davigar15-mongo-express"
+    clock = mocker.patch("cluster.time.time", return_value=1000.0)
+    wait_mock = mocker.patch("charm.wait_for", return_value=False)
+    harness.set_leader(True)
+    harness.update_config({"restart-lock-timeout": 300})
+    peer_rel_id = harness.add_relation("cluster", app)
+    harness.add_relation_unit(peer_rel_id, f"{app}/1")
+    harness.charm.on.mongo_express_pebble_ready.emit("mongo-express")
+    harness.framework.commit()
+    # This unit restarted but never becomes ready, and loses the lock to app/1.
+    assert harness.charm.cluster.restart_grants == [f"{app}/0"]
+    harness.update_relation_data(peer_rel_id, f"{app}/1", {"restart-request": "1100"})
+    clock.return_value = 1301.0
+    harness.charm.on.update_status.emit()
+    harness.framework.commit()
+    assert harness.charm.cluster.restart_grants == [f"{app}/1"]
+    harness.update_relation_data(peer_rel_id, f"{app}/1", {"restart-request": ""})
+    assert harness.charm.cluster.restart_grants == []
+    # The next change requests the lock anew, and restarts.
+    clock.return_value = 1400.0
+    wait_mock.return_value = True
+    harness.update_config({"read-only": True})
+    harness.framework.commit()
+    assert isinstance(harness.charm.unit.status, ActiveStatus)
+    environment = harness.charm.container.get_plan().services["mongo-express"].environment
+    assert environment["ME_CONFIG_OPTIONS_READONLY"] is True
+    assert not harness.charm.cluster.restart_pending
+
+
+def test_restart_waits_for_lock_on_non_leader(mocker: MockerFixture, harness: Harness):
+    app = "davigar15-mongo-express"
+    peer_rel_id = harness.add_relation("cluster", app)
+    harness.add_relation_unit(peer_rel_id, f"{app}/1")
+    harness.update_relation_data(peer_rel_id, app, {"web-password": "password"})
+    harness.framework.commit()
+    unit_name = harness.charm.unit.name
+    assert harness.charm.unit.status == WaitingStatus("waiting for restart lock")
+    assert harness.charm.cluster.restart_pending
+    assert harness.get_container_pebble_plan("mongo-express").services == {}
+
+    harness.update_relation_data(peer_rel_id, app, {"restart-grants": f'["{unit_name}"]'})
+    harness.framework.commit()
+    assert isinstance(harness.charm.unit.status, ActiveStatus)
+    assert "mongo-express" in harness.get_container_pebble_plan("mongo-express").services
+    assert not harness.charm.cluster.restart_pending
+
+
+def test_site_secrets_shared_through_cluster_relation(mocker: MockerFixture, harness: Harness):
+    app = "davigar15-mongo-express"
+    peer_rel_id = harness.add_relation("cluster", app)
+    harness.add_relation_unit(peer_rel_id, f"{app}/1")
+    observer = mocker.spy(harness.charm, "_on_config_changed")
+    harness.update_relation_data(
+        peer_rel_id, app, {"cookie-secret": "cookie", "session-secret": "session"}
+    )
+    assert observer.call_count == 1
+    assert harness.charm.cluster.cookie_secret == "cookie"
+    assert harness.charm.cluster.session_secret == "session"
+    environment = harness.charm._get_pebble_layer()["services"]["mongo-express"]["environment"]
+    assert environment["ME_CONFIG_SITE_COOKIESECRET"] == "cookie"
+    assert environment["ME_CONFIG_SITE_SESSIONSECRET"] == "session"
+
+
+def test_leader_generates_site_secrets(harness: Harness):
+    harness.set_leader(True)
+    harness.add_relation("cluster", "davigar15-mongo-express")
+    assert harness.charm.cluster.cookie_secret
+    assert harness.charm.cluster.session_secret
+    assert harness.charm.cluster.cookie_secret != harness.charm.cluster.session_secret
+
+
+def test_ready_units(harness: Harness):
+    app = "davigar15-mongo-express"
+    peer_rel_id = harness.add_relation("cluster", app)
+    harness.add_relation_unit(peer_rel_id, f"{app}/1")
+    harness.add_relation_unit(peer_rel_id, f"{app}/2")
+    harness.update_relation_data(peer_rel_id, f"{app}/2", {"ready": "true"})
+    harness.charm.cluster.set_ready(True)
+    assert harness.charm.cluster.ready_units == [f"{app}/0", f"{app}/2"]
+    harness.charm.cluster.set_ready(False)
+    assert harness.charm.cluster.ready_units == [f"{app}/2"]
@@ -0,0 +1,106 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import http.client
+import json
+import shutil
+import signal
+import socket
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+HOOK = Path(__file__).parents[2] / "files" / "drain-hook.js"
+# Stands for mongo-express: /slow answers after a second.
+SERVER = """
+require("http")
+  .createServer((request, response) => {
+    const delay = request.url === "/slow" ? 1000 : 0;
+    setTimeout(() => response.end("done"), delay);
+  })
+  .listen(process.env.VCAP_APP_PORT, "127.0.0.1");
+"""
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait(predicate, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def worker(tmp_path):
+    port = _free_port()
+    process = subprocess.Popen(
+        ["node", f"--require={HOOK}", "-e", SERVER],
+        env={"DRAIN_DIR": str(tmp_path), "VCAP_APP_PORT": str(port), "PATH": "/usr/bin:/bin"},
+    )
+    state_file = tmp_path / f"worker-{port}.json"
+
+    def state() -> dict:
+        try:
+            return json.loads(state_file.read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    _wait(lambda: state() and _is_listening(port))
+    yield process, port, state
+    process.kill()
+    process.wait()
+
+
+def _is_listening(port: int) -> bool:
+    try:
+        socket.create_connection(("127.0.0.1", port), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+
+def test_state_written_on_startup(worker):
+    process, _, state = worker
+    assert state() == {"pid": process.pid, "draining": False, "inflight": 0}
+
+
+def test_drain_waits_for_requests_in_flight(worker):
+    process, port, state = worker
+    responses = []
+
+    def slow_request():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        connection.request("GET", "/slow")
+        response = connection.getresponse()
+        responses.append((response.status, response.read(), response.getheader("Connection")))
+
+    thread = threading.Thread(target=slow_request)
+    thread.start()
+    time.sleep(0.3)
+    process.send_signal(signal.SIGUSR2)
+    _wait(lambda: state().get("draining"))
+    assert state()["inflight"] == 1
+    assert not _is_listening(port)
+    thread.join()
+    assert responses == [(200, b"done", "close")]
+    _wait(lambda: state()["inflight"] == 0)
+
+
+def test_drain_closes_idle_connections(worker):
+    process, port, state = worker
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    connection.request("GET", "/")
+    assert connection.getresponse().read() == b"done"
+    process.send_signal(signal.SIGUSR2)
+    _wait(lambda: state().get("draining"))
+    assert connection.sock.recv(1) == b""
@@ -0,0 +1,126 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import os
+import shutil
+import socket
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+FILES = Path(__file__).parents[2] / "files"
+# A mongo-express stand-in: answers 200, or 404 on /missing.
+WORKER = """
+require("http").createServer((request, response) => {
+  response.writeHead(request.url === "/missing" ? 404 : 200);
+  response.end();
+}).listen(process.env.VCAP_APP_PORT, () => console.log("listening"));
+"""
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+@pytest.fixture
+def processes():
+    processes = []
+    yield processes
+    for process in processes:
+        process.terminate()
+        process.wait()
+
+
+def _start(processes, command, environment):
+    process = subprocess.Popen(command, env=environment, stdout=subprocess.PIPE)
+    processes.append(process)
+    process.stdout.readline()
+    return process
+
+
+def test_exporter_serves_worker_and_charm_metrics(tmp_path, processes):
+    worker_port, exporter_port = _free_port(), _free_port()
+    environment = dict(os.environ, METRICS_DIR=str(tmp_path), METRICS_INTERVAL_MS="100")
+    _start(
+        processes,
+        ["node", f"--require={FILES / 'metrics-hook.js'}", "-e", WORKER],
+        dict(environment, VCAP_APP_PORT=str(worker_port)),
+    )
+    for path in ("/", "/", "/missing"):
+        _get(f"http://127.0.0.1:{worker_port}{path}")
+    (tmp_path / "charm.prom").write_text("mongo_express_charm_restarts_total 1\n")
+    _start(
+        processes,
+        ["node", str(FILES / "exporter.js")],
+        dict(environment, METRICS_PORT=str(exporter_port)),
+    )
+    time.sleep(0.5)
+
+    with urllib.request.urlopen(f"http://127.0.0.1:{exporter_port}/metrics") as response:
+        body = response.read().decode()
+    assert "mongo_express_workers_up 1\n" in body
+    assert 'mongo_express_http_requests_total{code="2xx"} 2\n' in body
+    assert 'mongo_express_http_requests_total{code="4xx"} 1\n' in body
+    assert 'mongo_express_http_request_duration_seconds_bucket{le="+Inf"} 3\n' in body
+    assert "mongo_express_http_request_duration_seconds_count 3\n" in body
+    assert body.endswith("mongo_express_charm_restarts_total 1\n")
+    assert _get(f"http://127.0.0.1:{exporter_port}/") == 404
+
+
+def test_exporter_serves_log_forwarder_counters(tmp_path, processes):
+    port = _free_port()
+    stats = tmp_path / "logs" / "stats.json"
+    stats.parent.mkdir()
+    stats.write_text(
+        '{"read": 12, "sent": 10, "dropped": 1, "batches": 2, "failures": 3, "buffered": 1}'
+    )
+    (tmp_path / "charm.prom").write_text("mongo_express_charm_restarts_total 1\n")
+    _start(
+        processes,
+        ["node", str(FILES / "exporter.js")],
+        dict(
+            os.environ,
+            METRICS_DIR=str(tmp_path),
+            METRICS_PORT=str(port),
+            LOG_STATS_PATH=str(stats),
+        ),
+    )
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        body = response.read().decode()
+    assert 'mongo_express_log_lines_total{state="read"} 12\n' in body
+    assert 'mongo_express_log_lines_total{state="sent"} 10\n' in body
+    assert 'mongo_express_log_lines_total{state="dropped"} 1\n' in body
+    assert "mongo_express_log_batches_total 2\n" in body
+    assert "mongo_express_log_push_failures_total 3\n" in body
+    assert "mongo_express_log_lines_buffered 1\n" in body
+    assert body.endswith("mongo_express_charm_restarts_total 1\n")
+
+
+def test_exporter_without_workers(tmp_path, processes):
+    port = _free_port()
+    _start(
+        processes,
+        ["node", str(FILES / "exporter.js")],
+        dict(os.environ, METRICS_DIR=str(tmp_path / "missing"), METRICS_PORT=str(port)),
+    )
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        body = response.read().decode()
+    assert "mongo_express_workers_up 0\n" in body
+    assert "mongo_express_resident_memory_bytes 0\n" in body
+    assert "mongo_express_log_lines_total" not in body
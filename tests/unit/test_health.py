@@ -0,0 +1,41 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import pytest
+
+import health
+
+
+def test_summarise():
+    samples = [[float(latency), 2.0] for latency in range(1, 20)] + [[None, 3.0]]
+    summary = health.summarise(samples)
+    assert summary.probes == 20
+    assert summary.errors == 1
+    assert summary.error_rate == 0.05
+    assert summary.http_p95 == 19.0
+    assert summary.mongodb_p95 == 2.0
+    assert summary.message == "p95 19ms, mongodb p95 2ms"
+
+
+def test_summarise_failed_probes():
+    summary = health.summarise([[None, None]])
+    assert summary.error_rate == 1.0
+    assert summary.http_p95 is None
+    assert summary.message == ""
+
+
+@pytest.mark.parametrize(
+    "samples,latency_threshold,error_threshold,problem",
+    [
+        ([[40.0, 2.0]], 100, 50, None),
+        ([[400.0, 2.0]], 100, 50, "p95 400ms over 100ms"),
+        ([[40.0, 250.0]], 100, 50, "mongodb p95 250ms over 100ms"),
+        ([[400.0, 2.0]], 0, 50, None),
+        ([[40.0, None], [None, 2.0], [40.0, 2.0]], 100, 50, "67% probes failed"),
+        ([[40.0, None], [40.0, 2.0]], 100, 50, None),
+        ([[None, None]], 100, 0, None),
+    ],
+)
+def test_check(samples, latency_threshold, error_threshold, problem):
+    summary = health.summarise(samples)
+    assert health.check(summary, latency_threshold, error_threshold) == problem
@@ -0,0 +1,145 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import pytest
+from ops.model import BlockedStatus
+from ops.testing import Harness
+from pytest_mock import MockerFixture
+
+import ingress
+from utils import READY_PATH
+
+APP = "davigar15-mongo-express"
+
+
+@pytest.fixture
+def cluster():
+    """The real peer cluster."""
+
+
+@pytest.fixture(autouse=True)
+def http_ready(mocker: MockerFixture):
+    mocker.patch("charm.is_http_ready", return_value=True)
+
+
+@pytest.fixture
+def leader() -> bool:
+    return True
+
+
+@pytest.fixture
+def harness(harness: Harness) -> Harness:
+    harness.add_relation("cluster", APP)
+    harness.framework.commit()
+    return harness
+
+
+def _relate(harness: Harness) -> int:
+    relation_id = harness.add_relation("ingress", "nginx-ingress")
+    harness.add_relation_unit(relation_id, "nginx-ingress/0")
+    harness.framework.commit()
+    return relation_id
+
+
+def _start(harness: Harness):
+    harness.charm.on.mongo_express_pebble_ready.emit("mongo-express")
+    harness.framework.commit()
+
+
+@pytest.mark.parametrize(
+    "config,size",
+    [
+        ({}, 100 << 10),
+        ({"request-size": "1mb"}, 1 << 20),
+        ({"enable-gridfs": True}, 16 << 20),
+        ({"enable-gridfs": True, "request-size": "32mb"}, 32 << 20),
+        ({"enable-gridfs": True, "gridfs-max-upload-size": "0"}, 0),
+        ({"enable-gridfs": False, "gridfs-max-upload-size": "0"}, 100 << 10),
+    ],
+)
+def test_max_body_size(config: dict, size: int):
+    assert ingress.max_body_size(config) == size
+
+
+def test_leader_publishes_service(harness: Harness):
+    harness.update_config({"ingress-hostname": "mongo.example.com"})
+    relation_id = _relate(harness)
+    assert harness.get_relation_data(relation_id, APP) == {
+        "service-hostname": "mongo.example.com",
+        "service-name": APP,
+        "service-port": "8081",
+        "max-body-size": "1",
+        "session-cookie-max-age": "86400",
+    }
+
+
+@pytest.mark.parametrize(
+    "config,size", [({"request-size": "16mb"}, "16"), ({"request-size": "1025kb"}, "2")]
+)
+def test_body_size_follows_request_size(harness: Harness, config: dict, size: str):
+    relation_id = _relate(harness)
+    harness.update_config(config)
+    harness.framework.commit()
+    assert harness.get_relation_data(relation_id, APP)["max-body-size"] == size
+
+
+def test_invalid_config_not_published(harness: Harness):
+    relation_id = _relate(harness)
+    harness.update_config({"request-size": "16 mb"})
+    harness.framework.commit()
+    assert isinstance(harness.charm.unit.status, BlockedStatus)
+    assert harness.get_relation_data(relation_id, APP)["max-body-size"] == "1"
+
+
+def test_non_leader_publishes_no_service(harness: Harness):
+    harness.set_leader(False)
+    relation_id = _relate(harness)
+    assert harness.get_relation_data(relation_id, APP) == {}
+    assert harness.get_relation_data(relation_id, f"{APP}/0") == {}
+
+
+def test_pod_ready_once_ready(mocker: MockerFixture, harness: Harness):
+    wait_mock = mocker.patch("charm.wait_for", return_value=False)
+    harness.update_config({"read-only": True})
+    _start(harness)
+    container = harness.charm.container
+    assert not container.exists(READY_PATH)
+    wait_mock.return_value = True
+    harness.charm.on.config_changed.emit()
+    harness.framework.commit()
+    assert container.exists(READY_PATH)
+
+
+def test_pod_unready_while_restarting(mocker: MockerFixture, harness: Harness):
+    _start(harness)
+    container = harness.charm.container
+    readiness = []
+    mocker.patch.object(
+        harness.charm,
+        "_drain",
+        side_effect=lambda _: readiness.append(container.exists(READY_PATH)),
+    )
+    wait_mock = mocker.patch("charm.wait_for", return_value=False)
+    harness.update_config({"read-only": True})
+    harness.framework.commit()
+    # Out of the Service endpoints before the workers are drained.
+    assert readiness == [False]
+    assert not container.exists(READY_PATH)
+    wait_mock.return_value = True
+    harness.charm.on.config_changed.emit()
+    harness.framework.commit()
+    assert container.exists(READY_PATH)
+
+
+def test_degraded_pod_unready(mocker: MockerFixture, harness: Harness):
+    _start(harness)
+    mocker.patch("charm.http_get", return_value=500)
+    harness.charm.on.update_status.emit()
+    harness.framework.commit()
+    assert not harness.charm.container.exists(READY_PATH)
+
+
+def test_serving_check(harness: Harness):
+    checks = harness.charm._get_pebble_layer()["checks"]
+    assert checks["mongo-express-serving"]["level"] == "ready"
+    assert checks["mongo-express-serving"]["exec"] == {"command": f"test -f {READY_PATH}"}
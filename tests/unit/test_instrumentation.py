@@ -0,0 +1,108 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import logging
+import sys
+
+import pytest
+from ops.testing import Harness
+from pytest_mock import MockerFixture
+
+import instrumentation
+
+
+@pytest.fixture
+def cluster():
+    """The real peer cluster."""
+
+
+@pytest.fixture
+def charm_config() -> dict:
+    return {"profile-hooks": True}
+
+
+@pytest.fixture(autouse=True)
+def profile_dir(mocker: MockerFixture, tmp_path):
+    mocker.patch("instrumentation.PROFILE_DIR", str(tmp_path))
+
+
+@pytest.fixture
+def dispatch(monkeypatch):
+    monkeypatch.setenv("JUJU_DISPATCH_PATH", "hooks/config-changed")
+
+
+def test_handlers_are_measured(caplog, harness: Harness):
+    harness.add_relation("cluster", "davigar15-mongo-express")
+    harness.charm.instrumentation._stored.samples = {}
+    caplog.set_level(logging.DEBUG, logger="instrumentation")
+    harness.charm.on.mongo_express_pebble_ready.emit("mongo-express")
+    harness.framework.commit()
+    aggregates = harness.charm.instrumentation.aggregates
+    assert set(aggregates) == {"charm-mongo-express-pebble-ready", "charm-pre-commit", "dispatch"}
+    assert aggregates["charm-mongo-express-pebble-ready"]["mean-pebble-calls"] == 0
+    assert aggregates["charm-pre-commit"]["mean-pebble-calls"] > 0
+    assert aggregates["dispatch"]["calls"] == 1
+    assert aggregates["dispatch"]["max-ms"] >= aggregates["charm-pre-commit"]["max-ms"]
+    assert '"handler": "charm-pre-commit"' in caplog.text
+
+
+@pytest.mark.parametrize("leader", [True])
+def test_relation_data_round_trips(harness: Harness):
+    harness.add_relation("cluster", "davigar15-mongo-express")
+    harness.framework.commit()
+    aggregates = harness.charm.instrumentation.aggregates
+    assert aggregates["charm-cluster-ready"]["mean-relation-reads"] == 1
+    # The leader publishes the web password and the cookie and session secrets, and
+    # joins the ready set once restarted: all written at the end of the dispatch.
+    assert aggregates["charm-cluster-ready"]["mean-relation-writes"] == 0
+    assert aggregates["charm-pre-commit"]["mean-relation-writes"] == 4
+    assert aggregates["dispatch"]["mean-relation-writes"] == 4
+
+
+def test_rolling_window(harness: Harness):
+    for _ in range(instrumentation.WINDOW + 10):
+        harness.charm.on.config_changed.emit()
+    assert harness.charm.instrumentation.aggregates["charm-config-changed"]["calls"] == (
+        instrumentation.WINDOW
+    )
+
+
+def test_profile_hooks(mocker: MockerFixture, tmp_path, harness: Harness):
+    mocker.patch("instrumentation.MAX_PROFILES", 1)
+    (tmp_path / "0-config-changed.prof").write_bytes(b"")
+    harness.add_relation("cluster", "davigar15-mongo-express")
+    harness.charm.on.config_changed.emit()
+    harness.framework.commit()
+    profiles = list(tmp_path.iterdir())
+    assert len(profiles) == 1
+    assert profiles[0].name.endswith("-unknown.prof")
+    assert profiles[0].stat().st_size > 0
+
+
+@pytest.mark.parametrize("charm_config", [{}])
+def test_measured_without_profile_hooks(tmp_path, harness: Harness):
+    harness.add_relation("cluster", "davigar15-mongo-express")
+    harness.charm.on.mongo_express_pebble_ready.emit("mongo-express")
+    harness.framework.commit()
+    aggregates = harness.charm.instrumentation.aggregates
+    assert aggregates["charm-pre-commit"]["mean-pebble-calls"] > 0
+    assert aggregates["dispatch"]["calls"] == 1
+    # Only the dispatch profile needs the option.
+    assert harness.charm.instrumentation._profiler is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_close(harness: Harness):
+    assert sys.getprofile() is harness.charm.instrumentation._profiler
+    harness.charm.instrumentation.close()
+    assert sys.getprofile() is None
+    # Closing twice, e.g. once committed, is harmless.
+    harness.charm.instrumentation.close()
+
+
+@pytest.mark.usefixtures("dispatch")
+def test_startup(harness: Harness):
+    stats = harness.charm.instrumentation.aggregates["startup-config-changed"]
+    assert stats["calls"] == 1
+    assert stats["mean-ms"] > 0
+    assert stats["mean-pebble-calls"] == 0
@@ -0,0 +1,268 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import copy
+import http.server
+import json
+import threading
+
+import pytest
+from ops.model import ActiveStatus, BlockedStatus
+from ops.testing import Harness
+from pytest_mock import MockerFixture
+
+import k8s
+
+NAMESPACE = "mongo"
+PATH = f"/apis/apps/v1/namespaces/{NAMESPACE}/statefulsets/davigar15-mongo-express"
+STATEFULSET = {
+    "spec": {
+        "template": {
+            "spec": {
+                "containers": [
+                    {"name": "charm", "resources": {}},
+                    {"name": "mongo-express", "resources": {"requests": {"cpu": "250m"}}},
+                    {"name": "proxy"},
+                ]
+            }
+        }
+    }
+}
+
+
+class FakeAPIServer(http.server.ThreadingHTTPServer):
+    """Kubernetes API stand-in serving one StatefulSet, with strategic merge patches."""
+
+    def __init__(self):
+        self.statefulset = copy.deepcopy(STATEFULSET)
+        self.requests = []
+        self.status = None
+        super().__init__(("127.0.0.1", 0), self._handler())
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def patch(self, body: dict):
+        for patch in body["spec"]["template"]["spec"]["containers"]:
+            containers = self.statefulset["spec"]["template"]["spec"]["containers"]
+            container = next(item for item in containers if item["name"] == patch["name"])
+            resources = container.setdefault("resources", {})
+            for section, values in patch["resources"].items():
+                for name, value in values.items():
+                    if value is None:
+                        resources.get(section, {}).pop(name, None)
+                    else:
+                        resources.setdefault(section, {})[name] = value
+
+    def _handler(self):
+        api = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa: N802
+                self._serve(None)
+
+            def do_PATCH(self):  # noqa: N802
+                self._serve(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+
+            def _serve(self, body):
+                api.requests.append((self.command, self.path, dict(self.headers), body))
+                if api.status:
+                    self._reply(api.status, {"message": "statefulsets is forbidden"})
+                elif self.path != PATH:
+                    self._reply(404, {"message": "not found"})
+                else:
+                    if body is not None:
+                        api.patch(body)
+                    self._reply(200, api.statefulset)
+
+            def _reply(self, status: int, body: dict):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def api():
+    server = FakeAPIServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(api: FakeAPIServer) -> k8s.Client:
+    return k8s.Client(api.url, "token", NAMESPACE)
+
+
+@pytest.fixture
+def leader() -> bool:
+    return True
+
+
+@pytest.fixture
+def harness(mocker: MockerFixture, client: k8s.Client, harness: Harness) -> Harness:
+    mocker.patch("k8s.Client.in_cluster", return_value=client)
+    return harness
+
+
+def _resources(api: FakeAPIServer) -> dict:
+    return api.statefulset["spec"]["template"]["spec"]["containers"][1]["resources"]
+
+
+@pytest.mark.parametrize(
+    "value,millicores", [("1", 1000), ("0.5", 500), ("250m", 250), (" 2 ", 2000), ("1.5m", 1.5)]
+)
+def test_parse_cpu(value: str, millicores: float):
+    assert k8s.parse_cpu(value) == millicores
+
+
+@pytest.mark.parametrize(
+    "value,size",
+    [("1024", 1024), ("1k", 1000), ("512Mi", 512 << 20), ("1.5Gi", 3 << 29), ("2G", 2e9)],
+)
+def test_parse_memory(value: str, size: float):
+    assert k8s.parse_memory(value) == size
+
+
+@pytest.mark.parametrize("value", ["", "m", "1 cpu", "-1", "1M"])
+def test_parse_cpu_invalid(value: str):
+    assert k8s.parse_cpu(value) is None
+
+
+@pytest.mark.parametrize("value", ["", "Mi", "1mi", "1MB", "-1Gi"])
+def test_parse_memory_invalid(value: str):
+    assert k8s.parse_memory(value) is None
+
+
+def test_patch_container_resources(api: FakeAPIServer, client: k8s.Client):
+    resources = {"limits": {"cpu": "2", "memory": "1Gi"}, "requests": {"memory": "256Mi"}}
+    assert client.patch_container_resources("davigar15-mongo-express", "mongo-express", resources)
+    assert _resources(api) == resources
+    method, path, headers, body = api.requests[-1]
+    assert (method, path) == ("PATCH", PATH)
+    assert headers["Authorization"] == "Bearer token"
+    assert headers["Content-Type"] == "application/strategic-merge-patch+json"
+    assert body["spec"]["template"]["spec"]["containers"] == [
+        {
+            "name": "mongo-express",
+            "resources": {
+                "limits": {"cpu": "2", "memory": "1Gi"},
+                "requests": {"cpu": None, "memory": "256Mi"},
+            },
+        }
+    ]
+
+
+def test_patch_container_resources_idempotent(api: FakeAPIServer, client: k8s.Client):
+    # Kubernetes stores "0.25" as "250m": equal quantities are not patched again.
+    resources = {"limits": {}, "requests": {"cpu": "0.25"}}
+    assert not client.patch_container_resources(
+        "davigar15-mongo-express", "mongo-express", resources
+    )
+    assert [request[0] for request in api.requests] == ["GET"]
+
+
+def test_patch_unknown_container(client: k8s.Client):
+    with pytest.raises(k8s.K8sError, match="container unknown not found"):
+        client.patch_container_resources(
+            "davigar15-mongo-express", "unknown", {"limits": {}, "requests": {}}
+        )
+
+
+def test_api_error(api: FakeAPIServer, client: k8s.Client):
+    api.status = 403
+    with pytest.raises(k8s.K8sError, match="403 statefulsets is forbidden"):
+        client.get_statefulset("davigar15-mongo-express")
+
+
+def test_resources_applied_once(api: FakeAPIServer, harness: Harness):
+    harness.update_config({"cpu-limit": "2", "memory-limit": "1Gi"})
+    harness.framework.commit()
+    assert _resources(api) == {"limits": {"cpu": "2", "memory": "1Gi"}, "requests": {}}
+    assert [request[0] for request in api.requests] == ["GET", "PATCH"]
+    harness.update_config({"read-only": True})
+    harness.framework.commit()
+    assert [request[0] for request in api.requests] == ["GET", "PATCH", "GET"]
+
+
+def test_resources_restored(api: FakeAPIServer, harness: Harness):
+    harness.update_config({"cpu-limit": "2"})
+    harness.framework.commit()
+    # Edited out of band: the next reconcile patches the resources back.
+    api.statefulset = copy.deepcopy(STATEFULSET)
+    harness.update_config({"read-only": True})
+    harness.framework.commit()
+    assert _resources(api) == {"limits": {"cpu": "2"}, "requests": {}}
+
+
+def test_resources_unset(api: FakeAPIServer, harness: Harness):
+    harness.update_config({"cpu-request": "500m"})
+    harness.framework.commit()
+    assert _resources(api) == {"requests": {"cpu": "500m"}}
+    harness.update_config({"cpu-request": ""})
+    harness.framework.commit()
+    assert _resources(api) == {"requests": {}}
+
+
+def test_resources_not_managed_by_default(api: FakeAPIServer, harness: Harness):
+    harness.charm.on.mongo_express_pebble_ready.emit("mongo-express")
+    harness.framework.commit()
+    assert api.requests == []
+    assert isinstance(harness.charm.unit.status, ActiveStatus)
+
+
+def test_resources_applied_by_the_leader_only(api: FakeAPIServer, harness: Harness):
+    harness.set_leader(False)
+    harness.update_config({"cpu-limit": "2"})
+    harness.framework.commit()
+    assert api.requests == []
+
+
+@pytest.mark.parametrize(
+    "config,message",
+    [
+        (
+            {"cpu-limit": "2 cpus"},
+            "cpu-limit: must be a number of CPUs, or of millicores followed by m.",
+        ),
+        (
+            {"memory-request": "1GB"},
+            "memory-request: must be a number of bytes, optionally followed by k, M, G, T, Ki, "
+            "Mi, Gi or Ti.",
+        ),
+        ({"cpu-request": "2", "cpu-limit": "1500m"}, "cpu-request: must not exceed cpu-limit."),
+        (
+            {"memory-request": "2Gi", "memory-limit": "1G"},
+            "memory-request: must not exceed memory-limit.",
+        ),
+    ],
+)
+def test_invalid_resources(api: FakeAPIServer, harness: Harness, config: dict, message: str):
+    harness.update_config(config)
+    harness.framework.commit()
+    assert harness.charm.unit.status == BlockedStatus(message)
+    assert api.requests == []
+
+
+def test_resources_forbidden(api: FakeAPIServer, harness: Harness):
+    api.status = 403
+    harness.update_config({"cpu-limit": "2"})
+    harness.framework.commit()
+    assert harness.charm.unit.status == BlockedStatus(
+        "cannot patch the pod resources, see juju trust"
+    )
+    # Retried on the next hook.
+    api.status = None
+    harness.charm.on.config_changed.emit()
+    harness.framework.commit()
+    assert _resources(api)["limits"] == {"cpu": "2"}
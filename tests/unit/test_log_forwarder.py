@@ -0,0 +1,270 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import gzip
+import http.server
+import json
+import os
+import queue
+import shutil
+import socketserver
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+FORWARDER = Path(__file__).parents[2] / "files" / "log-forwarder.js"
+LABELS = {"juju_application": "davigar15-mongo-express", "juju_unit": "davigar15-mongo-express/0"}
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+
+
+class FakePebble(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Pebble API stand-in, streaming the log lines given to `emit` to the followers."""
+
+    daemon_threads = True
+
+    def __init__(self, path: str):
+        self.paths = []
+        self.followers = []
+        self.count = 0
+        super().__init__(path, self._handler())
+
+    def emit(self, count: int, service: str = "mongo-express"):
+        """Send count log lines to every follower at once, as a burst."""
+        lines = []
+        for _ in range(count):
+            self.count += 1
+            lines.append(
+                json.dumps(
+                    {
+                        "time": f"2021-11-08T09:48:15.{self.count:09d}Z",
+                        "service": service,
+                        "message": f"GET /db/admin/ {self.count}\n",
+                    }
+                )
+            )
+        for follower in self.followers:
+            follower.put("".join(f"{line}\n" for line in lines).encode())
+
+    def _handler(self):
+        pebble = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa: N802
+                pebble.paths.append(self.path)
+                lines = queue.Queue()
+                pebble.followers.append(lines)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                while True:
+                    chunk = lines.get()
+                    if chunk is None:
+                        return
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+
+            def address_string(self):
+                return "pebble"
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def close_followers(self):
+        for follower in self.followers:
+            follower.put(None)
+        self.followers = []
+
+
+class FakeLoki(http.server.ThreadingHTTPServer):
+    """Loki push API stand-in, recording the batches; it can fail or hold them."""
+
+    def __init__(self):
+        self.batches = []
+        self.failures = 0
+        self.gate = threading.Event()
+        self.gate.set()
+        super().__init__(("127.0.0.1", 0), self._handler())
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/loki/api/v1/push"
+
+    @property
+    def lines(self) -> list:
+        return [
+            value[1]
+            for _, _, body in self.batches
+            for stream in body["streams"]
+            for value in stream["values"]
+        ]
+
+    def _handler(self):
+        loki = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):  # noqa: N802
+                data = self.rfile.read(int(self.headers["Content-Length"]))
+                loki.gate.wait()
+                if loki.failures:
+                    loki.failures -= 1
+                    self.send_response(500)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = json.loads(gzip.decompress(data))
+                loki.batches.append((time.monotonic(), dict(self.headers), body))
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _wait(predicate, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def pebble(tmp_path):
+    server = FakePebble(str(tmp_path / "pebble.socket"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.close_followers()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def loki():
+    server = FakeLoki()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.gate.set()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def forwarder(tmp_path, pebble: FakePebble, loki: FakeLoki):
+    processes = []
+    stats_path = tmp_path / "stats.json"
+
+    def start(batch_size: int = 100, flush_interval_ms: int = 300, buffer_size: int = 1000):
+        process = subprocess.Popen(
+            ["node", str(FORWARDER)],
+            env=dict(
+                os.environ,
+                LOG_LOKI_URLS=json.dumps([loki.url]),
+                LOG_SERVICES="mongo-express,mongo-express-1",
+                LOG_LABELS=json.dumps(LABELS),
+                LOG_BATCH_SIZE=str(batch_size),
+                LOG_FLUSH_INTERVAL_MS=str(flush_interval_ms),
+                LOG_BUFFER_SIZE=str(buffer_size),
+                LOG_STATS_PATH=str(stats_path),
+                LOG_PEBBLE_SOCKET=str(tmp_path / "pebble.socket"),
+            ),
+        )
+        processes.append(process)
+        _wait(lambda: pebble.followers)
+        return lambda: json.loads(stats_path.read_text())
+
+    yield start
+    for process in processes:
+        process.terminate()
+        process.wait()
+
+
+def test_follows_the_services(pebble: FakePebble, forwarder):
+    forwarder()
+    assert pebble.paths == ["/v1/logs?follow=true&n=-1&services=mongo-express%2Cmongo-express-1"]
+
+
+def test_burst_sent_in_batches(pebble: FakePebble, loki: FakeLoki, forwarder):
+    stats = forwarder(batch_size=100, flush_interval_ms=300)
+    pebble.emit(1050)
+    _wait(lambda: len(loki.lines) == 1050)
+    sizes = [len(body["streams"][0]["values"]) for _, _, body in loki.batches]
+    assert max(sizes) == 100
+    assert sizes.count(100) == 10
+    assert loki.lines == [f"GET /db/admin/ {number}" for number in range(1, 1051)]
+    _, headers, body = loki.batches[0]
+    assert headers["Content-Encoding"] == "gzip"
+    assert body["streams"][0]["stream"] == dict(LABELS, service="mongo-express")
+    assert body["streams"][0]["values"][0] == ["1636364895000000001", "GET /db/admin/ 1"]
+    _wait(lambda: stats()["batches"] == len(loki.batches))
+    assert stats()["sent"] == 1050
+    assert stats()["dropped"] == 0
+
+
+def test_lines_grouped_by_service(pebble: FakePebble, loki: FakeLoki, forwarder):
+    forwarder()
+    pebble.emit(2)
+    pebble.emit(3, service="mongo-express-1")
+    _wait(lambda: len(loki.lines) == 5)
+    streams = {
+        stream["stream"]["service"]: len(stream["values"])
+        for _, _, body in loki.batches
+        for stream in body["streams"]
+    }
+    assert streams == {"mongo-express": 2, "mongo-express-1": 3}
+
+
+def test_partial_batch_flushed_after_interval(pebble: FakePebble, loki: FakeLoki, forwarder):
+    forwarder(batch_size=100, flush_interval_ms=500)
+    start = time.monotonic()
+    pebble.emit(3)
+    _wait(lambda: loki.batches)
+    assert 0.4 <= loki.batches[0][0] - start < 2
+    assert len(loki.lines) == 3
+
+
+def test_burst_bounded_while_loki_is_slow(pebble: FakePebble, loki: FakeLoki, forwarder):
+    stats = forwarder(batch_size=100, flush_interval_ms=100, buffer_size=500)
+    loki.gate.clear()
+    pebble.emit(100)
+    # The first batch is held by Loki, the burst that follows overflows the buffer.
+    time.sleep(0.3)
+    pebble.emit(2000)
+    time.sleep(0.3)
+    loki.gate.set()
+    _wait(lambda: stats()["sent"] + stats()["dropped"] == 2100)
+    assert stats()["dropped"] == 1500
+    assert stats()["buffered"] == 0
+    assert len(loki.lines) == 600
+    # The oldest lines are dropped.
+    assert loki.lines[-1] == "GET /db/admin/ 2100"
+    assert loki.lines[100] == "GET /db/admin/ 1601"
+
+
+def test_failed_batch_retried(pebble: FakePebble, loki: FakeLoki, forwarder):
+    stats = forwarder(batch_size=10, flush_interval_ms=100)
+    loki.failures = 2
+    pebble.emit(10)
+    _wait(lambda: len(loki.lines) == 10)
+    assert loki.lines == [f"GET /db/admin/ {number}" for number in range(1, 11)]
+    _wait(lambda: stats()["sent"] == 10)
+    assert stats()["failures"] == 2
+
+
+def test_follows_again_without_duplicates(pebble: FakePebble, loki: FakeLoki, forwarder):
+    forwarder()
+    pebble.emit(5)
+    _wait(lambda: len(loki.lines) == 5)
+    pebble.close_followers()
+    _wait(lambda: pebble.followers)
+    # Pebble replays the lines it still buffers.
+    pebble.count = 0
+    pebble.emit(8)
+    _wait(lambda: len(loki.lines) == 8)
+    assert loki.lines == [f"GET /db/admin/ {number}" for number in range(1, 9)]
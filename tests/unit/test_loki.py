@@ -0,0 +1,83 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+
+import pytest
+from ops.model import BlockedStatus
+from ops.testing import Harness
+from pytest_mock import MockerFixture
+
+import loki
+
+PUSH_URL = "http://loki-k8s-0.loki-k8s-endpoints:3100/loki/api/v1/push"
+
+
+@pytest.fixture(autouse=True)
+def http_ready(mocker: MockerFixture):
+    mocker.patch("charm.is_http_ready", return_value=True)
+
+
+def _relate(harness: Harness, endpoint: str = json.dumps({"url": PUSH_URL})) -> int:
+    relation_id = harness.add_relation("logging", "loki-k8s")
+    harness.add_relation_unit(relation_id, "loki-k8s/0")
+    harness.update_relation_data(relation_id, "loki-k8s/0", {"endpoint": endpoint})
+    harness.framework.commit()
+    return relation_id
+
+
+def test_endpoints(harness: Harness):
+    relation_id = _relate(harness)
+    harness.add_relation_unit(relation_id, "loki-k8s/1")
+    harness.update_relation_data(relation_id, "loki-k8s/1", {"endpoint": "not json"})
+    assert harness.charm.logging.endpoints == [PUSH_URL]
+
+
+def test_forwarder_layer(harness: Harness):
+    assert loki.LOG_FORWARDER_SERVICE not in harness.charm._get_pebble_layer()["services"]
+    harness.update_config({"workers": "2", "log-batch-size": 100})
+    _relate(harness)
+    forwarder = harness.charm._get_pebble_layer()["services"][loki.LOG_FORWARDER_SERVICE]
+    assert forwarder["command"] == "node /srv/mongo-express-charm/log-forwarder.js"
+    environment = forwarder["environment"]
+    assert json.loads(environment["LOG_LOKI_URLS"]) == [PUSH_URL]
+    assert environment["LOG_SERVICES"] == (
+        "mongo-express-0,mongo-express-1,mongo-express-balancer"
+    )
+    assert json.loads(environment["LOG_LABELS"])["juju_unit"] == "davigar15-mongo-express/0"
+    assert environment["LOG_BATCH_SIZE"] == 100
+    assert environment["LOG_FLUSH_INTERVAL_MS"] == 1000
+    assert environment["LOG_BUFFER_SIZE"] == 10000
+
+
+def test_exporter_serves_the_forwarder_counters(harness: Harness):
+    metrics_id = harness.add_relation("metrics-endpoint", "prometheus-k8s")
+    harness.add_relation_unit(metrics_id, "prometheus-k8s/0")
+    exporter = harness.charm._get_pebble_layer()["services"]["mongo-express-exporter"]
+    assert "LOG_STATS_PATH" not in exporter["environment"]
+    _relate(harness)
+    exporter = harness.charm._get_pebble_layer()["services"]["mongo-express-exporter"]
+    assert exporter["environment"]["LOG_STATS_PATH"] == loki.LOG_STATS_PATH
+
+
+def test_relation_starts_and_stops_the_forwarder(mocker: MockerFixture, harness: Harness):
+    harness.charm.on.mongo_express_pebble_ready.emit("mongo-express")
+    harness.framework.commit()
+    restart_spy = mocker.spy(harness.charm.container, "restart")
+    relation_id = _relate(harness)
+    container = harness.charm.container
+    assert container.get_service(loki.LOG_FORWARDER_SERVICE).is_running()
+    assert container.pull(loki.LOG_FORWARDER_PATH).read().startswith("// Copyright")
+    # mongo-express itself keeps running.
+    restart_spy.assert_not_called()
+    harness.remove_relation(relation_id)
+    harness.framework.commit()
+    assert not container.get_service(loki.LOG_FORWARDER_SERVICE).is_running()
+
+
+def test_invalid_batch_size(harness: Harness):
+    harness.update_config({"log-batch-size": 20000})
+    harness.framework.commit()
+    assert harness.charm.unit.status == BlockedStatus(
+        "log-batch-size: must not exceed log-buffer-size."
+    )
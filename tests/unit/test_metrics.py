@@ -0,0 +1,166 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+
+import pytest
+from ops.testing import Harness
+from pytest_mock import MockerFixture
+
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def fqdn(mocker: MockerFixture):
+    mocker.patch("metrics.socket.getfqdn", return_value="mongo-express-0.endpoints")
+
+
+def _relate(harness: Harness) -> int:
+    relation_id = harness.add_relation("metrics-endpoint", "prometheus")
+    harness.add_relation_unit(relation_id, "prometheus/0")
+    harness.framework.commit()
+    return relation_id
+
+
+def test_render_metrics():
+    rendered = metrics.render_metrics(
+        [
+            metrics.Metric("restarts_total", "counter", "Restarts.", [({}, 3)]),
+            metrics.Metric(
+                "duration_seconds",
+                "gauge",
+                "Durations.",
+                [({"stat": "mean", "handler": "a"}, 0.25), ({"handler": "b"}, None)],
+            ),
+        ]
+    )
+    assert rendered == (
+        "# HELP restarts_total Restarts.\n"
+        "# TYPE restarts_total counter\n"
+        "restarts_total 3\n"
+        "# HELP duration_seconds Durations.\n"
+        "# TYPE duration_seconds gauge\n"
+        'duration_seconds{handler="a",stat="mean"} 0.25\n'
+    )
+
+
+def test_leader_publishes_scrape_job(harness: Harness):
+    harness.set_leader(True)
+    relation_id = _relate(harness)
+    app_data = harness.get_relation_data(relation_id, harness.charm.app.name)
+    assert json.loads(app_data["scrape_jobs"]) == [
+        {"metrics_path": "/metrics", "static_configs": [{"targets": ["*:9114"]}]}
+    ]
+    assert json.loads(app_data["scrape_metadata"])["application"] == "davigar15-mongo-express"
+    unit_data = harness.get_relation_data(relation_id, harness.charm.unit.name)
+    assert unit_data == {
+        "prometheus_scrape_unit_address": "mongo-express-0.endpoints",
+        "prometheus_scrape_unit_name": "davigar15-mongo-express/0",
+    }
+
+
+def test_non_leader_publishes_its_address_only(harness: Harness):
+    relation_id = _relate(harness)
+    assert harness.get_relation_data(relation_id, harness.charm.app.name) == {}
+    unit_data = harness.get_relation_data(relation_id, harness.charm.unit.name)
+    assert unit_data["prometheus_scrape_unit_address"] == "mongo-express-0.endpoints"
+
+
+def test_exporter_layer(harness: Harness):
+    assert metrics.EXPORTER_SERVICE not in harness.charm._get_pebble_layer()["services"]
+    _relate(harness)
+    services = harness.charm._get_pebble_layer()["services"]
+    exporter = services[metrics.EXPORTER_SERVICE]
+    assert exporter["command"] == "node /srv/mongo-express-charm/exporter.js"
+    assert exporter["environment"]["METRICS_PORT"] == 9114
+    environment = services["mongo-express"]["environment"]
+    assert environment["NODE_OPTIONS"] == (
+        "--require=/srv/mongo-express-charm/drain-hook.js "
+        "--require=/srv/mongo-express-charm/metrics-hook.js"
+    )
+    assert environment["METRICS_DIR"] == metrics.METRICS_DIR
+
+
+def test_exporter_layer_with_workers(mocker: MockerFixture, harness: Harness):
+    mocker.patch("charm.is_http_ready", return_value=True)
+    harness.update_config({"workers": "2"})
+    _relate(harness)
+    services = harness.charm._get_pebble_layer()["services"]
+    for name in ("mongo-express-0", "mongo-express-1"):
+        assert "--require=" in services[name]["environment"]["NODE_OPTIONS"]
+    assert "NODE_OPTIONS" not in services["mongo-express-balancer"].get("environment", {})
+
+
+def test_relation_starts_and_stops_the_exporter(harness: Harness):
+    harness.charm.on.mongo_express_pebble_ready.emit("mongo-express")
+    harness.framework.commit()
+    relation_id = _relate(harness)
+    container = harness.charm.container
+    assert container.get_service(metrics.EXPORTER_SERVICE).is_running()
+    assert container.pull(metrics.EXPORTER_PATH).read().startswith("// Copyright")
+    assert container.pull(metrics.METRICS_HOOK_PATH).read().startswith("// Copyright")
+    harness.remove_relation(relation_id)
+    harness.framework.commit()
+    assert not container.get_service(metrics.EXPORTER_SERVICE).is_running()
+
+
+def test_update_status_pushes_charm_metrics(mocker: MockerFixture, harness: Harness):
+    mocker.patch("charm.timed", return_value=42.0)
+    harness.charm.on.mongo_express_pebble_ready.emit("mongo-express")
+    harness.framework.commit()
+    _relate(harness)
+    harness.charm.on.update_status.emit()
+    harness.framework.commit()
+    rendered = harness.charm.container.pull(metrics.CHARM_METRICS_PATH).read()
+    assert "mongo_express_charm_restarts_total 2\n" in rendered
+    assert 'mongo_express_charm_last_restart_seconds{phase="ready"}' in rendered
+    assert "mongo_express_charm_handler_duration_seconds{" in rendered
+    assert "mongo_express_charm_deferred_events 0\n" in rendered
+    assert 'mongo_express_charm_events_total{outcome="dropped"} 0\n' in rendered
+    assert "mongo_express_charm_workers 1\n" in rendered
+    assert "mongo_express_charm_mongodb_members 1\n" in rendered
+    assert 'mongo_express_charm_probe_p95_seconds{target="http"} 0.042\n' in rendered
+
+
+def test_charm_metrics_pushed_when_changed(mocker: MockerFixture, harness: Harness):
+    harness.charm.on.mongo_express_pebble_ready.emit("mongo-express")
+    harness.framework.commit()
+    _relate(harness)
+    container = harness.charm.container
+    rendered = container.pull(metrics.CHARM_METRICS_PATH).read()
+    assert "mongo_express_charm_restarts_total 2\n" in rendered
+    push = mocker.spy(container, "push")
+    harness.charm.on.leader_elected.emit()
+    harness.framework.commit()
+    push.assert_not_called()
+    harness.update_config({"read-only": True})
+    harness.framework.commit()
+    rendered = container.pull(metrics.CHARM_METRICS_PATH).read()
+    assert "mongo_express_charm_restarts_total 3\n" in rendered
+
+
+def test_charm_metrics_handler_durations(harness: Harness):
+    harness.add_relation("cluster", "davigar15-mongo-express")
+    harness.charm.on.config_changed.emit()
+    harness.framework.commit()
+    # Refreshed on update-status only, so that every hook does not push the metrics.
+    rendered = metrics.render_metrics(harness.charm._charm_metrics())
+    assert "mongo_express_charm_handler_duration_seconds{" not in rendered
+    harness.charm.on.update_status.emit()
+    rendered = metrics.render_metrics(harness.charm._charm_metrics())
+    assert (
+        'mongo_express_charm_handler_duration_seconds{handler="charm-config-changed",stat="max"}'
+        in rendered
+    )
+    assert (
+        'mongo_express_charm_handler_duration_seconds{handler="dispatch",stat="mean"}' in rendered
+    )
+
+
+def test_update_status_without_relation_pushes_nothing(mocker: MockerFixture, harness: Harness):
+    mocker.patch("charm.timed", return_value=42.0)
+    harness.charm.on.mongo_express_pebble_ready.emit("mongo-express")
+    harness.framework.commit()
+    push = mocker.spy(harness.charm.container, "push")
+    harness.charm.on.update_status.emit()
+    push.assert_not_called()
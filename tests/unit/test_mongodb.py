@@ -0,0 +1,88 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+from ops.testing import Harness
+from pytest_mock import MockerFixture
+
+from mongodb import build_connection_url
+
+
+def _environment(harness: Harness) -> dict:
+    return harness.charm._get_pebble_layer()["services"]["mongo-express"]["environment"]
+
+
+def test_build_connection_url():
+    url = build_connection_url(
+        ["mongodb-0:27017", "mongodb-1:27017"],
+        "rs0",
+        {"readPreference": "secondaryPreferred", "maxPoolSize": 20, "compressors": "zstd,zlib"},
+    )
+    assert url == (
+        "mongodb://mongodb-0:27017,mongodb-1:27017/"
+        "?replicaSet=rs0&readPreference=secondaryPreferred&maxPoolSize=20&compressors=zstd,zlib"
+    )
+
+
+def test_build_connection_url_skips_unset_options():
+    url = build_connection_url(["mongodb-0:27017"], None, {"maxPoolSize": 0, "compressors": ""})
+    assert url == "mongodb://mongodb-0:27017/"
+
+
+def test_no_relation_keeps_server_configuration(harness: Harness):
+    environment = _environment(harness)
+    assert "ME_CONFIG_MONGODB_URL" not in environment
+    assert environment["ME_CONFIG_MONGODB_SERVER"] == "mongodb-k8s-0.mongodb-k8s-endpoints"
+
+
+def test_relation_members_join_and_leave(harness: Harness):
+    harness.update_config({"mongodb-read-preference": "secondaryPreferred"})
+    rel_id = harness.add_relation("mongodb", "mongodb-k8s")
+    harness.update_relation_data(rel_id, "mongodb-k8s", {"replica_set_name": "rs0"})
+    for number in range(3):
+        unit = f"mongodb-k8s/{number}"
+        harness.add_relation_unit(rel_id, unit)
+        harness.update_relation_data(rel_id, unit, {"hostname": f"mongodb-{number}"})
+    environment = _environment(harness)
+    assert environment["ME_CONFIG_MONGODB_URL"] == (
+        "mongodb://mongodb-0:27017,mongodb-1:27017,mongodb-2:27017/"
+        "?replicaSet=rs0&readPreference=secondaryPreferred"
+    )
+    # mongo-express would connect to the server instead.
+    assert "ME_CONFIG_MONGODB_SERVER" not in environment
+    assert "ME_CONFIG_MONGODB_PORT" not in environment
+    harness.remove_relation_unit(rel_id, "mongodb-k8s/1")
+    assert _environment(harness)["ME_CONFIG_MONGODB_URL"] == (
+        "mongodb://mongodb-0:27017,mongodb-2:27017/"
+        "?replicaSet=rs0&readPreference=secondaryPreferred"
+    )
+
+
+def test_relation_replica_set_uri_fallback(harness: Harness):
+    rel_id = harness.add_relation("mongodb", "mongodb-k8s")
+    harness.add_relation_unit(rel_id, "mongodb-k8s/0")
+    harness.update_relation_data(
+        rel_id,
+        "mongodb-k8s",
+        {
+            "replica_set_uri": "mongodb://mongodb-k8s-0.endpoints:27017,mongodb-k8s-1.endpoints:27017/"
+        },
+    )
+    assert _environment(harness)["ME_CONFIG_MONGODB_URL"] == (
+        "mongodb://mongodb-k8s-0.endpoints:27017,mongodb-k8s-1.endpoints:27017/"
+        "?readPreference=primary"
+    )
+
+
+def test_member_change_replans_only_once(mocker: MockerFixture, harness: Harness):
+    harness.charm.on.mongo_express_pebble_ready.emit("mongo-express")
+    harness.framework.commit()
+    replan_spy = mocker.spy(harness.charm.container, "replan")
+    rel_id = harness.add_relation("mongodb", "mongodb-k8s")
+    harness.add_relation_unit(rel_id, "mongodb-k8s/0")
+    harness.update_relation_data(rel_id, "mongodb-k8s/0", {"hostname": "mongodb-0"})
+    harness.update_relation_data(rel_id, "mongodb-k8s", {"replica_set_name": "rs0"})
+    harness.framework.commit()
+    assert replan_spy.call_count == 1
+    harness.update_relation_data(rel_id, "mongodb-k8s/0", {"other": "value"})
+    harness.framework.commit()
+    assert replan_spy.call_count == 1
@@ -0,0 +1,75 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+import os
+import shutil
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+
+HOOK = Path(__file__).parents[2] / "files" / "profile-hook.js"
+# Stands for mongo-express: busy, and serving until stopped.
+WORKER = "setInterval(() => { for (let i = 0; i < 1e5; i++) Math.sqrt(i); }, 10);"
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+
+
+@pytest.fixture
+def worker(tmp_path):
+    processes = []
+
+    def start(cpu: bool = True, heap: bool = True) -> subprocess.Popen:
+        process = subprocess.Popen(
+            ["node", f"--require={HOOK}", "-e", WORKER],
+            env=dict(
+                os.environ,
+                PROFILE_DIR=str(tmp_path / "profiles"),
+                PROFILE_NAME="mongo-express-0",
+                PROFILE_DURATION_MS="300",
+                PROFILE_CPU="true" if cpu else "false",
+                PROFILE_HEAP="true" if heap else "false",
+            ),
+        )
+        processes.append(process)
+        return process
+
+    yield start
+    for process in processes:
+        process.kill()
+        process.wait()
+
+
+def _wait_for_files(directory: Path, count: int, timeout: float = 10) -> list:
+    deadline = time.monotonic() + timeout
+    while True:
+        files = sorted(directory.glob("*profile")) if directory.exists() else []
+        if len(files) >= count:
+            return files
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_profiles_written_while_serving(tmp_path, worker):
+    process = worker()
+    files = _wait_for_files(tmp_path / "profiles", 2)
+    assert [path.name for path in files] == [
+        f"mongo-express-0.{process.pid}.cpuprofile",
+        f"mongo-express-0.{process.pid}.heapprofile",
+    ]
+    assert json.loads(files[0].read_text())["nodes"]
+    assert "head" in json.loads(files[1].read_text())
+    # The process goes on serving.
+    time.sleep(0.2)
+    assert process.poll() is None
+
+
+def test_cpu_profile_only(tmp_path, worker):
+    process = worker(heap=False)
+    _wait_for_files(tmp_path / "profiles", 1)
+    time.sleep(0.2)
+    assert [path.name for path in (tmp_path / "profiles").iterdir()] == [
+        f"mongo-express-0.{process.pid}.cpuprofile"
+    ]
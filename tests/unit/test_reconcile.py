@@ -0,0 +1,92 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import reconcile
+
+SERVICES = {
+    "mongo-express": {
+        "override": "replace",
+        "summary": "mongo-express service",
+        "command": "tini -s -- /docker-entrypoint.sh",
+        "startup": "enabled",
+        "environment": {"ME_CONFIG_MONGODB_PORT": 27017, "ME_CONFIG_OPTIONS_READONLY": False},
+    }
+}
+LIVE = {
+    "mongo-express": {
+        "override": "replace",
+        "summary": "mongo-express service",
+        "command": "tini -s -- /docker-entrypoint.sh",
+        "startup": "enabled",
+        "environment": {"ME_CONFIG_MONGODB_PORT": "27017", "ME_CONFIG_OPTIONS_READONLY": "false"},
+    }
+}
+
+
+def test_fingerprint_is_canonical():
+    assert reconcile.fingerprint(SERVICES) == reconcile.fingerprint(LIVE)
+
+
+def test_fingerprint_ignores_cosmetic_fields():
+    services = {"mongo-express": dict(SERVICES["mongo-express"], summary="other")}
+    assert reconcile.fingerprint(services) == reconcile.fingerprint(SERVICES)
+
+
+def test_decide_noop():
+    fingerprint = reconcile.fingerprint(SERVICES)
+    decision = reconcile.decide(SERVICES, LIVE, fingerprint, running=True)
+    assert decision.action == reconcile.NOOP
+    assert decision.changed == {}
+
+
+def test_decide_replan_on_empty_plan():
+    decision = reconcile.decide(SERVICES, {}, None, running=False)
+    assert decision.action == reconcile.REPLAN
+
+
+def test_decide_replan_on_environment_change():
+    fingerprint = reconcile.fingerprint(SERVICES)
+    live = {"mongo-express": dict(LIVE["mongo-express"], environment={})}
+    decision = reconcile.decide(SERVICES, live, fingerprint, running=True)
+    assert decision.action == reconcile.REPLAN
+    assert decision.changed == {"mongo-express": {"environment"}}
+
+
+def test_decide_cosmetic_change_does_not_restart():
+    fingerprint = reconcile.fingerprint(SERVICES)
+    live = {"mongo-express": dict(LIVE["mongo-express"], summary="old summary")}
+    decision = reconcile.decide(SERVICES, live, fingerprint, running=True)
+    assert decision.action == reconcile.NOOP
+    assert decision.changed == {"mongo-express": {"summary"}}
+
+
+def test_decide_restart_when_plan_current_but_not_applied():
+    decision = reconcile.decide(SERVICES, LIVE, "stale", running=True)
+    assert decision.action == reconcile.RESTART
+
+
+def test_decide_restart_when_not_running():
+    fingerprint = reconcile.fingerprint(SERVICES)
+    decision = reconcile.decide(SERVICES, LIVE, fingerprint, running=False)
+    assert decision.action == reconcile.RESTART
+
+
+def test_changed_checks_with_pebble_defaults():
+    desired = {
+        "ready": {"override": "replace", "level": "ready", "http": {"url": "http://localhost/"}}
+    }
+    live = {
+        "ready": {
+            "level": "ready",
+            "period": "10s",
+            "timeout": "3s",
+            "threshold": 3,
+            "http": {"url": "http://localhost/"},
+        }
+    }
+    assert reconcile.changed_checks(desired, live) == {}
+    live["ready"]["period"] = "30s"
+    assert reconcile.changed_checks(desired, live) == {"ready": {"period"}}
+    assert reconcile.changed_checks(desired, {}) == {
+        "ready": {"level", "period", "timeout", "threshold", "http"}
+    }
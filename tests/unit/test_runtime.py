@@ -0,0 +1,138 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import pytest
+
+import runtime
+from runtime import CgroupLimits
+
+GIB = 1024 * 1024 * 1024
+
+
+def _reader(files: dict):
+    return files.get
+
+
+@pytest.mark.parametrize(
+    "files,expected",
+    [
+        # cgroup v2
+        (
+            {
+                "/sys/fs/cgroup/memory.max": "536870912\n",
+                "/sys/fs/cgroup/cpu.max": "200000 100000\n",
+            },
+            CgroupLimits(memory=512 * 1024 * 1024, cpus=2.0),
+        ),
+        (
+            {"/sys/fs/cgroup/memory.max": "max\n", "/sys/fs/cgroup/cpu.max": "max 100000\n"},
+            CgroupLimits(),
+        ),
+        (
+            {
+                "/sys/fs/cgroup/memory.max": "1073741824\n",
+                "/sys/fs/cgroup/cpu.max": "50000 100000",
+            },
+            CgroupLimits(memory=GIB, cpus=0.5),
+        ),
+        # cgroup v1
+        (
+            {
+                "/sys/fs/cgroup/memory/memory.limit_in_bytes": "2147483648\n",
+                "/sys/fs/cgroup/cpu/cpu.cfs_quota_us": "400000\n",
+                "/sys/fs/cgroup/cpu/cpu.cfs_period_us": "100000\n",
+            },
+            CgroupLimits(memory=2 * GIB, cpus=4.0),
+        ),
+        (
+            {
+                "/sys/fs/cgroup/memory/memory.limit_in_bytes": "9223372036854771712\n",
+                "/sys/fs/cgroup/cpu,cpuacct/cpu.cfs_quota_us": "-1\n",
+                "/sys/fs/cgroup/cpu,cpuacct/cpu.cfs_period_us": "100000\n",
+            },
+            CgroupLimits(),
+        ),
+        # no cgroup files readable
+        ({}, CgroupLimits()),
+    ],
+)
+def test_read_cgroup_limits(files: dict, expected: CgroupLimits):
+    assert runtime.read_cgroup_limits(_reader(files)) == expected
+
+
+@pytest.mark.parametrize(
+    "limits,expected",
+    [
+        (CgroupLimits(), {}),
+        (
+            CgroupLimits(memory=128 * 1024 * 1024, cpus=0.25),
+            {
+                "NODE_OPTIONS": "--max-old-space-size=90",
+                "UV_THREADPOOL_SIZE": "4",
+            },
+        ),
+        (
+            CgroupLimits(memory=GIB, cpus=2.0),
+            {
+                "NODE_OPTIONS": "--max-old-space-size=720",
+                "UV_THREADPOOL_SIZE": "8",
+            },
+        ),
+        (
+            CgroupLimits(memory=16 * GIB, cpus=64.0),
+            {
+                "NODE_OPTIONS": "--max-old-space-size=12096",
+                "UV_THREADPOOL_SIZE": "128",
+            },
+        ),
+    ],
+)
+def test_node_environment(limits: CgroupLimits, expected: dict):
+    assert runtime.node_environment(limits) == expected
+
+
+def test_node_environment_overrides():
+    environment = runtime.node_environment(
+        CgroupLimits(memory=GIB, cpus=2.0),
+        max_old_space_size=300,
+        max_semi_space_size=4,
+        uv_threadpool_size=6,
+    )
+    assert environment == {
+        "NODE_OPTIONS": "--max-old-space-size=300",
+        "UV_THREADPOOL_SIZE": "6",
+    }
+
+
+def test_node_environment_overrides_without_limits():
+    environment = runtime.node_environment(CgroupLimits(), max_old_space_size=256)
+    assert environment == {"NODE_OPTIONS": "--max-old-space-size=256"}
+
+
+@pytest.mark.parametrize(
+    "limits,expected",
+    [
+        (CgroupLimits(), []),
+        (CgroupLimits(memory=128 * 1024 * 1024), ["--max-semi-space-size=2"]),
+        (CgroupLimits(memory=GIB), ["--max-semi-space-size=16"]),
+        (CgroupLimits(memory=16 * GIB), ["--max-semi-space-size=64"]),
+    ],
+)
+def test_node_arguments(limits: CgroupLimits, expected: list):
+    assert runtime.node_arguments(limits) == expected
+
+
+def test_node_arguments_override():
+    assert runtime.node_arguments(CgroupLimits(), max_semi_space_size=4) == [
+        "--max-semi-space-size=4"
+    ]
+
+
+def test_profiling_environment():
+    assert runtime.profiling_environment("/tmp/profiles", "mongo-express-0", 30, heap=False) == {
+        "PROFILE_DIR": "/tmp/profiles",
+        "PROFILE_NAME": "mongo-express-0",
+        "PROFILE_DURATION_MS": "30000",
+        "PROFILE_CPU": "true",
+        "PROFILE_HEAP": "false",
+    }
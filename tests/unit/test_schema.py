@@ -0,0 +1,79 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import pathlib
+
+import pytest
+import yaml
+
+import schema
+
+DEFAULTS = {
+    name: option["default"]
+    for name, option in yaml.safe_load(
+        (pathlib.Path(__file__).parents[2] / "config.yaml").read_text()
+    )["options"].items()
+    if "default" in option
+}
+
+
+def test_defaults_are_valid():
+    assert schema.validate(DEFAULTS) is None
+
+
+def test_every_option_is_declared():
+    assert {option.name for option in schema.SCHEMA} <= DEFAULTS.keys() | {"mongo-url"}
+
+
+def test_required_options_are_checked_first():
+    config = dict(DEFAULTS, **{"editor-theme": "unknown"})
+    del config["enable-gridfs"]
+    assert schema.validate(config) == ("enable-gridfs", "missing configuration.")
+
+
+@pytest.mark.parametrize(
+    "option,value,message",
+    [
+        ("editor-theme", "unknown", "invalid value."),
+        ("max-concurrent-restarts", 0, "must be at least 1."),
+        ("mongodb-read-preference", "", "invalid value."),
+        ("mongodb-max-idle-time-ms", -1, "must not be negative."),
+        ("mongodb-compressors", "zstd,lz4", "invalid value."),
+        ("workers", "0", "must be auto or a number between 1 and 64."),
+        ("workers", "65", "must be auto or a number between 1 and 64."),
+        ("status-error-threshold", 101, "must not exceed 100."),
+        ("request-size", "100 kilobytes", schema.SIZE_MESSAGE),
+        ("gridfs-max-upload-size", "-1mb", schema.SIZE_MESSAGE),
+        ("gridfs-max-upload-size", "1.5gb", schema.SIZE_MESSAGE),
+    ],
+)
+def test_invalid_values(option, value, message):
+    assert schema.validate(dict(DEFAULTS, **{option: value})) == (option, message)
+
+
+@pytest.mark.parametrize(
+    "option,value",
+    [
+        ("editor-theme", "dracula"),
+        ("mongodb-compressors", ""),
+        ("mongodb-compressors", "zstd,snappy"),
+        ("workers", "auto"),
+        ("workers", "64"),
+        ("request-size", "16MB"),
+        ("request-size", "1048576"),
+        ("gridfs-max-upload-size", "0"),
+        ("mongo-url", None),
+    ],
+)
+def test_valid_values(option, value):
+    assert schema.validate(dict(DEFAULTS, **{option: value})) is None
+
+
+def test_at_most():
+    config = dict(DEFAULTS, **{"mongodb-min-pool-size": 20})
+    assert schema.validate(config) is None
+    config["mongodb-max-pool-size"] = 10
+    assert schema.validate(config) == (
+        "mongodb-min-pool-size",
+        "must not exceed mongodb-max-pool-size.",
+    )
@@ -0,0 +1,70 @@
+# Copyright 2021 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import pytest
+from ops.testing import Harness
+from pytest_mock import MockerFixture
+
+APP = "davigar15-mongo-express"
+
+
+@pytest.fixture
+def cluster():
+    """The real peer cluster."""
+
+
+@pytest.fixture
+def leader() -> bool:
+    return True
+
+
+def test_plan_is_fetched_once_until_a_layer_is_added(mocker: MockerFixture, harness: Harness):
+    snapshot = harness.charm.snapshot
+    container = harness.charm.container
+    get_plan = mocker.spy(container, "get_plan")
+    assert snapshot.plan(container).services == {}
+    assert snapshot.plan(container) is snapshot.plan(container)
+    assert get_plan.call_count == 1
+    snapshot.add_layer(container, "test", {"services": {"test": {"override": "replace"}}})
+    assert "test" in snapshot.plan(container).services
+    assert get_plan.call_count == 2
+    snapshot.flush()
+    snapshot.plan(container)
+    assert get_plan.call_count == 3
+
+
+def test_writes_are_batched(harness: Harness):
+    relation_id = harness.add_relation("cluster", APP)
+    harness.update_relation_data(relation_id, APP, {"unchanged": "value"})
+    relation = harness.model.get_relation("cluster")
+    snapshot, app = harness.charm.snapshot, harness.charm.app
+    # Write the secrets generated by the leader when the relation was created.
+    snapshot.flush()
+    writes = snapshot.relation_writes
+    snapshot.set(relation, app, "key", "first")
+    snapshot.set(relation, app, "key", "second")
+    snapshot.set(relation, app, "unchanged", "value")
+    assert snapshot.get(relation, app, "key") == "second"
+    assert "key" not in harness.get_relation_data(relation_id, APP)
+    snapshot.flush()
+    assert snapshot.relation_writes == writes + 1
+    assert harness.get_relation_data(relation_id, APP)["key"] == "second"
+
+
+def test_empty_value_removes_the_key(harness: Harness):
+    relation_id = harness.add_relation("cluster", APP)
+    harness.update_relation_data(relation_id, harness.charm.unit.name, {"key": "value"})
+    relation = harness.model.get_relation("cluster")
+    snapshot, unit = harness.charm.snapshot, harness.charm.unit
+    snapshot.set(relation, unit, "key", None)
+    assert snapshot.get(relation, unit, "key") is None
+    snapshot.flush()
+    assert "key" not in harness.get_relation_data(relation_id, unit.name)
+
+
+def test_flushed_at_the_end_of_the_dispatch(harness: Harness):
+    relation_id = harness.add_relation("cluster", APP)
+    harness.charm.cluster.set_web_password("password")
+    assert "web-password" not in harness.get_relation_data(relation_id, APP)
+    harness.framework.commit()
+    assert harness.get_relation_data(relation_id, APP)["web-password"] == "password"